@@ -8,6 +8,9 @@ from test_loader import LoaderTestCase
 from test_decorator import DecoratorTestCase
 from test_testprogram import DefaultTestProgramTestCase
 from test_util import UtilTestCase
+from test_distributed import CoordinatorTestCase
+from test_daemon import TestDaemonTestCase
+from test_autoscale import CgroupTestCase, AutoscalerTestCase
 import sys
 
 
@@ -16,7 +19,8 @@ if __name__ == '__main__':
     suite = unittest.TestSuite()
     loader = unittest.TestLoader()
     test_classes = [ResultTestCase, SuiteTestCase, RunnerTestCase, ReporterTestCase, LoaderTestCase, DecoratorTestCase,
-                    DefaultTestProgramTestCase, UtilTestCase]
+                    DefaultTestProgramTestCase, UtilTestCase, CoordinatorTestCase,
+                    TestDaemonTestCase, CgroupTestCase, AutoscalerTestCase]
     suite.addTests(list(map(loader.loadTestsFromTestCase, test_classes)))
     # run test suite
     result = unishark.BufferedTestRunner([], verbosity=2).run(suite)
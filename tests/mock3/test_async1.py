@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+from unishark import contexts, out
+
+__context__ = 'tests.mock3'
+mod_resource = 0
+mod_name = __name__.split('.')[-1]
+
+
+async def setUpModule():
+    fixture = '%s.setUpModule' % mod_name
+    contexts.get(__context__).append(fixture)
+    global mod_resource
+    await asyncio.sleep(0.1)
+    mod_resource += 1
+
+
+async def tearDownModule():
+    fixture = '%s.tearDownModule' % mod_name
+    contexts.get(__context__).append(fixture)
+    global mod_resource
+    await asyncio.sleep(0.1)
+    mod_resource -= 1
+
+
+class Class1(unittest.TestCase):
+    cls_resource = 0
+
+    @classmethod
+    async def setUpClass(cls):
+        fixture = '%s.%s.setUpClass' % (mod_name, cls.__name__)
+        contexts.get(__context__).append(fixture)
+        await asyncio.sleep(0.1)
+        cls.cls_resource += 1
+
+    @classmethod
+    async def tearDownClass(cls):
+        fixture = '%s.%s.tearDownClass' % (mod_name, cls.__name__)
+        contexts.get(__context__).append(fixture)
+        await asyncio.sleep(0.1)
+        cls.cls_resource -= 1
+
+    async def setUp(self):
+        fixture = '%s.setUp' % '.'.join(self.id().split('.')[-3:])
+        contexts.get(__context__).append(fixture)
+        self.assertEqual(mod_resource, 1)
+        self.assertEqual(self.__class__.cls_resource, 1)
+
+    async def tearDown(self):
+        fixture = '%s.tearDown' % '.'.join(self.id().split('.')[-3:])
+        contexts.get(__context__).append(fixture)
+        await asyncio.sleep(0.1)
+
+    async def test_case_1(self):
+        out.write(self.id() + ' begins\n')
+        await asyncio.sleep(0.5)
+        out.write(self.id() + ' ends\n')
+
+    async def test_case_2(self):
+        out.write(self.id() + ' begins\n')
+        await asyncio.sleep(0.5)
+        out.write(self.id() + ' ends\n')
+
+    def test_case_3(self):
+        self.assertEqual(self.__class__.cls_resource, 1)
+
+    @unittest.skip('Not ready.')
+    async def test_case_4(self):
+        raise AssertionError
+
+
+class Class2(unittest.TestCase):
+    def tearDown(self):
+        contexts.get(__context__).append('%s.tearDown' % '.'.join(self.id().split('.')[-3:]))
+
+    async def test_case_1(self):
+        self.assertEqual(mod_resource, 1)
+        await asyncio.sleep(0.5)
+
+    async def test_case_2(self):
+        await asyncio.sleep(0.5)
+        self.skipTest('Skipped at runtime.')
@@ -0,0 +1,44 @@
+from time import sleep
+import unittest
+from unishark import contexts
+
+__context__ = 'tests.mock3'
+mod_name = __name__.split('.')[-1]
+
+
+def tearDownModule():
+    contexts.get(__context__).append('%s.tearDownModule' % mod_name)
+
+
+class Class1(unittest.TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        contexts.get(__context__).append('%s.%s.tearDownClass' % (mod_name, cls.__name__))
+
+    def test_case_1(self):
+        sleep(0.1)
+        raise RuntimeError('Let test_case_1 error.')
+
+    def test_case_2(self):
+        sleep(0.1)
+        raise RuntimeError('Let test_case_2 error.')
+
+    def test_case_3(self):
+        sleep(0.1)
+        raise RuntimeError('Let test_case_3 error.')
+
+    def test_case_4(self):
+        sleep(0.1)
+        raise RuntimeError('Let test_case_4 error.')
+
+
+class Class2(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        contexts.get(__context__).append('%s.%s.setUpClass' % (mod_name, cls.__name__))
+
+    def test_case_1(self):
+        sleep(0.1)
+
+    def test_case_2(self):
+        sleep(0.1)
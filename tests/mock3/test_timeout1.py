@@ -0,0 +1,54 @@
+import asyncio
+import os
+from time import sleep
+import unittest
+import unishark
+
+__context__ = 'tests.mock3'
+
+
+@unishark.timeout(0.5)
+def setUpModule():
+    sleep(0.1)
+
+
+class Class1(unittest.TestCase):
+    @classmethod
+    @unishark.timeout(0.2)
+    def setUpClass(cls):
+        sleep(3)
+
+    def test_case_1(self):
+        pass
+
+
+class Class2(unittest.TestCase):
+    def test_case_1(self):
+        sleep(0.1)
+
+    @unishark.timeout(0.2)
+    def test_case_2(self):
+        sleep(3)
+
+    def test_case_3(self):
+        sleep(3)
+
+
+class Class4(unittest.TestCase):
+    @unishark.timeout(0.2)
+    def test_case_1(self):
+        sleep(1)
+        # Only reached if the test keeps running after it timed out.
+        open(os.environ['UNISHARK_TIMEOUT_MARKER'], 'w').close()
+
+    def test_case_2(self):
+        # Runs in the same process as test_case_1 until test_case_1 would finish.
+        sleep(1.2)
+
+
+class Class3(unittest.TestCase):
+    async def test_case_1(self):
+        await asyncio.sleep(3)
+
+    async def test_case_2(self):
+        await asyncio.sleep(0.1)
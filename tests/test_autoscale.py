@@ -0,0 +1,125 @@
+import unittest
+import unishark
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unishark import autoscale
+
+
+class CgroupTestCase(unittest.TestCase):
+    def setUp(self):
+        super(CgroupTestCase, self).setUp()
+        self.cgroup_dir = autoscale.CGROUP_DIR
+        self.dir = tempfile.mkdtemp()
+        autoscale.CGROUP_DIR = self.dir
+
+    def tearDown(self):
+        autoscale.CGROUP_DIR = self.cgroup_dir
+        shutil.rmtree(self.dir)
+
+    def _write(self, content, *parts):
+        path = os.path.join(self.dir, *parts)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content + '\n')
+
+    def test_no_cgroup(self):
+        self.assertIsNone(autoscale._cpu_quota())
+        self.assertIsNone(autoscale.memory_usage())
+        self.assertGreaterEqual(autoscale.cpu_limit(), 1)
+
+    def test_cgroup_v1(self):
+        self._write('150000', 'cpu', 'cpu.cfs_quota_us')
+        self._write('100000', 'cpu', 'cpu.cfs_period_us')
+        self._write('9223372036854771712', 'memory', 'memory.limit_in_bytes')
+        self._write('1024', 'memory', 'memory.usage_in_bytes')
+        self.assertEqual(autoscale._cpu_quota(), 1.5)
+        self.assertIsNone(autoscale.memory_usage())
+        self._write('2048', 'memory', 'memory.limit_in_bytes')
+        self.assertEqual(autoscale.memory_usage(), (1024, 2048))
+        self._write('-1', 'cpu', 'cpu.cfs_quota_us')
+        self.assertIsNone(autoscale._cpu_quota())
+
+    def test_cgroup_v2(self):
+        self._write('max 100000', 'cpu.max')
+        self._write('max', 'memory.max')
+        self._write('1024', 'memory.current')
+        self.assertIsNone(autoscale._cpu_quota())
+        self.assertIsNone(autoscale.memory_usage())
+        self._write('50000 100000', 'cpu.max')
+        self._write('4096', 'memory.max')
+        self.assertEqual(autoscale._cpu_quota(), 0.5)
+        self.assertEqual(autoscale.cpu_limit(), 1)
+        self.assertEqual(autoscale.memory_usage(), (1024, 4096))
+
+
+class AutoscalerTestCase(unittest.TestCase):
+    def setUp(self):
+        super(AutoscalerTestCase, self).setUp()
+        self.autoscaler = autoscale.Autoscaler((1, 16), cooldown=2)
+        self.autoscaler.cpus = 4
+
+    def test_bounds(self):
+        self.assertEqual(self.autoscaler.initial_workers(), 4)
+        self.assertEqual(self.autoscaler.initial_workers('asyncio'), 16)
+        with self.assertRaises(ValueError):
+            autoscale.Autoscaler((4, 2))
+        self.assertEqual(autoscale.default_bounds()[0], 1)
+
+    def test_io_bound(self):
+        # Grows while the throughput rises, and reverts the grow which does not raise it.
+        decide = self.autoscaler.decide
+        self.assertEqual(decide(4, 4, True, 100.0, 0.1, None), 6)
+        self.assertEqual(decide(6, 6, True, 150.0, 0.1, None), 9)
+        self.assertEqual(decide(9, 9, True, 152.0, 0.1, None), 6)
+        # Then holds during the cooldown, and tries again.
+        self.assertEqual(decide(6, 6, True, 150.0, 0.1, None), 6)
+        self.assertEqual(decide(6, 6, True, 150.0, 0.1, None), 6)
+        self.assertEqual(decide(6, 6, True, 150.0, 0.1, None), 9)
+        # Does not grow without queued tasks or with idle workers.
+        decide = autoscale.Autoscaler((1, 16)).decide
+        self.assertEqual(decide(9, 9, False, 150.0, 0.1, None), 9)
+        self.assertEqual(decide(9, 5, True, 150.0, 0.1, None), 9)
+        self.assertEqual(decide(16, 16, True, 150.0, 0.1, None), 16)
+
+    def test_cpu_bound(self):
+        decide = self.autoscaler.decide
+        self.assertEqual(decide(4, 4, True, 100.0, 3.9, None), 4)
+        self.assertEqual(decide(8, 8, True, 100.0, 3.9, None), 4)
+
+    def test_memory_pressure(self):
+        decide = self.autoscaler.decide
+        self.assertEqual(decide(8, 8, True, 100.0, 0.1, (95, 100)), 7)
+        self.assertEqual(decide(1, 1, True, 100.0, 0.1, (95, 100)), 1)
+        self.assertEqual(decide(8, 8, True, 100.0, 0.1, (50, 100)), 12)
+
+    def test_io_bound_suite(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def test(self):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        classes = [type('MockClass%d' % i, (unittest.TestCase,), dict(('test_%d' % j, test) for j in range(20)))
+                   for i in range(10)]
+        suite = unittest.TestSuite([unittest.TestLoader().loadTestsFromTestCase(cls) for cls in classes])
+        result = unishark.BufferedTestRunner(verbosity=0).run(suite, max_workers='auto', concurrency_level='method',
+                                                              options=unishark.RunOptions(worker_bounds=(1, 8)))
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 200)
+        self.assertLessEqual(peak[0], 8)
+        if autoscale.Autoscaler((1, 8)).initial_workers() < 8:
+            self.assertGreater(peak[0], autoscale.Autoscaler((1, 8)).initial_workers())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
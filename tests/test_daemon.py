@@ -0,0 +1,176 @@
+import unittest
+import unishark
+import os
+import sys
+import shutil
+import tempfile
+import threading
+from unishark.daemon import stop_daemon
+
+
+_MODULE_SOURCE = '''
+import unittest
+import unishark
+
+
+def setUpModule():
+    unishark.contexts.get('daemon_mock').append('setUpModule')
+
+
+def tearDownModule():
+    unishark.contexts.get('daemon_mock').append('tearDownModule')
+
+
+class MockClass(unittest.TestCase):
+%s
+'''
+
+
+def _write_module(path, count):
+    with open(path, 'w') as f:
+        f.write(_MODULE_SOURCE % ''.join('    def test_%d(self):\n        pass\n\n' % i for i in range(count)))
+
+
+class TestDaemonTestCase(unittest.TestCase):
+    def setUp(self):
+        super(TestDaemonTestCase, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        # pyclbr caches the modules it read, so each test has its own package.
+        self.pkg_name = 'daemon_mock_%s' % self._testMethodName
+        pkg_dir = os.path.join(self.dir, self.pkg_name)
+        os.mkdir(pkg_dir)
+        open(os.path.join(pkg_dir, '__init__.py'), 'w').close()
+        self.module_path = os.path.join(pkg_dir, 'test_warm.py')
+        _write_module(self.module_path, 2)
+        sys.path.insert(0, self.dir)
+        unishark.contexts.set('daemon_mock', [])
+        self.dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': self.pkg_name,
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_warm']
+                        }
+                    }
+                },
+                'my_suite_2': {
+                    'package': 'tests.mock3',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_concur1']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1', 'my_suite_2'],
+                'reporters': []
+            }
+        }
+        unishark.contexts.set('tests.mock3', [])
+        self.daemon = None
+        self.thread = None
+
+    def tearDown(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.daemon.stop()
+            self.thread.join()
+        sys.path.remove(self.dir)
+        for name in [name for name in sys.modules if name.startswith(self.pkg_name)]:
+            del sys.modules[name]
+        shutil.rmtree(self.dir)
+
+    def _start(self, keep_fixtures=False):
+        self.daemon = unishark.TestDaemon(authkey='secret', keep_fixtures=keep_fixtures)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def test_run_in_daemon(self):
+        self._start()
+        results = []
+        exit_code = unishark.run_in_daemon(self.daemon.address, self.dict_conf, authkey='secret',
+                                           verbosity=0, result_listener=results.append)
+        self.assertEqual(exit_code, 0)
+        self.assertListEqual(sorted(r.name for r in results), ['my_suite_1', 'my_suite_2'])
+        self.assertEqual(sum(r.testsRun for r in results), 6)
+        self.assertListEqual(unishark.contexts.get('daemon_mock'), ['setUpModule', 'tearDownModule'])
+        # The test module stays imported, and is imported again once its source file changed.
+        module = sys.modules[self.pkg_name + '.test_warm']
+        exit_code = unishark.run_in_daemon(self.daemon.address, self.dict_conf, authkey='secret', verbosity=0)
+        self.assertEqual(exit_code, 0)
+        self.assertIs(sys.modules[self.pkg_name + '.test_warm'], module)
+        _write_module(self.module_path, 3)
+        mtime = os.path.getmtime(self.module_path) + 10
+        os.utime(self.module_path, (mtime, mtime))
+        results = []
+        unishark.run_in_daemon('%s:%d' % self.daemon.address, self.dict_conf, authkey='secret',
+                               verbosity=0, result_listener=results.append)
+        self.assertIsNot(sys.modules[self.pkg_name + '.test_warm'], module)
+        self.assertEqual(sum(r.testsRun for r in results), 7)
+        self.assertEqual(self.daemon.runs, 3)
+        stop_daemon(self.daemon.address, authkey='secret')
+        self.thread.join()
+
+    def test_warm_fixtures(self):
+        self._start(keep_fixtures=True)
+        for _ in range(3):
+            exit_code = unishark.run_in_daemon(self.daemon.address, self.dict_conf, authkey='secret', verbosity=0)
+            self.assertEqual(exit_code, 0)
+        self.assertListEqual(unishark.contexts.get('daemon_mock'), ['setUpModule'])
+        # The module fixture is torn down once the module changed.
+        _write_module(self.module_path, 1)
+        mtime = os.path.getmtime(self.module_path) + 10
+        os.utime(self.module_path, (mtime, mtime))
+        unishark.run_in_daemon(self.daemon.address, self.dict_conf, authkey='secret', verbosity=0)
+        self.assertListEqual(unishark.contexts.get('daemon_mock'), ['setUpModule', 'tearDownModule', 'setUpModule'])
+        self.daemon.stop()
+        self.thread.join()
+        self.assertListEqual(unishark.contexts.get('daemon_mock'),
+                             ['setUpModule', 'tearDownModule', 'setUpModule', 'tearDownModule'])
+
+    def test_failed_config(self):
+        self._start()
+        del self.dict_conf['test']['suites']
+        with self.assertRaises(RuntimeError):
+            unishark.run_in_daemon(self.daemon.address, self.dict_conf, authkey='secret', verbosity=0)
+        self.assertEqual(unishark.run_in_daemon(self.daemon.address, {'suites': self.dict_conf['suites'],
+                                                                      'test': {'suites': ['my_suite_2']}},
+                                                authkey='secret', verbosity=0), 0)
+        # The daemon serves its clients in threads, so a fork suite is refused before running anything.
+        self.dict_conf['test']['suites'] = ['my_suite_1', 'my_suite_2']
+        self.dict_conf['suites']['my_suite_2']['concurrency'] = {'max_workers': 2, 'level': 'class', 'type': 'fork'}
+        with self.assertRaises(RuntimeError):
+            unishark.run_in_daemon(self.daemon.address, self.dict_conf, authkey='secret', verbosity=0)
+        self.assertListEqual(unishark.contexts.get('daemon_mock'), [])
+
+    def test_authkey_and_cache_dir(self):
+        with self.assertRaises(ValueError):
+            unishark.TestDaemon(('0.0.0.0', 0))
+        self.daemon = unishark.TestDaemon()
+        self.assertEqual(len(self.daemon.authkey), 32)
+        self.assertTrue(os.path.isdir(self.daemon.cache_dir))
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+        with self.assertRaises(ValueError):
+            unishark.run_in_daemon(self.daemon.address, self.dict_conf, None)
+        exit_code = unishark.run_in_daemon(self.daemon.address, self.dict_conf, self.daemon.authkey, verbosity=0)
+        self.assertEqual(exit_code, 0)
+        stop_daemon(self.daemon.address, self.daemon.authkey)
+        self.thread.join()
+        # The daemon removes the cache directory it created, but not one it was given.
+        self.assertFalse(os.path.exists(self.daemon.cache_dir))
+        cache_dir = os.path.join(self.dir, 'cache')
+        os.mkdir(cache_dir)
+        self.daemon = unishark.TestDaemon(authkey='secret', cache_dir=cache_dir)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+        self.daemon.stop()
+        self.thread.join()
+        self.assertTrue(os.path.isdir(cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
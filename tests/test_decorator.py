@@ -145,6 +145,25 @@ class DecoratorTestCase(unittest.TestCase):
             def mock_test(**param):
                 time.sleep(param['time'])
 
+    def test_timeout(self):
+        @unishark.timeout(1.5)
+        def mock_test():
+            pass
+
+        self.assertEqual(mock_test.__unishark_timeout__, 1.5)
+        with self.assertRaises(ValueError):
+            unishark.timeout(0)
+
+    def test_resources(self):
+        @unishark.resources('db')
+        @unishark.resources('gpu', 'db')
+        def mock_test():
+            pass
+
+        self.assertEqual(mock_test.__unishark_resources__, frozenset(['db', 'gpu']))
+        with self.assertRaises(ValueError):
+            unishark.resources()
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
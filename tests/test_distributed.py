@@ -0,0 +1,130 @@
+import unittest
+import unishark
+import operator
+import threading
+import time
+import concurrent.futures
+from multiprocessing.connection import Client
+from unishark.distributed import parse_address
+
+
+def _slow_add(a, b):
+    time.sleep(0.1)
+    return a + b
+
+
+class CoordinatorTestCase(unittest.TestCase):
+    def setUp(self):
+        super(CoordinatorTestCase, self).setUp()
+        self.coordinator = unishark.Coordinator(authkey='secret')
+
+    def tearDown(self):
+        self.coordinator.shutdown()
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('localhost:8000'), ('localhost', 8000))
+        self.assertEqual(parse_address(('localhost', 8000)), ('localhost', 8000))
+        with self.assertRaises(ValueError):
+            parse_address('localhost')
+
+    def test_shutdown_after_starting_workers(self):
+        # The local workers still connecting are refused instead of blocking the shutdown.
+        self.coordinator.start_local_workers(2)
+        shutdown = threading.Thread(target=self.coordinator.shutdown)
+        shutdown.daemon = True
+        shutdown.start()
+        shutdown.join(30)
+        self.assertFalse(shutdown.is_alive())
+        for worker in self.coordinator._local_workers:
+            self.assertFalse(worker.is_alive())
+
+    def test_authkey(self):
+        coordinator = unishark.Coordinator()
+        try:
+            self.assertEqual(len(coordinator.authkey), 32)
+            other = unishark.Coordinator()
+            other.shutdown()
+            self.assertNotEqual(coordinator.authkey, other.authkey)
+            coordinator.start_local_workers(1)
+            self.assertEqual(coordinator.submit(operator.add, 1, 2).result(timeout=30), 3)
+            # A generated authkey would have to be handed to the workers on other hosts.
+            with self.assertRaises(ValueError):
+                unishark.Coordinator(('0.0.0.0', 0))
+            unishark.Coordinator(('0.0.0.0', 0), authkey='secret').shutdown()
+        finally:
+            coordinator.shutdown()
+        with self.assertRaises(ValueError):
+            unishark.run_worker(self.coordinator.address, None)
+
+    def test_local_workers(self):
+        self.coordinator.start_local_workers(2)
+        deadline = time.time() + 30
+        while self.coordinator.worker_count < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.coordinator.worker_count, 2)
+        futures = [self.coordinator.submit(_slow_add, i, 1) for i in range(8)]
+        self.assertListEqual([f.result(timeout=30) for f in futures], list(range(1, 9)))
+        with self.assertRaises(ZeroDivisionError):
+            self.coordinator.submit(operator.truediv, 1, 0).result(timeout=30)
+
+    def test_worker_in_thread(self):
+        counts = []
+        worker = threading.Thread(target=lambda: counts.append(unishark.run_worker(self.coordinator.address,
+                                                                                  'secret')))
+        worker.start()
+        self.assertEqual(self.coordinator.submit(operator.add, 1, 2).result(timeout=30), 3)
+        self.coordinator.shutdown()
+        worker.join()
+        self.assertListEqual(counts, [1])
+        with self.assertRaises(RuntimeError):
+            self.coordinator.submit(operator.add, 1, 2)
+
+    def test_lost_worker(self):
+        # A worker which disconnects before returning its call leaves the call to the other workers.
+        conn = Client(self.coordinator.address, authkey=b'secret')
+        future = self.coordinator.submit(operator.add, 1, 2)
+        message = conn.recv()
+        self.assertEqual(message[1:], (operator.add, (1, 2), {}))
+        conn.close()
+        self.coordinator.start_local_workers(1)
+        self.assertEqual(future.result(timeout=30), 3)
+
+    def test_cancel_queued_calls(self):
+        future = self.coordinator.submit(operator.add, 1, 2)
+        self.assertTrue(future.cancel())
+        self.coordinator.start_local_workers(1)
+        self.assertEqual(self.coordinator.submit(operator.add, 2, 2).result(timeout=30), 4)
+        self.assertTrue(future.cancelled())
+
+    def test_distributed_suite(self):
+        # The mock tests record their fixtures in a context, which the forked workers inherit.
+        unishark.contexts.set('tests.mock3', [])
+        self.coordinator.start_local_workers(2)
+        runner = unishark.BufferedTestRunner(verbosity=0)
+        suite = unittest.TestLoader().loadTestsFromNames(['tests.mock3.test_concur1', 'tests.mock3.test_concur2'])
+        result = runner.run(suite, max_workers=2, concurrency_level='class',
+                            options=unishark.RunOptions(concurrency_type='distributed', executor=self.coordinator))
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 8)
+        self.assertEqual(len(result.children), 2)
+        self.assertEqual(result.children[0].successes, 4)
+        self.assertEqual(result.children[0].children[0].successes, 2)
+        suite = unittest.TestLoader().loadTestsFromNames(['tests.mock3.test_concur1', 'tests.mock3.test_concur2'])
+        result = runner.run(suite, max_workers=2, concurrency_level='module',
+                            options=unishark.RunOptions(concurrency_type='distributed', executor=self.coordinator))
+        self.assertEqual(result.successes, 8)
+        with self.assertRaises(ValueError):
+            runner.run(suite, max_workers=2, concurrency_level='module',
+                       options=unishark.RunOptions(concurrency_type='distributed'))
+
+    def test_timeout(self):
+        # No worker is connected.
+        runner = unishark.BufferedTestRunner(verbosity=0)
+        suite = unittest.TestLoader().loadTestsFromNames(['tests.mock3.test_concur1'])
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            runner.run(suite, max_workers=2, concurrency_level='class', timeout=0.5,
+                       options=unishark.RunOptions(concurrency_type='distributed', executor=self.coordinator))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
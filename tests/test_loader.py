@@ -1,7 +1,15 @@
 import unittest
 import unishark
+import os
+import sys
+import json
+import shutil
+import tempfile
 from tests.mock1 import test_module1, test_module2
 from tests.mock2 import test_module3
+from unishark.selection import NameSelector
+from unishark.loader import NameTree
+from unishark.discovery import PyclbrDiscoveryEngine
 from tests import logger
 
 
@@ -1016,6 +1024,513 @@ class LoaderTestCase(unittest.TestCase):
         with self.assertRaises(ImportError):
             self.loader.load_tests_from_modules(['tests.mock2.no_such_mod'])
 
+    def test_discovery_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            self.loader = unishark.DefaultTestLoader(cache_dir=cache_dir)
+            suite = self.loader.load_tests_from_package('tests.mock2')
+            self.assertEqual(suite.countTestCases(), 9)
+            self.assertSetEqual(set(os.listdir(cache_dir)),
+                                {'tests.mock2.mock_module4.json', 'tests.mock2.test_module3.json'})
+
+            def inspect_module(full_mod_name):
+                raise AssertionError('%s should be served from the cache.' % full_mod_name)
+            loader = unishark.DefaultTestLoader(cache_dir=cache_dir)
+            loader._discovery_engine.inspect_module = inspect_module
+            suite = loader.load_tests_from_package('tests.mock2')
+            self.assertEqual(suite.countTestCases(), 9)
+            # A module served from the cache is not imported to discover its tests.
+            sys.modules.pop('tests.mock2.mock_module4', None)
+            loader = unishark.DefaultTestLoader(cache_dir=cache_dir)
+            loader._discovery_engine.inspect_module = inspect_module
+            loader._build_pkg_name_tree('tests.mock2')
+            self.assertNotIn('tests.mock2.mock_module4', sys.modules)
+            self.assertIn('MyTestClass6', loader._name_tree['mock_module4'])
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_discovery_cache_invalidated(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            entry_path = os.path.join(cache_dir, 'tests.mock2.test_module3.json')
+            with open(entry_path, 'w') as f:
+                json.dump({'key': ['stale', 0, 0, 'pyclbr'], 'tree': {'MyTestClass5': ['test_stale']}}, f)
+            self.loader = unishark.DefaultTestLoader(cache_dir=cache_dir)
+            suite = self.loader.load_tests_from_modules(['tests.mock2.test_module3'])
+            self.assertEqual(suite.countTestCases(), 7)
+            with open(entry_path, 'r') as f:
+                self.assertNotEqual(json.load(f)['key'][0], 'stale')
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_ast_discovery_engine(self):
+        self.loader = unishark.DefaultTestLoader(discovery_engine='ast')
+        sys.modules.pop('tests.mock2.mock_module4', None)
+        self.loader._build_pkg_name_tree('tests.mock2')
+        self.assertNotIn('tests.mock2.mock_module4', sys.modules)
+        tree = self.loader._name_tree
+        self.assertSetEqual(set(tree['mock_module4'].keys()), {'MyTestClass5', 'MyTestClass6'})
+        self.assertSetEqual(tree['mock_module4']['MyTestClass6'],
+                            {'test_12', 'test_11', 'te_11', '__test', 'test_static'})
+        # inherited test_11 is loaded while the static method is still filtered out
+        suite = self.loader.load_tests_from_package('tests.mock2')
+        self.assertEqual(suite.countTestCases(), 10)
+
+    def test_ast_discovery_engine_resolves_bases_in_package(self):
+        path = tempfile.mkdtemp()
+        try:
+            pkg_path = os.path.join(path, 'ast_mock_pkg')
+            os.makedirs(os.path.join(pkg_path, 'base'))
+            files = {
+                '__init__.py': '',
+                os.path.join('base', '__init__.py'): 'from .cases import BaseCase\n',
+                os.path.join('base', 'cases.py'): 'import unittest\n\n\n'
+                                                  'class BaseCase(unittest.TestCase):\n'
+                                                  '    def test_base(self):\n'
+                                                  '        pass\n',
+                'test_derived.py': 'from . import base\n'
+                                   'from .base import BaseCase as Base\n\n\n'
+                                   'class Derived1(base.BaseCase):\n'
+                                   '    def test_1(self):\n'
+                                   '        pass\n\n\n'
+                                   'class Derived2(Base):\n'
+                                   '    def test_2(self):\n'
+                                   '        pass\n\n\n'
+                                   'class Helper(object):\n'
+                                   '    def test_3(self):\n'
+                                   '        pass\n',
+            }
+            for name, content in files.items():
+                with open(os.path.join(pkg_path, name), 'w') as f:
+                    f.write(content)
+            sys.path.insert(0, path)
+            self.loader = unishark.DefaultTestLoader(discovery_engine='ast')
+            self.loader._build_pkg_name_tree('ast_mock_pkg')
+            self.assertDictEqual(self.loader._name_tree.to_dict(), {
+                'test_derived': {
+                    'Derived1': {'test_1', 'test_base'},
+                    'Derived2': {'test_2', 'test_base'}
+                }
+            })
+            self.assertNotIn('ast_mock_pkg', sys.modules)
+            suite = self.loader.load_tests_from_package('ast_mock_pkg')
+            self.assertEqual(suite.countTestCases(), 4)
+        finally:
+            sys.path.remove(path)
+            for name in list(sys.modules):
+                if name.startswith('ast_mock_pkg'):
+                    del sys.modules[name]
+            shutil.rmtree(path)
+
+    def test_ast_discovery_cache_invalidated_by_base(self):
+        path = tempfile.mkdtemp()
+        cache_dir = tempfile.mkdtemp()
+        try:
+            pkg_path = os.path.join(path, 'ast_cache_mock_pkg')
+            os.makedirs(pkg_path)
+            open(os.path.join(pkg_path, '__init__.py'), 'w').close()
+            base_path = os.path.join(pkg_path, 'base.py')
+            with open(base_path, 'w') as f:
+                f.write('import unittest\n\n\nclass Base(unittest.TestCase):\n'
+                        '    def test_a(self):\n        pass\n')
+            with open(os.path.join(pkg_path, 'test_child.py'), 'w') as f:
+                f.write('from .base import Base\n\n\nclass Child(Base):\n'
+                        '    def test_c(self):\n        pass\n')
+            sys.path.insert(0, path)
+            for workers in (1, 2):
+                loader = unishark.DefaultTestLoader(cache_dir=cache_dir, discovery_engine='ast',
+                                                    discovery_workers=workers)
+                loader._build_pkg_name_tree('ast_cache_mock_pkg')
+                self.assertSetEqual(loader._name_tree['test_child']['Child'], {'test_a', 'test_c'})
+            # A test added to the base class in another module is discovered though the child module is cached.
+            with open(base_path, 'a') as f:
+                f.write('\n    def test_b(self):\n        pass\n')
+            mtime = os.path.getmtime(base_path) + 10
+            os.utime(base_path, (mtime, mtime))
+            for workers in (1, 2):
+                loader = unishark.DefaultTestLoader(cache_dir=cache_dir, discovery_engine='ast',
+                                                    discovery_workers=workers)
+                loader._build_pkg_name_tree('ast_cache_mock_pkg')
+                self.assertSetEqual(loader._name_tree['test_child']['Child'], {'test_a', 'test_b', 'test_c'})
+        finally:
+            sys.path.remove(path)
+            shutil.rmtree(path)
+            shutil.rmtree(cache_dir)
+
+    def test_ast_discovery_engine_invalid_modules(self):
+        self.loader = unishark.DefaultTestLoader(discovery_engine='ast')
+        with self.assertRaises(ImportError):
+            self.loader.load_tests_from_modules(['tests.mock2.no_such_mod'])
+        with self.assertRaises(ImportError):
+            self.loader.load_tests_from_package('tests.no_such_pkg')
+
+    def test_invalid_discovery_engine(self):
+        with self.assertRaises(ValueError):
+            unishark.DefaultTestLoader(discovery_engine='no_such_engine')
+
+    def test_lazy_loading(self):
+        self.loader = unishark.DefaultTestLoader(lazy=True)
+        suite = self.loader.load_tests_from_package('tests.mock2')
+        self.assertEqual(suite.countTestCases(), 9)
+        for case in suite:
+            self.assertIs(type(case), unishark.suite.LazyTestCase)
+        result = unishark.BufferedTestRunner(verbosity=0).run(suite)
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 9)
+
+    def test_discovery_workers(self):
+        self.loader = unishark.DefaultTestLoader(discovery_workers=2)
+        suite = self.loader.load_tests_from_package('tests.mock2')
+        self.assertEqual(suite.countTestCases(), 9)
+        self.assertDictEqual(self.loader.discovery_errors, {})
+        # Only the modules with selected tests are imported in this process.
+        sys.modules.pop('tests.mock2.mock_module4', None)
+        self.loader = unishark.DefaultTestLoader(discovery_workers=2)
+        suite = self.loader.load_tests_from_package('tests.mock2', regex=r'test_module3\.\w+\.\w+')
+        self.assertEqual(suite.countTestCases(), 7)
+        self.assertNotIn('tests.mock2.mock_module4', sys.modules)
+
+    def test_discovery_workers_report_import_errors_per_module(self):
+        self.loader = unishark.DefaultTestLoader(discovery_workers=2)
+        suite = self.loader.load_tests_from_modules(['tests.mock2.no_such_mod', 'tests.mock1.test_module1'])
+        self.assertEqual(suite.countTestCases(), 5)
+        self.assertListEqual(list(self.loader.discovery_errors.keys()), ['tests.mock2.no_such_mod'])
+        self.assertIn('No module named', self.loader.discovery_errors['tests.mock2.no_such_mod'])
+        # The module which failed to be discovered fails the run.
+        result = unishark.BufferedTestRunner(verbosity=0).run(suite)
+        self.assertFalse(result.wasSuccessful())
+        self.assertEqual(len(result.errors), 1)
+        self.assertIn("Failed to discover tests in module 'tests.mock2.no_such_mod'", result.errors[0][1])
+
+    def test_recursive_package(self):
+        path = tempfile.mkdtemp()
+        try:
+            pkg_path = os.path.join(path, 'rec_mock_pkg')
+            os.makedirs(os.path.join(pkg_path, 'sub', 'deep'))
+            os.makedirs(os.path.join(pkg_path, 'broken'))
+            case = 'import unittest\n\n\nclass %s(unittest.TestCase):\n' \
+                   '    def test_1(self):\n        pass\n\n    def test_2(self):\n        pass\n'
+            files = {
+                '__init__.py': '',
+                'test_a.py': case % 'A',
+                os.path.join('sub', '__init__.py'): '',
+                os.path.join('sub', 'test_b.py'): case % 'B',
+                os.path.join('sub', 'deep', '__init__.py'): '',
+                os.path.join('sub', 'deep', 'test_c.py'): case % 'C',
+                os.path.join('broken', '__init__.py'): 'raise ImportError("must not be imported")\n',
+                os.path.join('broken', 'test_d.py'): case % 'D',
+            }
+            for name, content in files.items():
+                with open(os.path.join(pkg_path, name), 'w') as f:
+                    f.write(content)
+            sys.path.insert(0, path)
+            dict_conf = {
+                'suites': {
+                    'my_suite_1': {
+                        'package': 'rec_mock_pkg',
+                        'groups': {
+                            'g1': {
+                                'granularity': 'package',
+                                'recursive': True,
+                                'except_modules': ['broken'],
+                                'except_methods': ['sub.deep.test_c.C.test_2']
+                            }
+                        }
+                    },
+                    'my_suite_2': {
+                        'package': 'rec_mock_pkg',
+                        'groups': {
+                            'g1': {
+                                'granularity': 'package',
+                                'recursive': True,
+                                'except_modules': ['broken', 'sub.deep'],
+                                'except_classes': ['sub.test_b.B']
+                            }
+                        }
+                    }
+                },
+                'test': {
+                    'suites': ['my_suite_1', 'my_suite_2']
+                }
+            }
+            suite_dict = self.loader.load_tests_from_dict(dict_conf)
+            self.assertEqual(suite_dict['my_suite_1']['suite'].countTestCases(), 5)
+            self.assertIn('rec_mock_pkg.sub.deep.test_c.C.test_1', [t.id() for t in suite_dict['my_suite_1']['suite']])
+            self.assertEqual(suite_dict['my_suite_2']['suite'].countTestCases(), 2)
+            self.assertNotIn('rec_mock_pkg.broken', sys.modules)
+            # sub-packages are not loaded without recursive
+            self.assertEqual(self.loader.load_tests_from_package('rec_mock_pkg').countTestCases(), 2)
+            dict_conf['suites']['my_suite_2']['groups']['g1']['except_modules'] = ['broken', 'sub.no_such_mod']
+            with self.assertRaises(ValueError):
+                self.loader.load_tests_from_dict(dict_conf)
+        finally:
+            sys.path.remove(path)
+            for name in list(sys.modules):
+                if name.startswith('rec_mock_pkg'):
+                    del sys.modules[name]
+            shutil.rmtree(path)
+
+    def test_excluded_modules_not_imported(self):
+        path = tempfile.mkdtemp()
+        try:
+            pkg_path = os.path.join(path, 'excl_mock_pkg')
+            os.makedirs(pkg_path)
+            files = {
+                '__init__.py': '',
+                'test_a.py': 'import unittest\n\n\nclass A(unittest.TestCase):\n    def test_1(self):\n        pass\n',
+                'test_broken.py': 'raise ImportError("must not be imported")\n'
+            }
+            for name, content in files.items():
+                with open(os.path.join(pkg_path, name), 'w') as f:
+                    f.write(content)
+            sys.path.insert(0, path)
+            dict_conf = {
+                'suites': {
+                    'my_suite_1': {
+                        'package': 'excl_mock_pkg',
+                        'groups': {
+                            'g1': {
+                                'granularity': 'package',
+                                'except_modules': ['test_broken']
+                            }
+                        }
+                    }
+                },
+                'test': {
+                    'suites': ['my_suite_1']
+                }
+            }
+            suite_dict = self.loader.load_tests_from_dict(dict_conf)
+            self.assertEqual(suite_dict['my_suite_1']['suite'].countTestCases(), 1)
+            self.assertNotIn('excl_mock_pkg.test_broken', sys.modules)
+            dict_conf['suites']['my_suite_1']['groups']['g1']['except_modules'] = ['test_no_such_module']
+            with self.assertRaises(ValueError):
+                self.loader.load_tests_from_dict(dict_conf)
+        finally:
+            sys.path.remove(path)
+            for name in list(sys.modules):
+                if name.startswith('excl_mock_pkg'):
+                    del sys.modules[name]
+            shutil.rmtree(path)
+
+    def test_load_tests_from_file(self):
+        path = tempfile.mkdtemp()
+        try:
+            ids_path = os.path.join(path, 'ids.txt')
+            with open(ids_path, 'w') as f:
+                f.write('# failures of the last run\n'
+                        'tests.mock1.test_module1.MyTestClass1.test_1\n'
+                        '\n'
+                        'tests.mock1.test_module2.MyTestClass3.test_5\n'
+                        'tests.mock1.test_module1.MyTestClass1.test_1\n')
+            suite = self.loader.load_tests_from_file(ids_path)
+            self.assertListEqual([t.id() for t in suite], ['tests.mock1.test_module1.MyTestClass1.test_1',
+                                                          'tests.mock1.test_module2.MyTestClass3.test_5'])
+            rel_ids_path = os.path.join(path, 'rel_ids.txt')
+            with open(rel_ids_path, 'w') as f:
+                f.write('test_module1.MyTestClass1.test_1\ntest_module1.MyTestClass2.test_3\n')
+            dict_conf = {
+                'suites': {
+                    'my_suite_1': {
+                        'package': 'tests.mock1',
+                        'groups': {
+                            'g1': {
+                                'granularity': 'file',
+                                'file': rel_ids_path
+                            },
+                            'g2': {
+                                'granularity': 'method',
+                                'methods': ['test_module1.MyTestClass1.test_1']
+                            }
+                        }
+                    }
+                },
+                'test': {
+                    'suites': ['my_suite_1']
+                }
+            }
+            suite_dict = self.loader.load_tests_from_dict(dict_conf)
+            self.assertEqual(suite_dict['my_suite_1']['suite'].countTestCases(), 2)
+            with open(rel_ids_path, 'w') as f:
+                f.write('MyTestClass1.test_1\n')
+            with self.assertRaises(ValueError):
+                self.loader.load_tests_from_dict(dict_conf)
+        finally:
+            shutil.rmtree(path)
+
+    def test_name_selector(self):
+        selector = NameSelector(r'^test\w*', long_name_pattern=r'(\w+\.){2}test_[12]', long_name_depth=3,
+                                prefix='pkg', except_names=['mod2', 'mod1.Cls2', 'mod1.Cls1.test_2'])
+        full_names = ['pkg.mod1.Cls1.test_1', 'pkg.mod1.Cls1.test_2', 'pkg.mod1.Cls1.test_3',
+                      'pkg.mod1.Cls1.helper', 'pkg.mod1.Cls2.test_1', 'pkg.mod2.Cls1.test_1']
+        self.assertEqual(selector.select(full_names, strict=True), ['pkg.mod1.Cls1.test_1'])
+        self.assertEqual(selector.get_exclusion('pkg.mod1.Cls2.test_1'), 'mod1.Cls2')
+        self.assertIsNone(selector.get_exclusion('pkg.mod1.Cls1.test_1'))
+        self.assertTrue(selector.is_selected('pkg.mod1.Cls1.test_1'))
+        self.assertFalse(selector.is_selected('pkg.mod1.Cls1.test_3'))
+        self.assertEqual(selector.select(full_names[:1]), ['pkg.mod1.Cls1.test_1'])
+        with self.assertRaises(ValueError):
+            selector.select(full_names[:1], strict=True)
+        # a method excluded in an excluded class is not included
+        selector = NameSelector(r'^test\w*', except_names=['mod1.Cls1', 'mod1.Cls1.test_1'])
+        with self.assertRaises(ValueError):
+            selector.select(['mod1.Cls1.test_1'], strict=True)
+
+    def test_selectors_reused_across_suites(self):
+        group = {
+            'granularity': 'package',
+            'except_modules': ['test_module2'],
+            'except_methods': ['test_module1.MyTestClass1.test_1']
+        }
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {'package': 'tests.mock1', 'groups': {'g1': dict(group)}},
+                'my_suite_2': {'package': 'tests.mock1', 'groups': {'g1': dict(group)}}
+            },
+            'test': {
+                'suites': ['my_suite_1', 'my_suite_2']
+            }
+        }
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['suite'].countTestCases(), 3)
+        self.assertEqual(suite_dict['my_suite_2']['suite'].countTestCases(), 3)
+        self.assertEqual(len(self.loader._selectors), 1)
+
+    def test_name_tree_shared_by_groups(self):
+        tree = NameTree.from_dict({'mod1': {'cls1': {'mth1', 'mth2'}}, 'mod2': {'cls2': {'mth3'}}})
+        self.assertDictEqual(tree.to_dict(), {'mod1': {'cls1': {'mth1', 'mth2'}}, 'mod2': {'cls2': {'mth3'}}})
+        self.assertEqual(tree['mod2']['cls2'], frozenset(['mth3']))
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock1',
+                    'groups': {
+                        'g1': {'granularity': 'package', 'except_modules': ['test_module2']},
+                        'g2': {'granularity': 'package', 'except_modules': ['test_module1']}
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1']
+            }
+        }
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['suite'].countTestCases(), 10)
+        self.loader._build_pkg_name_tree('tests.mock1')
+        tree = self.loader._name_tree
+        self.assertSetEqual(set(tree.keys()), {'test_module1', 'test_module2'})
+        self.loader._build_pkg_name_tree('tests.mock1')
+        self.assertIs(self.loader._name_tree, tree)
+        # the module subtrees are shared by the trees of the groups
+        self.loader._build_pkg_name_tree('tests.mock1', except_mod_names=['test_module2'])
+        self.assertSetEqual(set(self.loader._name_tree.keys()), {'test_module1'})
+        self.assertIs(self.loader._name_tree['test_module1'], tree['test_module1'])
+
+    def test_resolution_index(self):
+        full_names = ['tests.mock1.test_module1.MyTestClass1.test_1',
+                      'tests.mock1.test_module1.MyTestClass1.test_2',
+                      'tests.mock1.test_module1.MyTestClass2.test_3']
+        suite = self.loader.load_tests_from_full_names(full_names)
+        self.assertEqual(suite.countTestCases(), 3)
+        self.assertSetEqual(set(self.loader._resolved_objs.keys()),
+                            {'tests', 'tests.mock1', 'tests.mock1.test_module1',
+                             'tests.mock1.test_module1.MyTestClass1', 'tests.mock1.test_module1.MyTestClass2'})
+        self.assertIs(self.loader._resolved_objs['tests.mock1.test_module1.MyTestClass1'], test_module1.MyTestClass1)
+        with self.assertRaises(AttributeError):
+            self.loader.load_tests_from_full_names(['tests.mock1.test_module1.MyTestClass1.test_5'])
+        with self.assertRaises(ImportError):
+            self.loader.load_tests_from_full_names(['no_such_pkg.test_module1.MyTestClass1.test_1'])
+
+    def test_iter_tests_from_dict(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock1',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_module1']
+                        }
+                    }
+                },
+                'my_suite_2': {
+                    'package': 'tests.mock1',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'no_such_granularity'
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1', 'my_suite_2']
+            }
+        }
+        suites = self.loader.iter_tests_from_dict(dict_conf)
+        suite_name, suite_content = next(suites)
+        self.assertEqual(suite_name, 'my_suite_1')
+        self.assertEqual(suite_content['suite'].countTestCases(), 4)
+        # the next suite is not parsed until it is requested
+        with self.assertRaises(ValueError):
+            next(suites)
+
+    def test_shared_discovery_pass(self):
+        class CountingEngine(PyclbrDiscoveryEngine):
+            def __init__(self):
+                self.inspected = []
+
+            def inspect_module(self, full_mod_name):
+                self.inspected.append(full_mod_name)
+                return super(CountingEngine, self).inspect_module(full_mod_name)
+
+        engine = CountingEngine()
+        self.loader = unishark.DefaultTestLoader(discovery_engine=engine)
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock1',
+                    'groups': {
+                        'g1': {'granularity': 'package'},
+                        'g2': {'granularity': 'module', 'modules': ['test_module1']}
+                    }
+                },
+                'my_suite_2': {
+                    'package': 'tests.mock1',
+                    'groups': {
+                        'g1': {'granularity': 'class', 'classes': ['test_module2.MyTestClass3']},
+                        'g2': {'granularity': 'package', 'except_modules': ['test_module2']}
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1', 'my_suite_2']
+            }
+        }
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['suite'].countTestCases(), 10)
+        self.assertEqual(suite_dict['my_suite_2']['suite'].countTestCases(), 7)
+        self.assertListEqual(engine.inspected, ['tests.mock1.test_module1', 'tests.mock1.test_module2'])
+        # The pipeline discovers the modules of each suite in one pass too.
+        engine.inspected = []
+        self.loader = unishark.DefaultTestLoader(discovery_engine=engine)
+        passes = []
+        discover_modules = self.loader._discover_modules
+
+        def record_pass(full_mod_names):
+            passes.append(sorted(full_mod_names))
+            return discover_modules(full_mod_names)
+
+        self.loader._discover_modules = record_pass
+        dict_conf['suites']['my_suite_1']['groups'] = {
+            'g1': {'granularity': 'module', 'modules': ['test_module1']},
+            'g2': {'granularity': 'class', 'classes': ['test_module2.MyTestClass3']}
+        }
+        counts = [content['suite'].countTestCases() for _, content in self.loader.iter_tests_from_dict(dict_conf)]
+        self.assertListEqual(counts, [7, 7])
+        self.assertListEqual(passes[0], ['tests.mock1.test_module1', 'tests.mock1.test_module2'])
+        self.assertListEqual([p for p in passes[1:] if p], [])
+        self.assertListEqual(sorted(engine.inspected), ['tests.mock1.test_module1', 'tests.mock1.test_module2'])
+
     def test_concurrency_level_module_and_method(self):
         dict_conf = {
             'suites': {
@@ -1139,6 +1654,156 @@ class LoaderTestCase(unittest.TestCase):
             self.loader.load_tests_from_dict(dict_conf)
         self.assertEqual(str(cm.exception), "Concurrency level ('mod') is not one of ['module', 'class', 'method'].")
 
+    def test_concurrency_type(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock1',
+                    'concurrency': {
+                        'max_workers': 2,
+                        'level': 'module',
+                        'type': 'processes'
+                    },
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_module1']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1']
+            }
+        }
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['concurrency']['type'], 'processes')
+        dict_conf['suites']['my_suite_1']['concurrency']['level'] = 'method'
+        dict_conf['suites']['my_suite_1']['concurrency']['type'] = 'asyncio'
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['concurrency']['type'], 'asyncio')
+        dict_conf['suites']['my_suite_1']['concurrency']['type'] = 'processes'
+        with self.assertRaises(ValueError) as cm:
+            self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(str(cm.exception), "Concurrency level must be one of ['module', 'class'] with processes.")
+        dict_conf['suites']['my_suite_1']['concurrency']['type'] = 'asyncio'
+        dict_conf['suites']['my_suite_1']['concurrency']['test_timeout'] = 0
+        with self.assertRaises(ValueError) as cm:
+            self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(str(cm.exception), 'Concurrency test_timeout (0) must be greater than 0.')
+        dict_conf['suites']['my_suite_1']['concurrency']['test_timeout'] = 10
+        dict_conf['suites']['my_suite_1']['concurrency']['type'] = 'greenlets'
+        with self.assertRaises(ValueError) as cm:
+            self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(str(cm.exception), "Concurrency type ('greenlets') is not one of "
+                                            "['threads', 'processes', 'asyncio', 'distributed', 'fork'].")
+        dict_conf['suites']['my_suite_1']['concurrency']['type'] = 'fork'
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['concurrency']['type'], 'fork')
+
+    def test_concurrency_resources(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock1',
+                    'concurrency': {
+                        'max_workers': 32,
+                        'level': 'method',
+                        'resources': {'db': 2},
+                        'resource_tags': {'db': ['test_module1', 'test_module2.MyTestClass3.test_5']}
+                    },
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_module1']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1']
+            }
+        }
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertDictEqual(suite_dict['my_suite_1']['concurrency']['resources'], {'db': 2})
+        dict_conf['suites']['my_suite_1']['concurrency']['resource_tags']['gpu'] = ['test_module1']
+        with self.assertRaises(ValueError) as cm:
+            self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(str(cm.exception), "Tagged resource 'gpu' has no capacity in concurrency resources.")
+        del dict_conf['suites']['my_suite_1']['concurrency']['resource_tags']['gpu']
+        dict_conf['suites']['my_suite_1']['concurrency']['resources']['db'] = 0
+        with self.assertRaises(ValueError) as cm:
+            self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(str(cm.exception), "Capacity of resource 'db' (0) must be greater than 0.")
+        dict_conf['suites']['my_suite_1']['concurrency']['resources']['db'] = 2
+        dict_conf['suites']['my_suite_1']['concurrency']['type'] = 'asyncio'
+        with self.assertRaises(ValueError) as cm:
+            self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(str(cm.exception), 'Concurrency resources are only limited with type threads.')
+
+    def test_auto_max_workers(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock1',
+                    'concurrency': {
+                        'max_workers': 'auto',
+                        'level': 'method',
+                        'worker_bounds': [2, 16]
+                    },
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_module1']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1']
+            }
+        }
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['concurrency']['max_workers'], 'auto')
+        self.assertEqual(suite_dict['my_suite_1']['concurrency']['worker_bounds'], (2, 16))
+        dict_conf['suites']['my_suite_1']['concurrency']['worker_bounds'] = [16, 2]
+        with self.assertRaises(ValueError) as cm:
+            self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(str(cm.exception), 'Concurrency worker_bounds ([16, 2]) must satisfy 1 <= min <= max.')
+        dict_conf['suites']['my_suite_1']['concurrency']['max_workers'] = 'many'
+        with self.assertRaises(ValueError):
+            self.loader.load_tests_from_dict(dict_conf)
+
+    def test_max_failures(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock1',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_module1']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1']
+            }
+        }
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertIsNone(suite_dict['my_suite_1']['max_failures'])
+        dict_conf['suites']['my_suite_1']['failfast'] = True
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['max_failures'], 1)
+        dict_conf['suites']['my_suite_1']['max_failures'] = 3
+        suite_dict = self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(suite_dict['my_suite_1']['max_failures'], 3)
+        dict_conf['suites']['my_suite_1']['max_failures'] = 0
+        with self.assertRaises(ValueError) as cm:
+            self.loader.load_tests_from_dict(dict_conf)
+        self.assertEqual(str(cm.exception), 'max_failures (0) must be greater than 0.')
+
     def test_default_concurrency_setting(self):
         dict_conf = {
             'suites': {
@@ -1160,6 +1825,7 @@ class LoaderTestCase(unittest.TestCase):
         self.assertEqual(suite_dict['my_suite_1']['concurrency']['max_workers'], 1)
         self.assertEqual(suite_dict['my_suite_1']['concurrency']['level'], 'class')
         self.assertIs(suite_dict['my_suite_1']['concurrency']['timeout'], None)
+        self.assertEqual(suite_dict['my_suite_1']['concurrency']['type'], 'threads')
 
     def test_missing_max_workers(self):
         dict_conf = {
@@ -1,4 +1,11 @@
 import unittest
+import asyncio
+import os
+import time
+import shutil
+import tempfile
+import threading
+import concurrent.futures
 import unishark
 
 
@@ -17,6 +24,14 @@ class RunnerTestCase(unittest.TestCase):
         self.cls21_name = 'test_concur2.Class1'
         self.cls22_name = 'test_concur2.Class2'
 
+    def tearDown(self):
+        # The threads of the timed out tests are left running: waits for them,
+        # so that they do not run into the next tests (e.g. the fork tests do not fork with other threads).
+        for thread in threading.enumerate():
+            if thread.name.startswith('unishark-timeout-'):
+                thread.join()
+        super(RunnerTestCase, self).tearDown()
+
     def test_init_with_non_iterable_reporters(self):
         with self.assertRaises(TypeError):
             unishark.BufferedTestRunner(reporters=unishark.HtmlReporter())
@@ -297,6 +312,233 @@ class RunnerTestCase(unittest.TestCase):
         self.check_cls_in_parallel(self.cls11_name, self.cls12_name, mod1_order)
         self.check_cls_in_parallel(self.cls21_name, self.cls22_name, mod2_order)
 
+    def test_processes_on_modules(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_concur1', 'tests.mock3.test_concur2'])
+        result = self.runner.run(self.suite, max_workers=2, concurrency_level='module',
+                                 options=unishark.RunOptions(concurrency_type='processes'))
+        self.check_result(result)
+        self.assertEqual(result.testsRun, 8)
+        self.assertEqual(result.successes, 8)
+
+    def test_processes_on_classes(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_concur1', 'tests.mock3.test_concur2'])
+        result = self.runner.run(self.suite, max_workers=4, concurrency_level='class',
+                                 options=unishark.RunOptions(concurrency_type='processes'))
+        self.check_result(result)
+        self.assertEqual(result.testsRun, 8)
+        self.assertEqual(result.children[0].successes, 4)
+        self.assertEqual(result.children[0].children[0].successes, 2)
+
+    def test_processes_on_methods(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_concur1', 'tests.mock3.test_concur2'])
+        with self.assertRaises(ValueError):
+            self.runner.run(self.suite, max_workers=4, concurrency_level='method',
+                            options=unishark.RunOptions(concurrency_type='processes'))
+
+    def test_asyncio_on_methods(self):
+        mod_name = 'test_async1'
+        cls_name = 'test_async1.Class1'
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_async1'])
+        result = self.runner.run(self.suite, max_workers=8, concurrency_level='method',
+                                 options=unishark.RunOptions(concurrency_type='asyncio'))
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 6)
+        self.assertEqual(result.successes, 4)
+        self.assertEqual(len(result.skipped), 2)
+        order = unishark.contexts.get(self.__context__)
+        self.check_mod_fixtures(mod_name, self.get_mod_order(mod_name, order))
+        cls_order = self.get_cls_order(cls_name, order)
+        self.check_cls_fixtures(cls_name, cls_order)
+        self.check_cases_in_parallel(cls_name + '.test_case_1', cls_name + '.test_case_2', cls_order)
+        # Each test has its own output buffer, though the tests interleave in one thread.
+        outputs = dict((r[0], r[4]) for r in result.results[mod_name][cls_name])
+        self.assertEqual(outputs[cls_name + '.test_case_1'],
+                         'tests.mock3.%s.test_case_1 begins\ntests.mock3.%s.test_case_1 ends\n' % (cls_name, cls_name))
+
+    def test_asyncio_on_modules(self):
+        mod_name = 'test_async1'
+        cls_name = 'test_async1.Class1'
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_async1'])
+        result = self.runner.run(self.suite, max_workers=1, concurrency_level='module',
+                                 options=unishark.RunOptions(concurrency_type='asyncio'))
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.successes, 4)
+        self.assertEqual(len(result.skipped), 2)
+        order = unishark.contexts.get(self.__context__)
+        cls_order = self.get_cls_order(cls_name, order)
+        self.check_cls_fixtures(cls_name, cls_order)
+        self.check_cases_in_seq(cls_order)
+
+    @unittest.skipUnless(hasattr(unittest, 'IsolatedAsyncioTestCase'), 'Requires Python 3.8+.')
+    def test_asyncio_with_isolated_case(self):
+        class IsolatedMockTestCase(unittest.IsolatedAsyncioTestCase):
+            async def asyncSetUp(self):
+                self.x = 1
+                self.addAsyncCleanup(self.cleanup)
+
+            async def cleanup(self):
+                unishark.contexts.get('tests.mock3').append('cleanup')
+
+            async def test_1(self):
+                await asyncio.sleep(0.01)
+                self.assertEqual(self.x, 1)
+
+            async def asyncTearDown(self):
+                unishark.contexts.get('tests.mock3').append('asyncTearDown')
+
+        for level in ('module', 'method'):
+            # An IsolatedAsyncioTestCase cannot run twice.
+            self.suite = self.loader.loadTestsFromTestCase(IsolatedMockTestCase)
+            unishark.contexts.set(self.__context__, [])
+            result = self.runner.run(self.suite, max_workers=2, concurrency_level=level,
+                                     options=unishark.RunOptions(concurrency_type='asyncio'))
+            self.assertTrue(result.wasSuccessful())
+            self.assertEqual(result.successes, 1)
+            self.assertListEqual(unishark.contexts.get(self.__context__), ['asyncTearDown', 'cleanup'])
+
+    def test_asyncio_timeout(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_async1'])
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            self.runner.run(self.suite, max_workers=8, concurrency_level='method', timeout=0.2,
+                            options=unishark.RunOptions(concurrency_type='asyncio'))
+
+    def check_timeouts(self, result):
+        self.assertEqual(result.testsRun, 3)
+        self.assertEqual(result.successes, 1)
+        self.assertEqual(len(result.errors), 3)
+        errors = dict((str(test), error) for test, error in result.errors)
+        error = errors['FixtureErrors.tests:mock3:test_timeout1:Class1:setUpClass']
+        self.assertIn('tests.mock3.test_timeout1.Class1.setUpClass is not finished in 0.2 seconds.', error)
+        self.assertIn('sleep(3)', error)
+        error = errors['test_case_2 (tests.mock3.test_timeout1.Class2.test_case_2)']
+        self.assertIn('tests.mock3.test_timeout1.Class2.test_case_2 is not finished in 0.2 seconds.', error)
+        self.assertIn('in test_case_2', error)
+        error = errors['test_case_3 (tests.mock3.test_timeout1.Class2.test_case_3)']
+        self.assertIn('tests.mock3.test_timeout1.Class2.test_case_3 is not finished in 1.0 seconds.', error)
+
+    def test_timeouts_in_sequence(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_timeout1.Class1',
+                                                     'tests.mock3.test_timeout1.Class2'])
+        start_time = time.time()
+        result = self.runner.run(self.suite, options=unishark.RunOptions(test_timeout=1.0))
+        self.assertLess(time.time() - start_time, 3)
+        self.check_timeouts(result)
+
+    def test_timeouts_on_methods(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_timeout1.Class1',
+                                                     'tests.mock3.test_timeout1.Class2'])
+        result = self.runner.run(self.suite, max_workers=4, concurrency_level='method',
+                                 options=unishark.RunOptions(test_timeout=1.0))
+        self.check_timeouts(result)
+
+    def test_timeouts_in_processes(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_timeout1.Class1',
+                                                     'tests.mock3.test_timeout1.Class2'])
+        result = self.runner.run(self.suite, max_workers=2, concurrency_level='class',
+                                 options=unishark.RunOptions(concurrency_type='processes', test_timeout=1.0))
+        self.check_timeouts(result)
+
+    def test_timeouts_in_processes_terminated(self):
+        # The process running a test which timed out is terminated, and the next test runs in a new process.
+        marker = os.path.join(tempfile.mkdtemp(), 'marker')
+        os.environ['UNISHARK_TIMEOUT_MARKER'] = marker
+        try:
+            for level in ('module', 'class'):
+                self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_timeout1.Class4'])
+                result = self.runner.run(self.suite, max_workers=2, concurrency_level=level,
+                                         options=unishark.RunOptions(concurrency_type='processes'))
+                self.assertEqual(result.testsRun, 2)
+                self.assertEqual(result.successes, 1)
+                self.assertEqual(len(result.errors), 1)
+                self.assertIn('tests.mock3.test_timeout1.Class4.test_case_1 is not finished in 0.2 seconds.',
+                              result.errors[0][1])
+            time.sleep(1.5)
+            self.assertFalse(os.path.exists(marker))
+        finally:
+            del os.environ['UNISHARK_TIMEOUT_MARKER']
+            shutil.rmtree(os.path.dirname(marker))
+
+    def test_timeout_on_inherited_method(self):
+        class BaseMockTestCase(unittest.TestCase):
+            @unishark.timeout(0.2)
+            def test_slow(self):
+                time.sleep(1.5)
+
+        class DerivedMockTestCase(BaseMockTestCase):
+            pass
+
+        self.suite = self.loader.loadTestsFromTestCase(DerivedMockTestCase)
+        start_time = time.time()
+        result = self.runner.run(self.suite)
+        self.assertLess(time.time() - start_time, 1.5)
+        self.assertEqual(len(result.errors), 1)
+
+    def test_timeouts_with_asyncio(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_timeout1.Class3'])
+        result = self.runner.run(self.suite, max_workers=2, concurrency_level='method',
+                                 options=unishark.RunOptions(concurrency_type='asyncio', test_timeout=1.0))
+        self.assertEqual(result.successes, 1)
+        self.assertEqual(len(result.errors), 1)
+        self.assertIn('tests.mock3.test_timeout1.Class3.test_case_1 is not finished in 1.0 seconds.',
+                      result.errors[0][1])
+        self.assertIn('in test_case_1', result.errors[0][1])
+
+    def check_stopped(self, order):
+        # The fixtures already set up are torn down, and no more classes are set up.
+        self.assertIn('test_failfast1.Class1.tearDownClass', order)
+        self.assertIn('test_failfast1.tearDownModule', order)
+        self.assertNotIn('test_failfast1.Class2.setUpClass', order)
+
+    def test_max_failures_in_sequence(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_failfast1'])
+        result = self.runner.run(self.suite, options=unishark.RunOptions(max_failures=2))
+        self.assertEqual(result.testsRun, 2)
+        self.assertEqual(len(result.errors), 2)
+        self.check_stopped(unishark.contexts.get(self.__context__))
+
+    def test_failfast(self):
+        self.runner = unishark.BufferedTestRunner(verbosity=0, failfast=True)
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_failfast1'])
+        options = unishark.RunOptions(concurrency_type='threads')
+        result = self.runner.run(self.suite, options=options)
+        self.assertEqual(result.testsRun, 1)
+        self.assertEqual(len(result.errors), 1)
+        self.check_stopped(unishark.contexts.get(self.__context__))
+        # The options given are not changed.
+        self.assertIsNone(options.max_failures)
+        with self.assertRaises(TypeError):
+            options.replace(max_failure=1)
+
+    def test_max_failures_on_methods(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_failfast1.Class1'])
+        result = self.runner.run(self.suite, max_workers=2, concurrency_level='method',
+                                 options=unishark.RunOptions(max_failures=1))
+        # The running tests are drained, the queued ones are not started.
+        self.assertGreaterEqual(result.testsRun, 1)
+        self.assertLessEqual(result.testsRun, 2)
+        self.assertEqual(len(result.errors), result.testsRun)
+        self.assertIn('test_failfast1.Class1.tearDownClass', unishark.contexts.get(self.__context__))
+
+    def test_max_failures_with_asyncio(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_failfast1'])
+        result = self.runner.run(self.suite, max_workers=1, concurrency_level='class',
+                                 options=unishark.RunOptions(concurrency_type='asyncio', max_failures=3))
+        self.assertEqual(result.testsRun, 3)
+        self.assertEqual(len(result.errors), 3)
+        self.check_stopped(unishark.contexts.get(self.__context__))
+
+    def test_shared_failure_limit(self):
+        failure_limit = unishark.FailureLimit(2)
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_failfast1.Class1'])
+        result = self.runner.run(self.suite, options=unishark.RunOptions(max_failures=1, failure_limit=failure_limit))
+        self.assertEqual(result.testsRun, 1)
+        self.assertEqual(failure_limit.count, 1)
+        self.assertFalse(failure_limit.reached)
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_failfast1.Class1'])
+        result = self.runner.run(self.suite, options=unishark.RunOptions(failure_limit=failure_limit))
+        self.assertEqual(result.testsRun, 1)
+        self.assertTrue(failure_limit.reached)
+
     def test_fixtures_failures(self):
         mod3_name = 'test_concur3'
         mod4_name = 'test_concur4'
@@ -1,5 +1,19 @@
 import unittest
 import unishark.suite
+import unishark.scheduler
+import unishark
+import os
+import collections
+import pickle
+import weakref
+import gc
+import time
+import threading
+import concurrent.futures
+
+
+def get_name(mod_suite):
+    return list(list(mod_suite)[0])[0].__class__.__module__
 
 
 class SuiteTestCase(unittest.TestCase):
@@ -8,6 +22,36 @@ class SuiteTestCase(unittest.TestCase):
         self.loader = unittest.TestLoader()
         self.suite = None
 
+    def test_plan_class_batches(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock3.test_concur1', 'tests.mock3.test_concur2'])
+        tests = unishark.suite.convert(self.suite)
+        result = unishark.BufferedTestResult(None, False, 0)
+        unishark.BufferedTestRunner().make_results_tree(tests, result)
+        durations = unishark.DurationStore()
+        # Without expensive module fixtures, each class has its own batch.
+        batches = tests._plan_class_batches(result, 4, durations)
+        self.assertEqual(len(batches), 4)
+        self.assertEqual([len(batch[0][1]) for batch in batches], [1, 1, 1, 1])
+        # Classes sharing an expensive setUpModule stay in one batch.
+        durations.fixtures['tests.mock3.test_concur1.setUpModule'] = 10.0
+        durations.fixtures['tests.mock3.test_concur2.setUpModule'] = 10.0
+        batches = tests._plan_class_batches(result, 4, durations)
+        self.assertEqual(len(batches), 2)
+        for batch in batches:
+            self.assertEqual(len(batch), 1)
+            mod_suite, cls_results = batch[0]
+            self.assertEqual(len(mod_suite), 2)
+            self.assertListEqual(cls_results, list(result.children[batches.index(batch)].children))
+        # A long class is worth splitting from its module.
+        durations.fixtures['tests.mock3.test_concur1.setUpModule'] = 0.1
+        for mod_suite in tests:
+            for cls_suite in mod_suite:
+                for case in cls_suite:
+                    durations.tests[unishark.util.get_full_method_name(case)] = 1.0
+        durations.tests['tests.mock3.test_concur1.Class1.test_case_1'] = 100.0
+        batches = tests._plan_class_batches(result, 4, durations)
+        self.assertEqual(len(batches), 3)
+
     def test_convert_suite(self):
         self.suite = self.loader.loadTestsFromNames(['tests.mock1.test_module1',
                                                      'tests.mock1.test_module2'])
@@ -44,5 +88,318 @@ class SuiteTestCase(unittest.TestCase):
         self.assertEqual(tests.countTestCases(), 2)
 
 
+    def test_convert_compiles_plan(self):
+        from unishark.plan import SETUP, TEARDOWN, RUN
+        self.suite = self.loader.loadTestsFromNames(['tests.mock1.test_module1',
+                                                     'tests.mock1.test_module2'])
+        tests = unishark.suite.convert(self.suite)
+        plan, start, end = tests._span
+        self.assertEqual((start, end), (0, len(plan)))
+        # 2 modules and 4 classes with a setup and a teardown each, and 10 tests.
+        self.assertEqual(len(plan), 2 * 2 + 4 * 2 + 10)
+        self.assertEqual(len(plan.modules), 2)
+        self.assertEqual(len(plan.classes), 4)
+        self.assertEqual([op for op, entry, arg in plan.steps].count(RUN), 10)
+        self.assertEqual(tests._level, unishark.suite.TestSuite.ROOT_LEVEL)
+        for mod_suite in tests:
+            self.assertEqual(mod_suite._level, unishark.suite.TestSuite.MODULE_LEVEL)
+            op, mod_entry, teardown_index = plan.steps[mod_suite._span[1]]
+            self.assertEqual(op, SETUP)
+            self.assertEqual(teardown_index, mod_suite._span[2] - 1)
+            self.assertEqual(plan.steps[teardown_index], (TEARDOWN, mod_entry, None))
+            self.assertEqual(mod_entry.setup_key, mod_entry.name + '.setUpModule')
+            for cls_suite in mod_suite:
+                self.assertEqual(cls_suite._level, unishark.suite.TestSuite.CLASS_LEVEL)
+                cls_entry = cls_suite._entry
+                self.assertIs(cls_entry.module, mod_entry)
+                self.assertEqual(cls_entry.name, '%s.%s' % (mod_entry.name, cls_entry.test_class.__name__))
+                cases = [arg for op, entry, arg in plan.steps[cls_suite._span[1]:cls_suite._span[2]] if op == RUN]
+                self.assertListEqual(cases, list(cls_suite))
+        # A sub-suite sent to a worker process is compiled again on its own.
+        mod_suite = pickle.loads(pickle.dumps(list(tests)[0]))
+        self.assertIsNone(mod_suite._span)
+        self.assertEqual(unishark.suite._get_level(mod_suite), unishark.suite.TestSuite.MODULE_LEVEL)
+        plan, start, end = tests._get_span(mod_suite)
+        self.assertEqual((start, end), (0, len(plan)))
+        self.assertEqual(len(plan.classes), len(mod_suite))
+
+    def test_durations_keyed_by_package(self):
+        def test(self):
+            time.sleep(0.01 if self.__module__ == 'pkg_a.test_foo' else 0.1)
+
+        classes = [type('FooTest', (unittest.TestCase,), {'__module__': mod_name, 'test_1': test})
+                   for mod_name in ('pkg_a.test_foo', 'pkg_b.test_foo')]
+        self.suite = unittest.TestSuite([self.loader.loadTestsFromTestCase(cls) for cls in classes])
+        result = unishark.BufferedTestRunner(verbosity=0).run(self.suite)
+        durations = unishark.DurationStore()
+        durations.update(result)
+        self.assertSetEqual(set(durations.tests), {'pkg_a.test_foo.FooTest.test_1', 'pkg_b.test_foo.FooTest.test_1'})
+        self.assertLess(durations.get_test_duration('pkg_a.test_foo.FooTest.test_1'),
+                        durations.get_test_duration('pkg_b.test_foo.FooTest.test_1'))
+
+    def test_convert_longest_first(self):
+        self.suite = self.loader.loadTestsFromNames(['tests.mock1.test_module1', 'tests.mock1.test_module2'])
+        durations = unishark.DurationStore()
+        durations.tests['tests.mock1.test_module1.MyTestClass1.test_2'] = 3.0
+        durations.tests['tests.mock1.test_module1.MyTestClass2.test_3'] = 1.0
+        durations.tests['tests.mock1.test_module2.MyTestClass4.test_8'] = 5.0
+        durations.fixtures['tests.mock1.test_module2.setUpModule'] = 10.0
+        tests = unishark.suite.convert(self.suite, durations)
+        # Unknown tests cost the mean of the known ones: 3.0.
+        self.assertListEqual([get_name(t) for t in tests], ['tests.mock1.test_module2', 'tests.mock1.test_module1'])
+        mod_suite = list(tests)[1]
+        self.assertListEqual([list(cls_suite)[0].__class__.__name__ for cls_suite in mod_suite],
+                             ['MyTestClass1', 'MyTestClass2'])
+        cls_suite = list(mod_suite)[1]
+        self.assertListEqual([unishark.util.get_method_name(case) for case in cls_suite], ['test_4', 'test_3'])
+        self.assertEqual(cls_suite._cost, 4.0)
+        self.assertEqual(tests._cost, sum(mod_suite._cost for mod_suite in tests))
+        # The execution plan follows the order.
+        plan, start, end = tests._span
+        self.assertIs(plan.steps[start][1], list(tests)[0]._entry)
+        self.assertEqual(tests.countTestCases(), 10)
+
+    def test_longest_first_run(self):
+        lock = threading.Lock()
+        started = []
+
+        def test(self):
+            with lock:
+                if self.__class__.__name__ not in started:
+                    started.append(self.__class__.__name__)
+            time.sleep(0.01)
+
+        classes = [type('MockClass%d' % i, (unittest.TestCase,), dict(('test_%d' % j, test) for j in range(3)))
+                   for i in range(6)]
+        durations = unishark.DurationStore()
+        for i in range(6):
+            for j in range(3):
+                durations.tests['%s.MockClass%d.test_%d' % (__name__, i, j)] = float(i)
+        self.suite = unittest.TestSuite([self.loader.loadTestsFromTestCase(cls) for cls in classes])
+        result = unishark.BufferedTestRunner(verbosity=0).run(self.suite, max_workers=2, concurrency_level='class',
+                                                              options=unishark.RunOptions(durations=durations))
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 18)
+        # The classes start about in the order of their setups, which run concurrently.
+        self.assertIn('MockClass5', started[:2])
+        self.assertIn('MockClass0', started[4:])
+
+    def test_convert_lazy_test_cases(self):
+        from tests.mock1 import test_module1, test_module2
+        self.suite = unittest.TestSuite([
+            unishark.suite.LazyTestCase('tests.mock1.test_module1.MyTestClass1.test_1', test_module1.MyTestClass1),
+            unishark.suite.LazyTestCase('tests.mock1.test_module2.MyTestClass3.test_5', test_module2.MyTestClass3),
+            unishark.suite.LazyTestCase('tests.mock1.test_module1.MyTestClass1.test_2', test_module1.MyTestClass1)
+        ])
+        tests = unishark.suite.convert(self.suite)
+        self.assertEqual(len(tests), 2)
+        self.assertEqual(sum([len(t) for t in tests]), 2)
+        self.assertEqual(tests.countTestCases(), 3)
+        case = list(list(list(tests)[0])[0])[0]
+        self.assertIs(type(case), unishark.suite.LazyTestCase)
+        self.assertIsInstance(case, test_module1.MyTestClass1)
+        case = pickle.loads(pickle.dumps(case))
+        self.assertIs(type(case), unishark.suite.LazyTestCase)
+        self.assertEqual(case.id(), 'tests.mock1.test_module1.MyTestClass1.test_1')
+
+    def test_lazy_test_cases_dropped_after_run(self):
+        alive = weakref.WeakSet()
+
+        class LazyMockTestCase(unittest.TestCase):
+            def __init__(self, *args, **kwargs):
+                super(LazyMockTestCase, self).__init__(*args, **kwargs)
+                alive.add(self)
+
+            def test_1(self):
+                self.assertEqual(len(alive), 1)
+
+            def test_2(self):
+                self.assertEqual(len(alive), 1)
+
+        self.suite = unittest.TestSuite([
+            unishark.suite.LazyTestCase('%s.LazyMockTestCase.test_%d' % (__name__, i), LazyMockTestCase)
+            for i in (1, 2)
+        ])
+        self.assertEqual(len(alive), 0)
+        result = unishark.BufferedTestRunner(verbosity=0).run(self.suite, max_workers=2, concurrency_level='method')
+        gc.collect()
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 2)
+        self.assertEqual(len(alive), 0)
+
+    def test_scheduler_bounds_workers(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+        threads = set()
+
+        def make_test(i):
+            def test(self):
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                    threads.add(threading.current_thread().name)
+                time.sleep(0.01)
+                with lock:
+                    running[0] -= 1
+            return test
+
+        classes = [type('MockClass%d' % i, (unittest.TestCase,), dict(('test_%d' % j, make_test(j)) for j in range(5)))
+                   for i in range(20)]
+        self.suite = unittest.TestSuite([self.loader.loadTestsFromTestCase(cls) for cls in classes])
+        result = unishark.BufferedTestRunner(verbosity=0).run(self.suite, max_workers=3, concurrency_level='method')
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 100)
+        self.assertLessEqual(peak[0], 3)
+        self.assertLessEqual(len(threads), 3)
+
+    def test_resource_limits(self):
+        lock = threading.Lock()
+        running = collections.Counter()
+        peak = collections.Counter()
+
+        def make_test(resource):
+            def test(self):
+                with lock:
+                    running[resource] += 1
+                    peak[resource] = max(peak[resource], running[resource])
+                time.sleep(0.02)
+                with lock:
+                    running[resource] -= 1
+            return test
+
+        # Tagged by decorator on the class, by decorator on a method, and by config.
+        DbMockClass = unishark.resources('db')(type('DbMockClass', (unittest.TestCase,),
+                                                    dict(('test_%d' % i, make_test('db')) for i in range(6))))
+        mixed = dict(('test_%d' % i, make_test('free')) for i in range(6))
+        mixed['test_db'] = unishark.resources('db')(make_test('db'))
+        mixed['test_model'] = make_test('model')
+        MixedMockClass = type('MixedMockClass', (unittest.TestCase,), mixed)
+        ModelMockClass = type('ModelMockClass', (unittest.TestCase,),
+                              dict(('test_%d' % i, make_test('model')) for i in range(4)))
+        self.suite = unittest.TestSuite([self.loader.loadTestsFromTestCase(cls)
+                                         for cls in (DbMockClass, MixedMockClass, ModelMockClass)])
+        options = unishark.RunOptions(
+            resources={'db': 2, 'model': 1},
+            resource_tags={'model': ['test_suite.ModelMockClass', 'test_suite.MixedMockClass.test_model']})
+        result = unishark.BufferedTestRunner(verbosity=0).run(
+            self.suite, max_workers=8, concurrency_level='method', options=options)
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 18)
+        self.assertEqual(peak['db'], 2)
+        self.assertEqual(peak['model'], 1)
+        self.assertGreater(peak['free'], 2)
+        # At class level, a class holds the resources of all its methods.
+        running.clear()
+        peak.clear()
+        result = unishark.BufferedTestRunner(verbosity=0).run(
+            self.suite, max_workers=3, concurrency_level='class', options=unishark.RunOptions(resources={'db': 1}))
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(peak['db'], 1)
+        with self.assertRaises(ValueError):
+            unishark.BufferedTestRunner(verbosity=0).run(
+                self.suite, max_workers=2,
+                options=unishark.RunOptions(concurrency_type='processes', resources={'db': 1}))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Requires os.fork.')
+    def test_fork_after_fixtures(self):
+        parent = os.getpid()
+        calls = []
+
+        class ForkMockTestCase(unittest.TestCase):
+            @classmethod
+            def setUpClass(cls):
+                calls.append(('setUpClass', os.getpid()))
+                cls.data = list(range(1000))
+
+            @classmethod
+            def tearDownClass(cls):
+                calls.append(('tearDownClass', os.getpid()))
+
+        def test(self):
+            # The data set up in this process is inherited by the forked worker.
+            self.assertNotEqual(os.getpid(), parent)
+            self.assertEqual(len(self.data), 1000)
+
+        for i in range(8):
+            setattr(ForkMockTestCase, 'test_%d' % i, test)
+        self.suite = self.loader.loadTestsFromTestCase(ForkMockTestCase)
+        result = unishark.BufferedTestRunner(verbosity=0).run(self.suite, max_workers=3, concurrency_level='method',
+                                                              options=unishark.RunOptions(concurrency_type='fork'))
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 8)
+        self.assertEqual(result.children[0].children[0].testsRun, 8)
+        # The fixtures run once, in this process.
+        self.assertListEqual(calls, [('setUpClass', parent), ('tearDownClass', parent)])
+        with self.assertRaises(ValueError):
+            unishark.BufferedTestRunner(verbosity=0).run(self.suite, max_workers=3, concurrency_level='none',
+                                                         options=unishark.RunOptions(concurrency_type='fork'))
+        # While another thread runs (e.g. left by a timed out test), the tests are run in this process instead.
+        pids = []
+
+        class PidMockTestCase(unittest.TestCase):
+            def test_1(self):
+                pids.append(os.getpid())
+
+            def test_2(self):
+                pids.append(os.getpid())
+
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        try:
+            result = unishark.BufferedTestRunner(verbosity=0).run(self.loader.loadTestsFromTestCase(PidMockTestCase),
+                                                                  max_workers=2, concurrency_level='method',
+                                                                  options=unishark.RunOptions(concurrency_type='fork'))
+        finally:
+            stop.set()
+            thread.join()
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 2)
+        self.assertListEqual(pids, [parent, parent])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Requires os.fork.')
+    def test_fork_timeout(self):
+        class SlowMockTestCase(unittest.TestCase):
+            def test_1(self):
+                time.sleep(5)
+
+            def test_2(self):
+                time.sleep(5)
+
+        self.suite = self.loader.loadTestsFromTestCase(SlowMockTestCase)
+        start = time.time()
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            unishark.BufferedTestRunner(verbosity=0).run(self.suite, max_workers=2, concurrency_level='method',
+                                                         timeout=0.5,
+                                                         options=unishark.RunOptions(concurrency_type='fork'))
+        self.assertLess(time.time() - start, 5)
+
+    def test_scheduler_timeout(self):
+        class SlowMockTestCase(unittest.TestCase):
+            def test_1(self):
+                time.sleep(0.5)
+
+            def test_2(self):
+                time.sleep(0.5)
+
+        self.suite = self.loader.loadTestsFromTestCase(SlowMockTestCase)
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            unishark.BufferedTestRunner(verbosity=0).run(self.suite, max_workers=2, concurrency_level='method',
+                                                         timeout=0.1)
+
+    def test_scheduler_timeout_hung_task(self):
+        # A task which never returns does not keep the scheduler from raising the timeout.
+        released = threading.Event()
+        scheduler = unishark.scheduler.WorkStealingScheduler(1)
+        start = time.time()
+        try:
+            with self.assertRaises(concurrent.futures.TimeoutError):
+                scheduler.run(lambda: released.wait(30), timeout=0.1)
+            self.assertLess(time.time() - start, 10)
+        finally:
+            released.set()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
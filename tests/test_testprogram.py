@@ -1,7 +1,10 @@
 import unittest
 import unishark
 import os
+import sys
+import copy
 import shutil
+import tempfile
 from unishark.util import get_interpreter
 
 
@@ -68,6 +71,20 @@ class DefaultTestProgramTestCase(TestProgramTestCase):
         filenames = os.listdir(os.path.join(self.dest))
         self.assertSetEqual(set(filenames), set(exp_filenames))
 
+    def test_auto_max_workers(self):
+        dict_conf = {
+            'suites': {},
+            'test': {
+                'suites': [],
+                'concurrency': {
+                    'max_workers': 'auto',
+                    'worker_bounds': [2, 3]
+                }
+            }
+        }
+        program = unishark.DefaultTestProgram(dict_conf)
+        self.assertIn(program.concurrency['max_workers'], (2, 3))
+
     def test_multithreading_on_suites(self):
         dict_conf = {
             'suites': {
@@ -727,5 +744,273 @@ class DefaultTestProgramTestCase(TestProgramTestCase):
         self.assertFalse(os.path.exists(self.dest))
 
 
+    def test_loader_options(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock1',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_module1']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1'],
+                'loader': {
+                    'cache_dir': os.path.join(self.dest, 'cache')
+                }
+            }
+        }
+        program = unishark.DefaultTestProgram(dict_conf)
+        self.assertDictEqual(program.loader_options, {'cache_dir': os.path.join(self.dest, 'cache')})
+        self.assertEqual(program.run(), 0)
+        self.assertListEqual(os.listdir(os.path.join(self.dest, 'cache')), ['tests.mock1.test_module1.json'])
+        dict_conf['test']['loader'] = {'no_such_option': True}
+        with self.assertRaises(KeyError):
+            unishark.DefaultTestProgram(dict_conf)
+
+    def test_pipeline(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock2',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_module3']
+                        }
+                    }
+                },
+                'my_suite_2': {
+                    'package': 'tests.mock2',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'class',
+                            'classes': ['test_module3.MyTestClass5']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1', 'my_suite_2'],
+                'pipeline': True
+            }
+        }
+        program = unishark.DefaultTestProgram(dict_conf)
+        self.assertTrue(program.pipeline)
+        self.assertEqual(program.run(), 0)
+        dict_conf['test']['concurrency'] = {'max_workers': 2}
+        program = unishark.DefaultTestProgram(dict_conf)
+        self.assertEqual(program.run(), 0)
+
+    def test_pipeline_loads_next_suite_while_running(self):
+        path = tempfile.mkdtemp()
+        files = {
+            '__init__.py': '',
+            # Passes only if the next suite is loaded while it runs.
+            'test_a.py': 'import sys\nimport time\nimport unittest\n\n\nclass A(unittest.TestCase):\n'
+                         '    def test_next_suite_loaded(self):\n'
+                         '        deadline = time.time() + 5\n'
+                         '        while "pipeline_mock.test_b" not in sys.modules and time.time() < deadline:\n'
+                         '            time.sleep(0.01)\n'
+                         '        self.assertIn("pipeline_mock.test_b", sys.modules)\n',
+            'test_b.py': 'import unittest\n\n\nclass B(unittest.TestCase):\n    def test_1(self):\n        pass\n'
+        }
+        os.mkdir(os.path.join(path, 'pipeline_mock'))
+        for name, content in files.items():
+            with open(os.path.join(path, 'pipeline_mock', name), 'w') as f:
+                f.write(content)
+        sys.path.insert(0, path)
+        try:
+            dict_conf = {
+                'suites': {
+                    'my_suite_%s' % name: {
+                        'package': 'pipeline_mock',
+                        'groups': {'g1': {'granularity': 'module', 'modules': ['test_%s' % name]}}
+                    } for name in ('a', 'b')
+                },
+                'test': {
+                    'suites': ['my_suite_a', 'my_suite_b'],
+                    'pipeline': True
+                }
+            }
+            self.assertEqual(unishark.DefaultTestProgram(dict_conf, verbosity=0).run(), 0)
+        finally:
+            sys.path.remove(path)
+            for name in [name for name in sys.modules if name.startswith('pipeline_mock')]:
+                del sys.modules[name]
+            shutil.rmtree(path)
+
+    def test_durations(self):
+        os.makedirs(self.dest)
+        path = os.path.join(self.dest, 'durations.json')
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock3',
+                    'concurrency': {
+                        'max_workers': 2,
+                        'level': 'class',
+                        'type': 'processes'
+                    },
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_concur1', 'test_concur2']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1'],
+                'durations': path
+            }
+        }
+        unishark.contexts.set('tests.mock3', [])
+        self.assertEqual(unishark.DefaultTestProgram(dict_conf).run(), 0)
+        durations = unishark.DurationStore(path)
+        self.assertEqual(len(durations.tests), 8)
+        self.assertGreater(durations.get_test_duration('tests.mock3.test_concur1.Class1.test_case_1'), 0.4)
+        self.assertGreater(durations.get_fixture_duration('tests.mock3.test_concur1.setUpModule'), 0.05)
+        self.assertGreater(durations.get_fixture_duration('tests.mock3.test_concur1.Class1.tearDownClass'), 0.05)
+        # The recorded durations are used to plan the batches of classes in the next run.
+        self.assertEqual(unishark.DefaultTestProgram(dict_conf).run(), 0)
+
+    def test_max_failures(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock3',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'class',
+                            'classes': ['test_failfast1.Class1']
+                        }
+                    }
+                },
+                'my_suite_2': {
+                    'package': 'tests.mock3',
+                    'groups': {
+                        'g1': {
+                            'granularity': 'class',
+                            'classes': ['test_failfast1.Class2']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1', 'my_suite_2'],
+                'max_failures': 2
+            }
+        }
+        unishark.contexts.set('tests.mock3', [])
+        program = unishark.DefaultTestProgram(dict_conf)
+        self.assertEqual(program.run(), 1)
+        self.assertEqual(program.failure_limit.count, 2)
+        # my_suite_2 is not run once my_suite_1 has 2 failed tests.
+        self.assertNotIn('test_failfast1.Class2.setUpClass', unishark.contexts.get('tests.mock3'))
+        dict_conf['test']['concurrency'] = {'max_workers': 2, 'type': 'processes'}
+        dict_conf['test']['failfast'] = True
+        del dict_conf['test']['max_failures']
+        unishark.contexts.set('tests.mock3', [])
+        program = unishark.DefaultTestProgram(dict_conf)
+        self.assertEqual(program.run(), 1)
+        self.assertTrue(program.failure_limit.reached)
+
+    def test_fork_suites_with_threads(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock3',
+                    'concurrency': {
+                        'max_workers': 2,
+                        'level': 'class',
+                        'type': 'fork'
+                    },
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_concur1']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1'],
+                'reporters': []
+            }
+        }
+        self.assertListEqual(unishark.DefaultTestProgram(dict_conf).fork_suites, ['my_suite_1'])
+        # The combinations always running other threads are refused before running anything.
+        for key, value in (('pipeline', True), ('distributed', {'authkey': 'secret'}),
+                           ('concurrency', {'max_workers': 2, 'type': 'threads'})):
+            conf = copy.deepcopy(dict_conf)
+            conf['test'][key] = value
+            with self.assertRaises(ValueError):
+                unishark.DefaultTestProgram(conf)
+        conf = copy.deepcopy(dict_conf)
+        conf['test']['concurrency'] = {'max_workers': 2, 'type': 'processes'}
+        self.assertListEqual(unishark.DefaultTestProgram(conf).fork_suites, ['my_suite_1'])
+
+    def test_distributed(self):
+        dict_conf = {
+            'suites': {
+                'my_suite_1': {
+                    'package': 'tests.mock3',
+                    'concurrency': {
+                        'max_workers': 2,
+                        'level': 'class',
+                        'type': 'distributed'
+                    },
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_concur1']
+                        }
+                    }
+                },
+                'my_suite_2': {
+                    'package': 'tests.mock3',
+                    'concurrency': {
+                        'max_workers': 2,
+                        'level': 'module',
+                        'type': 'distributed'
+                    },
+                    'groups': {
+                        'g1': {
+                            'granularity': 'module',
+                            'modules': ['test_concur2']
+                        }
+                    }
+                }
+            },
+            'test': {
+                'suites': ['my_suite_1', 'my_suite_2'],
+                'concurrency': {'max_workers': 2},
+                'distributed': {
+                    'address': 'localhost:0',
+                    'authkey': 'secret',
+                    'local_workers': 2
+                }
+            }
+        }
+        unishark.contexts.set('tests.mock3', [])
+        program = unishark.DefaultTestProgram(dict_conf)
+        self.assertEqual(program.run(), 0)
+        self.assertIsNone(program.coordinator)
+        dict_conf['test']['concurrency'] = {'max_workers': 2, 'type': 'processes'}
+        with self.assertRaises(ValueError):
+            unishark.DefaultTestProgram(dict_conf)
+        dict_conf['test']['concurrency'] = {'max_workers': 1}
+        dict_conf['test']['distributed'] = {'address': '0.0.0.0:0', 'local_workers': 2}
+        with self.assertRaises(ValueError):
+            unishark.DefaultTestProgram(dict_conf)
+        dict_conf['test']['distributed']['workers'] = 2
+        with self.assertRaises(KeyError):
+            unishark.DefaultTestProgram(dict_conf)
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
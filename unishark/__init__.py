@@ -16,14 +16,21 @@ __all__ = ['DefaultTestLoader',
            'out', 'BufferedTestResult', 'BufferedTestRunner',
            'HtmlReporter', 'XUnitReporter',
            'main', 'DefaultTestProgram',
-           'data_driven', 'multi_threading_data_driven',
+           'data_driven', 'multi_threading_data_driven', 'timeout', 'resources',
            'ContextManager', 'contexts']
 
 from unishark.result import (out, BufferedTestResult)
 from unishark.reporter import (Reporter, HtmlReporter, XUnitReporter)
 from unishark.runner import BufferedTestRunner
+from unishark.suite import RunOptions
 from unishark.loader import DefaultTestLoader
-from unishark.decorator import data_driven, multi_threading_data_driven
+from unishark.discovery import DiscoveryEngine
+from unishark.durations import DurationStore
+from unishark.scheduler import FailureLimit
+from unishark.autoscale import Autoscaler
+from unishark.distributed import Coordinator, run_worker
+from unishark.daemon import TestDaemon, WarmFixtures, run_in_daemon
+from unishark.decorator import data_driven, multi_threading_data_driven, timeout, resources
 from unishark.util import ContextManager, contexts
 from unishark.main import (TestProgram, DefaultTestProgram, main)
 
@@ -0,0 +1,243 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Requires Python 3.7+. Only imported by unishark.suite when the concurrency type is 'asyncio'.
+
+import asyncio
+import concurrent.futures
+import contextvars
+import inspect
+import traceback
+import unittest
+from unittest.case import SkipTest
+import sys
+import time
+from unishark.suite import TestSuite, LazyTestCase, _call_if_exists
+from unishark.plan import SETUP, RUN
+from unishark.result import combine_results, count_failures, buffer_context
+from unishark.watchdog import call_with_timeout
+from unishark.exception import TimeoutExpired
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        await value
+
+
+async def _await_with_timeout(coro, timeout, name):
+    # Cancels the coroutine and raises TimeoutExpired with its stack if it is not finished within timeout seconds.
+    task = asyncio.ensure_future(coro)
+    done, pending = await asyncio.wait([task], timeout=timeout)
+    if pending:
+        stack = _get_coroutine_stack(coro)
+        task.cancel()
+        raise TimeoutExpired(name, timeout, stack)
+    task.result()
+
+
+def _get_coroutine_stack(coro):
+    # Follows the chain of awaited coroutines (or generators) down to the innermost one.
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return ''.join(traceback.format_list(traceback.StackSummary.extract(frames)))
+
+
+def _is_isolated_case(test):
+    # An IsolatedAsyncioTestCase (Python 3.8+) runs its own event loop, which cannot run in the thread of the engine.
+    isolated_case_class = getattr(unittest, 'IsolatedAsyncioTestCase', None)
+    return isolated_case_class is not None and isinstance(test, isolated_case_class)
+
+
+def _is_async_case(test):
+    return any(inspect.iscoroutinefunction(getattr(test, attr, None))
+               for attr in (test._testMethodName, 'setUp', 'tearDown'))
+
+
+class AsyncioEngine(object):
+    """
+    Runs a well-formed TestSuite on one event loop.
+    Test methods, setUp/tearDown, setUpClass/tearDownClass and setUpModule/tearDownModule can be coroutine functions.
+    The modules, classes or methods (depending on concurrency_level) run as tasks interleaved on the loop,
+    and a semaphore of max_workers bounds how many of them run at the same time.
+    Test methods which are not coroutine functions run as usual, blocking the loop until they finish.
+    An IsolatedAsyncioTestCase runs as usual with its own event loop, in a thread so that the loop is not blocked.
+    """
+    def __init__(self, suite, concurrency_level, max_workers):
+        if max_workers <= 0:
+            raise ValueError('max_workers must be greater than 0.')
+        self.suite = suite
+        self.concurrency_level = concurrency_level
+        self.max_workers = max_workers
+        self._semaphore = None
+
+    def run(self, result, timeout=None):
+        """Raises concurrent.futures.TimeoutError if the suite is not finished within timeout seconds."""
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(asyncio.wait_for(self._main(result), timeout))
+        except asyncio.TimeoutError:
+            raise concurrent.futures.TimeoutError('Tests are not finished in %r seconds.' % timeout)
+        finally:
+            if hasattr(loop, 'shutdown_default_executor'):
+                loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+        return result
+
+    async def _main(self, result):
+        # The semaphore is created in the running loop.
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        await self._run(self.suite, result, TestSuite.ROOT_LEVEL)
+
+    async def _run(self, test, result, current_level):
+        if current_level == self.concurrency_level:
+            async with self._semaphore:
+                await self._seq_run(test, result)
+            return
+        results = result.children
+        if current_level == TestSuite.CLASS_LEVEL:
+            entry = self.suite._get_entry(test, current_level)
+            coros = [self._run_method(entry, t, r) for t, r in zip(test, results)]
+        else:
+            coros = [self._run_with_fixtures(t, r, current_level+1) for t, r in zip(test, results)]
+        await asyncio.gather(*coros)
+        combine_results(result, results)
+
+    async def _run_with_fixtures(self, test, result, current_level):
+        if self.suite.stopped:
+            return
+        entry = self.suite._get_entry(test, current_level)
+        await self._call_fixture(result, self.suite._get_fixture(entry, entry.setup_attr))
+        await self._run(test, result, current_level)
+        await self._call_fixture(result, self.suite._get_fixture(entry, entry.teardown_attr))
+
+    async def _run_method(self, entry, test, result):
+        async with self._semaphore:
+            if not self.suite.stopped and not self.suite._is_blocked(entry):
+                await self._run_case(test, result)
+
+    async def _seq_run(self, test, result):
+        # The same as TestSuite._seq_run, awaiting the coroutine fixtures and tests.
+        plan, index, end = self.suite._get_span(test)
+        steps = plan.steps
+        while index < end:
+            op, entry, arg = steps[index]
+            if op == RUN:
+                if not self.suite.stopped and not self.suite._is_blocked(entry):
+                    await self._run_case(arg, result)
+            elif op == SETUP:
+                if self.suite.stopped:
+                    index = arg + 1
+                    continue
+                await self._call_fixture(result, self.suite._get_fixture(entry, entry.setup_attr))
+            else:
+                await self._call_fixture(result, self.suite._get_fixture(entry, entry.teardown_attr))
+            index += 1
+
+    async def _call_fixture(self, result, fixture):
+        if fixture is None or self.suite._hold_module_fixture(fixture):
+            return
+        fixture_name, fn, error_name, current_class = fixture
+        _call_if_exists(result, '_setupStdout')
+        start_time = time.time()
+        timeout = self.suite._get_fixture_timeout(fn)
+        try:
+            if timeout is None:
+                await _maybe_await(fn())
+            elif inspect.iscoroutinefunction(fn):
+                await _await_with_timeout(fn(), timeout, fixture_name)
+            else:
+                call_with_timeout(fn, timeout, fixture_name)
+            self.suite._add_successful_fixture(fixture)
+        except Exception as e:
+            self.suite._fail_fixture(result, e, fixture)
+        finally:
+            result.fixture_durations[fixture_name] = time.time() - start_time
+            _call_if_exists(result, '_restoreStdout')
+
+    async def _run_case(self, test, result):
+        # Each test writes to its own output buffer, though the tests interleave in one thread.
+        buffer_context.set(object())
+        if isinstance(test, LazyTestCase):
+            test = test.factory()
+        if _is_isolated_case(test):
+            # The context is copied, so that the test writes to its buffer in the thread.
+            await asyncio.get_event_loop().run_in_executor(None, contextvars.copy_context().run,
+                                                           self.suite._run_test, test, result)
+            return
+        if not _is_async_case(test):
+            self.suite._run_test(test, result)
+            return
+        timeout = self.suite._get_test_timeout(test)
+        count_before = count_failures(result)
+        result.startTest(test)
+        try:
+            if timeout is None:
+                await _run_async_case(test, result)
+            else:
+                await _await_with_timeout(_run_async_case(test, result), timeout, test.id())
+        except TimeoutExpired:
+            result.addError(test, sys.exc_info())
+        finally:
+            result.stopTest(test)
+            self.suite._add_failures(result, count_before)
+
+
+async def _run_async_case(test, result):
+    # Almost the same as unittest.case.TestCase.run, except awaiting the coroutines.
+    method = getattr(test, test._testMethodName)
+    if getattr(test.__class__, '__unittest_skip__', False) or getattr(method, '__unittest_skip__', False):
+        reason = (getattr(test.__class__, '__unittest_skip_why__', '')
+                  or getattr(method, '__unittest_skip_why__', ''))
+        result.addSkip(test, reason)
+        return
+    expecting_failure = (getattr(method, '__unittest_expecting_failure__', False)
+                         or getattr(test, '__unittest_expecting_failure__', False))
+    outcome = {'success': True, 'skipped': False}
+
+    async def execute(fn, *args, **kwargs):
+        try:
+            await _maybe_await(fn(*args, **kwargs))
+            return True
+        except asyncio.CancelledError:
+            raise
+        except SkipTest as e:
+            outcome['skipped'] = True
+            result.addSkip(test, str(e))
+        except Exception:
+            outcome['success'] = False
+            if expecting_failure:
+                result.addExpectedFailure(test, sys.exc_info())
+            elif isinstance(sys.exc_info()[1], test.failureException):
+                result.addFailure(test, sys.exc_info())
+            else:
+                result.addError(test, sys.exc_info())
+        return False
+
+    if await execute(test.setUp):
+        await execute(method)
+        await execute(test.tearDown)
+    cleanups = getattr(test, '_cleanups', [])
+    while cleanups:
+        fn, args, kwargs = cleanups.pop()
+        await execute(fn, *args, **kwargs)
+    if outcome['success'] and not outcome['skipped']:
+        if expecting_failure:
+            result.addUnexpectedSuccess(test)
+        else:
+            result.addSuccess(test)
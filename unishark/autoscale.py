@@ -0,0 +1,155 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import math
+import time
+import multiprocessing
+import logging
+
+log = logging.getLogger(__name__)
+
+# The value of max_workers which lets unishark decide the number of workers.
+AUTO = 'auto'
+
+# The mount point of the cgroup file systems.
+CGROUP_DIR = '/sys/fs/cgroup'
+
+# A cgroup v1 memory limit at or above this is not a limit.
+_UNLIMITED_MEMORY = 1 << 60
+
+
+def _read_line(*parts):
+    try:
+        with open(os.path.join(CGROUP_DIR, *parts), 'r') as f:
+            return f.readline().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _cpu_quota():
+    # Returns the CPU quota of the cgroup in CPUs, or None if not limited.
+    line = _read_line('cpu.max')  # cgroup v2, like 'max 100000' or '200000 100000'
+    if line:
+        quota, period = line.split()[:2]
+        return None if quota == 'max' else int(quota) / float(period)
+    quota, period = _read_line('cpu', 'cpu.cfs_quota_us'), _read_line('cpu', 'cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / float(period)
+    return None
+
+
+def cpu_limit():
+    """Returns the number of CPUs this process can use, bounded by its CPU affinity and its cgroup CPU quota."""
+    if hasattr(os, 'sched_getaffinity'):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = multiprocessing.cpu_count()
+    quota = _cpu_quota()
+    if quota is not None:
+        count = min(count, max(1, int(math.ceil(quota))))
+    return count
+
+
+def memory_usage():
+    """Returns (used bytes, limit bytes) of the cgroup of this process, or None if its memory is not limited."""
+    limit, used = _read_line('memory.max'), _read_line('memory.current')  # cgroup v2
+    if limit is None:
+        limit, used = _read_line('memory', 'memory.limit_in_bytes'), _read_line('memory', 'memory.usage_in_bytes')
+    if not limit or not used or limit == 'max' or int(limit) >= _UNLIMITED_MEMORY:
+        return None
+    return int(used), int(limit)
+
+
+def default_bounds():
+    """Returns the default (min, max) number of workers, the same max as concurrent.futures.ThreadPoolExecutor."""
+    return 1, min(32, cpu_limit() + 4)
+
+
+def _process_cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+class Autoscaler(object):
+    """
+    Decides the number of worker threads of a WorkStealingScheduler from its live utilization,
+    within bounds (min workers, max workers).
+    At every interval, the scheduler reports its workers, its busy workers, whether tasks are queued
+    and how many tasks are done, and gets the number of workers for the next interval:
+    - The workers shrink while the cgroup memory is nearly used up (memory_high of the limit).
+    - The workers grow while all of them are busy, tasks are queued, the CPUs are not saturated,
+      and growing raises the throughput (done tasks per second), which is not the case for CPU bound tests
+      holding the GIL. A grow which does not raise the throughput is reverted, and tried again after a cooldown.
+    - The workers shrink to the CPUs available while the CPUs are saturated.
+    """
+    def __init__(self, bounds=None, interval=0.5, memory_high=0.9, min_gain=0.1, cooldown=10):
+        self.min_workers, self.max_workers = bounds or default_bounds()
+        if self.min_workers < 1 or self.min_workers > self.max_workers:
+            raise ValueError('Worker bounds (%r, %r) must satisfy 1 <= min <= max.'
+                             % (self.min_workers, self.max_workers))
+        self.interval = interval
+        self.memory_high = memory_high
+        self.min_gain = min_gain
+        self.cooldown = cooldown
+        self.cpus = cpu_limit()
+        self._last_sample = None  # (wall time, process CPU time, done tasks)
+        self._probe = None  # (workers before the last grow, throughput before it)
+        self._cooldown_left = 0
+
+    def _clamp(self, count):
+        return max(self.min_workers, min(self.max_workers, count))
+
+    def initial_workers(self, concurrency_type='threads'):
+        """
+        Returns the number of workers to start with. The workers of other concurrency types than threads
+        are not resized, so they keep this number: the CPUs available, or the max with asyncio.
+        """
+        if concurrency_type == 'asyncio':
+            return self.max_workers
+        return self._clamp(self.cpus)
+
+    def update(self, workers, busy, queued, done):
+        """Samples the utilization since the last update and returns the number of workers for the next interval."""
+        now, cpu_time = time.time(), _process_cpu_time()
+        last, self._last_sample = self._last_sample, (now, cpu_time, done)
+        if last is None or now <= last[0]:
+            return workers
+        elapsed = now - last[0]
+        return self.decide(workers, busy, queued, (done - last[2]) / elapsed, (cpu_time - last[1]) / elapsed,
+                           memory_usage())
+
+    def decide(self, workers, busy, queued, throughput, cpu_rate, memory):
+        """
+        Returns the number of workers for the next interval.
+        throughput is the number of tasks done per second, cpu_rate the number of CPUs used by the process,
+        and memory (used bytes, limit bytes) or None.
+        """
+        probe, self._probe = self._probe, None
+        if memory is not None and memory[0] >= self.memory_high * memory[1]:
+            return self._clamp(workers - 1)
+        if cpu_rate >= 0.9 * self.cpus:
+            return self._clamp(min(workers, self.cpus))
+        if probe is not None and throughput < probe[1] * (1 + self.min_gain):
+            log.debug('Growing to %d workers did not raise the throughput.' % workers)
+            self._cooldown_left = self.cooldown
+            return self._clamp(probe[0])
+        if self._cooldown_left > 0:
+            self._cooldown_left -= 1
+            return workers
+        if not queued or busy < workers or workers >= self.max_workers:
+            return workers
+        self._probe = workers, throughput
+        return self._clamp(workers + max(1, workers // 2))
@@ -0,0 +1,284 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import sys
+import copy
+import json
+import shutil
+import tempfile
+import threading
+import traceback
+import sysconfig
+import pyclbr
+import linecache
+from multiprocessing.connection import Listener, Client
+import logging
+from unishark.main import DefaultTestProgram
+from unishark.distributed import parse_address, make_authkey, check_authkey, _wake_up
+
+log = logging.getLogger(__name__)
+
+# The messages between a daemon and a client.
+_RUN = 'run'
+_STOP = 'stop'
+_RESULT = 'result'
+_DONE = 'done'
+_ERROR = 'error'
+
+# The modules under these directories are installed, and are not imported again by a daemon.
+_INSTALL_DIRS = tuple(set(os.path.abspath(d) for d in [sys.prefix, sys.exec_prefix,
+                                                       getattr(sys, 'base_prefix', sys.prefix)] +
+                          [sysconfig.get_paths()[key] for key in ('stdlib', 'platstdlib', 'purelib', 'platlib')]))
+
+
+def _get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class WarmFixtures(object):
+    """
+    Module fixtures kept set up across the runs in one process.
+    A module kept set up skips its setUpModule in the next runs, and its tearDownModule is deferred until teardown().
+    A module imported again (e.g. after its source file changed) is set up again.
+    """
+    def __init__(self):
+        self._modules = dict()  # key: module name, value: (module object, tearDownModule or None)
+        self._lock = threading.Lock()
+
+    def is_set_up(self, module_name):
+        with self._lock:
+            kept = self._modules.get(module_name)
+        return kept is not None and kept[0] is sys.modules.get(module_name)
+
+    def keep(self, module_name, teardown=None):
+        with self._lock:
+            self._modules[module_name] = sys.modules.get(module_name), teardown
+
+    def teardown(self, module_names=None):
+        """Calls the deferred tearDownModule of the given modules (or of all the modules kept)."""
+        with self._lock:
+            names = list(self._modules) if module_names is None else [n for n in module_names if n in self._modules]
+            kept = [(name, self._modules.pop(name)) for name in names]
+        for name, (module, teardown) in kept:
+            if teardown is None:
+                continue
+            try:
+                teardown()
+            except Exception:
+                log.error('tearDownModule of %r failed.' % name, exc_info=True)
+
+
+class TestDaemon(object):
+    """
+    A long-lived process running the test configs sent by clients (see run_in_daemon), one run at a time.
+    The test modules stay imported and the discovered name trees stay cached between the runs,
+    so a run only pays for the tests. Before each run, the modules imported by the previous runs
+    (except the installed ones) are dropped to be imported again if any of their source files changed.
+    If keep_fixtures is True, the module fixtures are kept set up across the runs (see WarmFixtures).
+    Without an authkey, a random one is generated (see the authkey attribute) if address is a loopback address.
+    Without a cache_dir, the name trees are cached in a temporary directory removed when the daemon stops.
+    """
+    def __init__(self, address=('localhost', 0), authkey=None, keep_fixtures=False, cache_dir=None):
+        address = parse_address(address)
+        self.authkey = make_authkey(authkey, address[0])
+        self._listener = Listener(address, authkey=self.authkey)
+        self.address = self._listener.address
+        self.warm_fixtures = WarmFixtures() if keep_fixtures else None
+        self._own_cache_dir = cache_dir is None
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix='unishark-daemon-')
+        self.runs = 0
+        self._baseline_modules = set(sys.modules)
+        self._tracked_modules = dict()  # key: module name, value: (source file, mtime) when imported
+        self._run_lock = threading.Lock()
+        self._stopped = threading.Event()
+        log.info('Test daemon is listening on %s:%d.' % self.address)
+
+    def serve_forever(self):
+        """Serves the clients until a client stops the daemon. Each client is served in its own thread."""
+        while not self._stopped.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._stopped.is_set():
+                    break
+                log.warning('Failed to accept a client.', exc_info=True)
+                continue
+            if self._stopped.is_set():
+                conn.close()
+                break
+            client = threading.Thread(target=self._serve, args=(conn,), name='unishark-daemon-client')
+            client.daemon = True
+            client.start()
+        with self._run_lock:
+            if self.warm_fixtures is not None:
+                self.warm_fixtures.teardown()
+        self._listener.close()
+        if self._own_cache_dir:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def stop(self):
+        self._stopped.set()
+        # Wakes up serve_forever.
+        _wake_up(self.address)
+
+    def run(self, dict_conf, verbosity=1, descriptions=False, result_listener=None):
+        """Runs a test config in the daemon process and returns the exit code. Runs are queued."""
+        with self._run_lock:
+            self._refresh_modules()
+            dict_conf = copy.deepcopy(dict_conf)
+            loader_options = dict_conf['test'].setdefault('loader', dict()) or dict()
+            loader_options.setdefault('cache_dir', self.cache_dir)
+            dict_conf['test']['loader'] = loader_options
+            program = DefaultTestProgram(dict_conf, verbosity=verbosity, descriptions=descriptions)
+            if program.fork_suites:
+                raise ValueError('The test daemon serves its clients in threads, so it cannot run the suite(s) %r '
+                                 'with concurrency type fork.' % program.fork_suites)
+            program.warm_fixtures = self.warm_fixtures
+            if result_listener is not None:
+                program.result_listeners.append(result_listener)
+            try:
+                return program.run()
+            finally:
+                self.runs += 1
+                self._track_modules()
+
+    def _serve(self, conn):
+        try:
+            message = conn.recv()
+            if message[0] == _STOP:
+                self.stop()
+                conn.send((_DONE, 0))
+                return
+            _, dict_conf, verbosity, descriptions = message
+            try:
+                exit_code = self.run(dict_conf, verbosity, descriptions,
+                                     result_listener=lambda result: conn.send((_RESULT, result)))
+            except Exception:
+                log.error('Failed to run the test config.', exc_info=True)
+                conn.send((_ERROR, RuntimeError(traceback.format_exc())))
+                return
+            conn.send((_DONE, exit_code))
+        except (EOFError, IOError, OSError):
+            log.warning('Lost a client.', exc_info=True)
+        finally:
+            conn.close()
+
+    def _track_modules(self):
+        # Keeps the source files of the modules imported by the runs, except the installed ones.
+        for name, module in list(sys.modules.items()):
+            if name in self._baseline_modules or name in self._tracked_modules:
+                continue
+            path = getattr(module, '__file__', None)
+            if not path or os.path.abspath(path).startswith(_INSTALL_DIRS):
+                continue
+            self._tracked_modules[name] = path, _get_mtime(path)
+
+    def _refresh_modules(self):
+        # Drops all the tracked modules if any of them changed, so that none of them refers to stale code.
+        changed = [name for name, (path, mtime) in self._tracked_modules.items() if _get_mtime(path) != mtime]
+        if not changed:
+            return
+        log.info('Modules changed: %r. Importing the tests again.' % sorted(changed))
+        names = list(self._tracked_modules)
+        if self.warm_fixtures is not None:
+            self.warm_fixtures.teardown(names)
+        for name in names:
+            sys.modules.pop(name, None)
+            # pyclbr (the default discovery engine) caches the modules it read.
+            getattr(pyclbr, '_modules', dict()).pop(name, None)
+        linecache.checkcache()
+        self._tracked_modules.clear()
+
+
+def run_in_daemon(address, dict_conf, authkey, verbosity=1, descriptions=False, reporters=None,
+                  result_listener=None):
+    """
+    Sends a test config to the daemon at address (a (host, port) tuple or 'host:port') with its authkey,
+    and returns the exit code.
+    The result of each suite is streamed back as soon as the suite is done, passed to result_listener
+    and reported by the reporters, which run in this process.
+    The reporters configured in the test config run in the daemon process.
+    """
+    conn = Client(parse_address(address), authkey=check_authkey(authkey))
+    try:
+        conn.send((_RUN, dict_conf, verbosity, descriptions))
+        while True:
+            status, value = conn.recv()
+            if status == _RESULT:
+                if result_listener is not None:
+                    result_listener(value)
+                for reporter in reporters or ():
+                    reporter.report(value)
+            elif status == _DONE:
+                for reporter in reporters or ():
+                    reporter.collect()
+                return value
+            else:
+                raise value
+    finally:
+        conn.close()
+
+
+def stop_daemon(address, authkey):
+    conn = Client(parse_address(address), authkey=check_authkey(authkey))
+    try:
+        conn.send((_STOP,))
+        conn.recv()
+    finally:
+        conn.close()
+
+
+def _load_config(path):
+    with open(path, 'r') as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('PyYAML is required to read the config %r. Install it, or use a .json config.' % path)
+        return yaml.safe_load(f)
+
+
+def _print_result(result):
+    sys.stderr.write('%s: ran %d test(s) in %.3fs, %d failure(s), %d error(s), %d skipped\n'
+                     % (result.name, result.testsRun, result.sum_duration,
+                        len(result.failures), len(result.errors), len(result.skipped)))
+
+
+if __name__ == '__main__':
+    # python -m unishark.daemon serve host:port [authkey] [--keep-fixtures]
+    # python -m unishark.daemon run host:port config.(yaml|json) authkey
+    # python -m unishark.daemon stop host:port authkey
+    args = [arg for arg in sys.argv[1:] if arg != '--keep-fixtures']
+    logging.basicConfig(level=logging.INFO)
+    if len(args) in (2, 3) and args[0] == 'serve':
+        daemon = TestDaemon(args[1], args[2] if len(args) == 3 else None, keep_fixtures='--keep-fixtures' in sys.argv)
+        if len(args) == 2:
+            # The generated authkey is only printed to the terminal of the user, never logged.
+            sys.stdout.write('authkey: %s\n' % daemon.authkey.decode('ascii'))
+            sys.stdout.flush()
+        daemon.serve_forever()
+    elif len(args) == 4 and args[0] == 'run':
+        sys.exit(run_in_daemon(args[1], _load_config(args[2]), args[3], result_listener=_print_result))
+    elif len(args) == 3 and args[0] == 'stop':
+        stop_daemon(args[1], args[2])
+    else:
+        sys.stderr.write('Usage: python -m unishark.daemon (serve host:port [authkey] [--keep-fixtures] | '
+                         'run host:port config authkey | stop host:port authkey)\n')
+        sys.exit(2)
@@ -20,6 +20,8 @@ import threading
 from unishark.util import exc_info_to_string
 from unishark.runner import out
 from unishark.exception import MultipleErrors
+from unishark.watchdog import TIMEOUT_ATTR
+from unishark.scheduler import RESOURCES_ATTR
 
 
 def data_driven(*list_of_dicts, **dict_of_lists):
@@ -87,6 +89,37 @@ def multi_threading_data_driven(max_workers, *list_of_dicts, **dict_of_lists):
     return decorator
 
 
+def timeout(seconds):
+    """
+    Sets the timeout in seconds of a test method, of each test method in a test class,
+    or of a fixture like setUpModule or setUpClass (put it below @classmethod),
+    overriding the test_timeout or fixture_timeout of the suite.
+    """
+    if seconds is not None and seconds <= 0:
+        raise ValueError('timeout <= 0.')
+
+    def decorator(obj):
+        setattr(obj, TIMEOUT_ATTR, seconds)
+        return obj
+    return decorator
+
+
+def resources(*names):
+    """
+    Tags a test method or a test class with the names of the resources it holds while it runs,
+    e.g. @unishark.resources('db'). A suite with a capacity for a resource runs at most that many tests
+    (or classes or modules, depending on the concurrency level) holding it at the same time.
+    A module is tagged with a module attribute like __unishark_resources__ = ['db'].
+    """
+    if not names:
+        raise ValueError('At least one resource name must be given.')
+
+    def decorator(obj):
+        setattr(obj, RESOURCES_ATTR, frozenset(names) | frozenset(getattr(obj, RESOURCES_ATTR, ())))
+        return obj
+    return decorator
+
+
 def _fn_with_traceback(fn, *args, **kwargs):
     try:
         fn(*args, **kwargs)
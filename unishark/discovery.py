@@ -0,0 +1,459 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import sys
+import abc
+import ast
+import json
+import errno
+import re
+import pyclbr
+import logging
+import concurrent.futures
+from unishark.util import exc_info_to_string
+
+log = logging.getLogger(__name__)
+
+_AsyncFunctionDef = getattr(ast, 'AsyncFunctionDef', ast.FunctionDef)
+
+_identifier = re.compile(r'^[A-Za-z_]\w*$')
+
+DEFAULT_WALKER_WORKERS = 8
+
+_test_case_class_names = {
+    'unittest.TestCase',
+    'unittest.case.TestCase',
+    'unittest.IsolatedAsyncioTestCase',
+    'unittest.async_case.IsolatedAsyncioTestCase',
+    'unittest2.TestCase',
+    'unittest2.case.TestCase',
+}
+
+
+def get_source_path(full_mod_name):
+    """Returns the path of the .py source file of an imported module, or None if it has no source file."""
+    mod = sys.modules.get(full_mod_name)
+    path = getattr(mod, '__file__', None)
+    if not path:
+        return None
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return path if os.path.isfile(path) else None
+
+
+def find_source_path(full_mod_name):
+    """
+    Returns the path of the .py source file of a module (or the __init__.py of a package)
+    by searching sys.path (or __path__ of the imported parent packages), without importing anything.
+    Raises ImportError if the module cannot be found.
+    """
+    search_paths = sys.path
+    path = None
+    parts = full_mod_name.split('.')
+    for i, part in enumerate(parts):
+        parent_name = '.'.join(parts[:i])
+        if parent_name in sys.modules and getattr(sys.modules[parent_name], '__path__', None) is not None:
+            search_paths = list(sys.modules[parent_name].__path__)
+        path = None
+        for base in search_paths:
+            base = os.path.join(base or os.curdir, part)
+            if os.path.isfile(os.path.join(base, '__init__.py')):
+                path = os.path.join(base, '__init__.py')
+                break
+            if os.path.isfile(base + '.py'):
+                path = base + '.py'
+                break
+        if path is None:
+            raise ImportError('No module named %r' % full_mod_name)
+        search_paths = [os.path.dirname(path)] if path.endswith('__init__.py') else []
+    return path
+
+
+class DiscoveryCache(object):
+    """
+    An on-disk cache of module name trees.
+    Each module has its own json file in cache_dir, keyed by the source path, mtime and size of the module
+    and the name of the discovery engine which built the tree, and validated against the source files
+    the tree depends on, e.g. the modules of the inherited base classes.
+    A module whose source file or any of its dependencies has changed since it was cached is treated as a cache miss.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        try:
+            os.makedirs(cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(cache_dir):
+                raise
+
+    def _entry_path(self, full_mod_name):
+        return os.path.join(self.cache_dir, full_mod_name + '.json')
+
+    @staticmethod
+    def _stat(path):
+        stat = os.stat(path)
+        return [os.path.abspath(path), stat.st_mtime, stat.st_size]
+
+    @staticmethod
+    def _make_key(src_path, engine_name):
+        return DiscoveryCache._stat(src_path) + [engine_name]
+
+    def get(self, full_mod_name, src_path, engine_name):
+        """Returns the cached module tree like {'cls1': ['mth1', 'mth2', ...], ...}, or None if missed."""
+        if not src_path:
+            return None
+        try:
+            with open(self._entry_path(full_mod_name), 'r') as f:
+                entry = json.load(f)
+            key = self.__class__._make_key(src_path, engine_name)
+            if entry.get('key') != key:
+                return None
+            for dep in entry.get('deps', []):
+                if self.__class__._stat(dep[0]) != dep:
+                    return None
+        except (IOError, OSError, ValueError):
+            return None
+        log.debug('Discovery cache hit: %r' % full_mod_name)
+        return entry['tree']
+
+    def put(self, full_mod_name, src_path, engine_name, mod_tree, dep_paths=()):
+        """dep_paths are the source paths of the other modules the module tree depends on."""
+        if not src_path:
+            return
+        entry_path = self._entry_path(full_mod_name)
+        tmp_path = '%s.%d.tmp' % (entry_path, os.getpid())
+        try:
+            entry = {'key': self.__class__._make_key(src_path, engine_name), 'tree': mod_tree,
+                     'deps': [self.__class__._stat(path) for path in dep_paths]}
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            getattr(os, 'replace', os.rename)(tmp_path, entry_path)
+        except (IOError, OSError) as e:
+            log.warning('Failed to cache the name tree of %r: %r' % (full_mod_name, e))
+
+
+class DiscoveryEngine(object):
+    """
+    Base class of all discovery engines.
+    A discovery engine inspects a module and returns its module tree like
+    {'cls1': ['mth1', 'mth2', ...], 'cls2': [...], ...}.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    name = None
+    # Whether the modules must be imported before they are inspected.
+    imports_modules = True
+
+    def get_package_path(self, pkg_name):
+        pkg = __import__(pkg_name)
+        for part in pkg_name.split('.')[1:]:
+            pkg = getattr(pkg, part)
+        return pkg.__path__
+
+    def get_source_path(self, full_mod_name):
+        path = get_source_path(full_mod_name)
+        if path is None:
+            try:
+                path = find_source_path(full_mod_name)
+            except ImportError:
+                pass
+        return path
+
+    @abc.abstractmethod
+    def inspect_module(self, full_mod_name):
+        pass
+
+    def get_dependency_paths(self, full_mod_name):
+        """Returns the source paths of the other modules the tree of an inspected module depends on."""
+        return []
+
+
+class PyclbrDiscoveryEngine(DiscoveryEngine):
+    """Inspects imported modules with pyclbr. Inherited methods are not discovered."""
+    name = 'pyclbr'
+
+    def inspect_module(self, full_mod_name):
+        mod_content = pyclbr.readmodule_ex(full_mod_name)
+        mod_tree = dict()
+        for name, obj in mod_content.items():
+            if isinstance(obj, pyclbr.Class):
+                # obj.methods is a dict of 'method_name': method_line_no
+                mod_tree[name] = sorted(obj.methods.keys(), key=lambda k: obj.methods[k])
+        return mod_tree
+
+
+class AstDiscoveryEngine(DiscoveryEngine):
+    """
+    Inspects modules with a single ast pass per source file, without importing anything.
+    The base classes of a class are resolved within the top level package of the module,
+    so inherited methods are discovered and classes known not to be unittest.TestCase subclasses are left out.
+    """
+    name = 'ast'
+    imports_modules = False
+
+    def __init__(self):
+        # key: full module name, value: a tuple of (classes, aliases), where classes is a dict of
+        # 'class_name': (list of dotted base names, list of method names),
+        # and aliases is a dict of 'local_name': 'dotted name it is imported from'.
+        self._parsed_mods = dict()
+
+    def get_package_path(self, pkg_name):
+        path = find_source_path(pkg_name)
+        if os.path.basename(path) != '__init__.py':
+            raise ValueError('%r is not a package.' % pkg_name)
+        return [os.path.dirname(path)]
+
+    def get_source_path(self, full_mod_name):
+        return find_source_path(full_mod_name)
+
+    def inspect_module(self, full_mod_name):
+        classes, _ = self._parse_module(full_mod_name)
+        mod_tree = dict()
+        for cls_name in classes:
+            if self._is_test_case(full_mod_name, cls_name, set()) is False:
+                continue
+            mod_tree[cls_name] = self._get_method_names(full_mod_name, cls_name, set())
+        return mod_tree
+
+    def _parse_module(self, full_mod_name):
+        if full_mod_name not in self._parsed_mods:
+            path = find_source_path(full_mod_name)
+            with open(path, 'rb') as f:
+                tree = ast.parse(f.read(), path)
+            is_pkg = os.path.basename(path) == '__init__.py'
+            self._parsed_mods[full_mod_name] = self.__class__._parse_tree(full_mod_name, is_pkg, tree)
+        return self._parsed_mods[full_mod_name]
+
+    @staticmethod
+    def _parse_tree(full_mod_name, is_pkg, tree):
+        pkg_name = full_mod_name if is_pkg else full_mod_name.rpartition('.')[0]
+        aliases = dict()
+        classes = dict()
+        for node in tree.body:
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        aliases[alias.asname] = alias.name
+                    else:
+                        top = alias.name.split('.')[0]
+                        aliases[top] = top
+            elif isinstance(node, ast.ImportFrom):
+                mod = node.module or ''
+                if node.level:
+                    base = pkg_name.split('.')
+                    if node.level > 1:
+                        base = base[:1 - node.level]
+                    mod = '.'.join([p for p in base + [mod] if p])
+                for alias in node.names:
+                    aliases[alias.asname or alias.name] = '.'.join((mod, alias.name)) if mod else alias.name
+            elif isinstance(node, ast.ClassDef):
+                bases = []
+                for base in node.bases:
+                    dotted = AstDiscoveryEngine._get_dotted_name(base)
+                    if dotted is not None:
+                        head, _, tail = dotted.partition('.')
+                        if head in aliases:
+                            dotted = '.'.join((aliases[head], tail)) if tail else aliases[head]
+                        elif head in classes:
+                            dotted = '.'.join((full_mod_name, dotted))
+                    bases.append(dotted)
+                mth_names = [n.name for n in node.body if isinstance(n, (ast.FunctionDef, _AsyncFunctionDef))]
+                classes[node.name] = (bases, mth_names)
+        return classes, aliases
+
+    @staticmethod
+    def _get_dotted_name(node):
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+        parts.append(node.id)
+        return '.'.join(reversed(parts))
+
+    def get_dependency_paths(self, full_mod_name):
+        # The modules read to resolve the base classes of the module, including those re-exporting them.
+        mod_names = set()
+        pending = [(full_mod_name, cls_name) for cls_name in self._parse_module(full_mod_name)[0]]
+        seen = set(pending)
+        while pending:
+            mod_name, cls_name = pending.pop()
+            for base in self._parse_module(mod_name)[0][cls_name][0]:
+                resolved = self._resolve_class(mod_name, base, mod_names)
+                if resolved is not None and resolved not in seen:
+                    seen.add(resolved)
+                    pending.append(resolved)
+        mod_names.discard(full_mod_name)
+        return sorted(find_source_path(mod_name) for mod_name in mod_names)
+
+    def _resolve_class(self, full_mod_name, dotted_name, read_mod_names=None):
+        # Returns (module name, class name) of a base class defined in the same top level package, or None.
+        # The names of the modules read are added to read_mod_names.
+        top_pkg_name = full_mod_name.split('.')[0]
+        seen = set()
+        while dotted_name and dotted_name.split('.')[0] == top_pkg_name and dotted_name not in seen:
+            seen.add(dotted_name)
+            mod_name, _, cls_name = dotted_name.rpartition('.')
+            try:
+                classes, aliases = self._parse_module(mod_name)
+            except (ImportError, IOError, SyntaxError):
+                return None
+            if read_mod_names is not None:
+                read_mod_names.add(mod_name)
+            if cls_name in classes:
+                return mod_name, cls_name
+            # The class might be re-exported by the module, e.g. "from .base import BaseTestCase"
+            dotted_name = aliases.get(cls_name)
+        return None
+
+    def _is_test_case(self, full_mod_name, cls_name, visited):
+        # Returns True or False if it is known whether the class is a unittest.TestCase subclass, otherwise None.
+        if (full_mod_name, cls_name) in visited:
+            return False
+        visited.add((full_mod_name, cls_name))
+        bases, _ = self._parse_module(full_mod_name)[0][cls_name]
+        unknown = False
+        for base in bases:
+            if base in _test_case_class_names:
+                return True
+            resolved = self._resolve_class(full_mod_name, base)
+            if resolved is None:
+                if base not in ('object', 'builtins.object', '%s.object' % full_mod_name):
+                    unknown = True
+                continue
+            is_case = self._is_test_case(resolved[0], resolved[1], visited)
+            if is_case:
+                return True
+            if is_case is None:
+                unknown = True
+        return None if unknown else False
+
+    def _get_method_names(self, full_mod_name, cls_name, visited):
+        if (full_mod_name, cls_name) in visited:
+            return []
+        visited.add((full_mod_name, cls_name))
+        bases, mth_names = self._parse_module(full_mod_name)[0][cls_name]
+        mth_names = list(mth_names)
+        for base in bases:
+            resolved = self._resolve_class(full_mod_name, base)
+            if resolved is None:
+                continue
+            for mth_name in self._get_method_names(resolved[0], resolved[1], visited):
+                if mth_name not in mth_names:
+                    mth_names.append(mth_name)
+        return mth_names
+
+
+discovery_engines = {
+    PyclbrDiscoveryEngine.name: PyclbrDiscoveryEngine,
+    AstDiscoveryEngine.name: AstDiscoveryEngine,
+}
+
+
+def make_discovery_engine(engine):
+    """engine can be None (default to 'pyclbr'), a registered engine name, or a DiscoveryEngine instance."""
+    if engine is None:
+        return PyclbrDiscoveryEngine()
+    if isinstance(engine, DiscoveryEngine):
+        return engine
+    if engine not in discovery_engines:
+        raise ValueError('Discovery engine %r is not one of %r.' % (engine, sorted(discovery_engines.keys())))
+    return discovery_engines[engine]()
+
+
+def _inspect_modules_in_worker(engine, full_mod_names):
+    # Runs in a discovery worker process. Returns a list of tuples like
+    # (full module name, module tree or None, dependency paths or None, traceback string or None).
+    res = []
+    for full_mod_name in full_mod_names:
+        try:
+            if engine.imports_modules:
+                __import__(full_mod_name)
+            mod_tree = engine.inspect_module(full_mod_name)
+            res.append((full_mod_name, mod_tree, engine.get_dependency_paths(full_mod_name), None))
+        except Exception:
+            res.append((full_mod_name, None, None, exc_info_to_string(sys.exc_info())))
+    return res
+
+
+def inspect_modules(engine, full_mod_names, max_workers, dependencies=None):
+    """
+    Imports (if the engine needs it) and inspects the modules across a pool of max_workers processes.
+    Returns a tuple of two dicts: {full module name: module tree} and {full module name: traceback string},
+    where the latter has the modules which failed to be imported or inspected.
+    If dependencies is a dict, it is filled with {full module name: engine.get_dependency_paths(full module name)}.
+    """
+    mod_trees = dict()
+    errors = dict()
+    full_mod_names = list(full_mod_names)
+    if not full_mod_names:
+        return mod_trees, errors
+    batch_size = max(1, len(full_mod_names) // (max_workers * 4))
+    batches = [full_mod_names[i:i + batch_size] for i in range(0, len(full_mod_names), batch_size)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(_inspect_modules_in_worker, engine, batch) for batch in batches]
+        for done in concurrent.futures.as_completed(futures):
+            for full_mod_name, mod_tree, dep_paths, error in done.result():
+                if error is None:
+                    mod_trees[full_mod_name] = mod_tree
+                    if dependencies is not None:
+                        dependencies[full_mod_name] = dep_paths
+                else:
+                    errors[full_mod_name] = error
+    return mod_trees, errors
+
+
+def _list_package_dir(path, prefix, recursive):
+    mod_names = []
+    sub_pkgs = []  # a list of tuples like (path, dotted name relative to the top package)
+    for entry in sorted(os.listdir(path)):
+        entry_path = os.path.join(path, entry)
+        if entry.endswith('.py') and entry != '__init__.py':
+            if _identifier.match(entry[:-3]) and os.path.isfile(entry_path):
+                mod_names.append(prefix + entry[:-3])
+        elif recursive and _identifier.match(entry) and os.path.isfile(os.path.join(entry_path, '__init__.py')):
+            sub_pkgs.append((entry_path, prefix + entry))
+    return mod_names, sub_pkgs
+
+
+def walk_package(pkg_paths, recursive=True, except_mod_names=(), max_workers=DEFAULT_WALKER_WORKERS):
+    """
+    Lists the modules in the package directories pkg_paths (and in their sub-packages if recursive)
+    by walking the file system with up to max_workers threads, without importing anything.
+    A module or sub-package whose dotted name relative to the package is in except_mod_names is left out,
+    and a sub-package left out is not walked into.
+    Returns a tuple of (sorted list of module names relative to the package, set of except_mod_names matched).
+    """
+    except_mod_names = set(except_mod_names)
+    matched = set()
+    mod_names = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = set(executor.submit(_list_package_dir, path, '', recursive) for path in pkg_paths)
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                found_mod_names, sub_pkgs = future.result()
+                for mod_name in found_mod_names:
+                    if mod_name in except_mod_names:
+                        matched.add(mod_name)
+                    else:
+                        mod_names.append(mod_name)
+                for path, sub_pkg_name in sub_pkgs:
+                    if sub_pkg_name in except_mod_names:
+                        matched.add(sub_pkg_name)
+                    else:
+                        pending.add(executor.submit(_list_package_dir, path, sub_pkg_name + '.', recursive))
+    return sorted(mod_names), matched
@@ -0,0 +1,294 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import sys
+import socket
+import binascii
+import time
+import weakref
+import threading
+import collections
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+import concurrent.futures
+import logging
+
+log = logging.getLogger(__name__)
+
+# The messages between a coordinator and a worker.
+_CALL = 'call'
+_STOP = 'stop'
+_RESULT = 'result'
+_ERROR = 'error'
+
+# The seconds the local workers are given to exit after the coordinator is shut down, before they are terminated.
+_STOP_GRACE = 5.0
+
+# The listeners of the coordinators in this process, which forked local workers must not keep open.
+_listeners = weakref.WeakSet()
+
+
+def parse_address(address):
+    """Returns (host, port) of an address like 'host:port', or the address itself if it is already a tuple."""
+    if isinstance(address, tuple):
+        return address
+    host, _, port = str(address).rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError('Address (%r) does not comply with: "host:port".' % address)
+    return host, int(port)
+
+
+def _to_bytes(authkey):
+    if authkey is None or isinstance(authkey, bytes):
+        return authkey
+    return authkey.encode('utf-8')
+
+
+def _wake_up(address):
+    # Wakes up a thread accepting connections at address. A plain connection does not wait for the handshake,
+    # which nobody may answer once the thread has accepted another connection and returned.
+    try:
+        socket.create_connection(address, timeout=1).close()
+    except (IOError, OSError):
+        pass
+
+
+def is_loopback(host):
+    """Returns True if host is a loopback address, which only the processes of the same host can connect to."""
+    return host in ('localhost', '::1') or host.startswith('127.')
+
+
+def make_authkey(authkey=None, host='localhost'):
+    """
+    Returns authkey as bytes, or a random printable one if authkey is None.
+    A peer which is not authenticated could send any pickle, i.e. run any code, so there is always an authkey.
+    Raises ValueError if authkey is None and host is not a loopback address: a generated authkey would have to be
+    handed to the peers on other hosts, so it must be given explicitly.
+    """
+    if authkey is None:
+        if not is_loopback(host):
+            raise ValueError('An authkey is required to listen on %s, which is not a loopback address.' % host)
+        return binascii.hexlify(os.urandom(16))
+    return _to_bytes(authkey)
+
+
+def check_authkey(authkey):
+    """Returns authkey as bytes. Raises ValueError if it is None: the listening side always has an authkey."""
+    if authkey is None:
+        raise ValueError('An authkey is required to connect.')
+    return _to_bytes(authkey)
+
+
+class _WorkItem(object):
+    def __init__(self, future, fn, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.started = False
+
+
+class Coordinator(concurrent.futures.Executor):
+    """
+    An executor running the submitted calls in workers connected over TCP, which can be on other hosts.
+    A worker (see run_worker) connects to the address of the coordinator and is handed one call at a time,
+    so the idle workers pull the queued calls. The calls, their arguments and their results are pickled,
+    so the test code must be importable by the workers as well.
+    A call whose worker is lost before returning is queued again for the other workers.
+    Without an authkey, a random one is generated (see the authkey attribute) if address is a loopback address.
+    """
+    def __init__(self, address=('localhost', 0), authkey=None):
+        address = parse_address(address)
+        self.authkey = make_authkey(authkey, address[0])
+        self._listener = Listener(address, authkey=self.authkey)
+        _listeners.add(self._listener)
+        self.address = self._listener.address
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._shutdown = False
+        self._servers = []
+        self._local_workers = []
+        self._accepter = threading.Thread(target=self._accept, name='unishark-coordinator')
+        self._accepter.daemon = True
+        self._accepter.start()
+        log.info('Coordinator is listening on %s:%d.' % self.address)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError('Cannot submit calls after the coordinator is shut down.')
+            future = concurrent.futures.Future()
+            self._queue.append(_WorkItem(future, fn, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def start_local_workers(self, count):
+        """Starts count worker processes on this host."""
+        for _ in range(count):
+            worker = multiprocessing.Process(target=_run_local_worker, args=(self.address, self.authkey))
+            worker.daemon = True
+            worker.start()
+            self._local_workers.append(worker)
+
+    @property
+    def worker_count(self):
+        """The number of connected workers."""
+        with self._cond:
+            return len([server for server in self._servers if server.is_alive()])
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers once the queued calls are done. The local workers exit, the others are disconnected.
+        The workers not connected yet are refused. With wait, the local workers which do not exit in time
+        are terminated.
+        """
+        with self._cond:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            self._cond.notify_all()
+        _wake_up(self.address)
+        if wait:
+            self._accepter.join()
+        # The workers still connecting (e.g. in the backlog of the listener) are refused, instead of waiting.
+        self._listener.close()
+        if wait:
+            for server in list(self._servers):
+                server.join()
+            deadline = time.time() + _STOP_GRACE
+            for worker in self._local_workers:
+                worker.join(max(0, deadline - time.time()))
+                if worker.is_alive():
+                    log.warning('Local worker %d did not exit, terminating it.' % worker.pid)
+                    worker.terminate()
+                    worker.join()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._shutdown:
+                    return
+                log.warning('Failed to accept a worker.', exc_info=True)
+                continue
+            with self._cond:
+                if self._shutdown:
+                    conn.close()
+                    return
+                server = threading.Thread(target=self._serve, args=(conn,),
+                                          name='unishark-coordinator-%d' % len(self._servers))
+                server.daemon = True
+                self._servers.append(server)
+            server.start()
+
+    def _take(self):
+        # Returns the next queued call, or None once the coordinator is shut down and no call is queued.
+        with self._cond:
+            while True:
+                while self._queue:
+                    item = self._queue.popleft()
+                    if item.started or item.future.set_running_or_notify_cancel():
+                        item.started = True
+                        return item
+                if self._shutdown:
+                    return None
+                self._cond.wait()
+
+    def _serve(self, conn):
+        # Hands the queued calls to one connected worker, until shut down or the worker is lost.
+        try:
+            while True:
+                item = self._take()
+                if item is None:
+                    conn.send((_STOP,))
+                    return
+                try:
+                    conn.send((_CALL, item.fn, item.args, item.kwargs))
+                    status, value = conn.recv()
+                except (EOFError, IOError, OSError):
+                    with self._cond:
+                        self._queue.appendleft(item)
+                        self._cond.notify()
+                    log.warning('Lost a worker, its call is queued again.', exc_info=True)
+                    return
+                except Exception as e:  # e.g. the call cannot be pickled
+                    item.future.set_exception(e)
+                    continue
+                if status == _RESULT:
+                    item.future.set_result(value)
+                else:
+                    item.future.set_exception(value)
+        except (EOFError, IOError, OSError):
+            log.warning('Lost a worker.', exc_info=True)
+        finally:
+            conn.close()
+
+
+def run_worker(address, authkey):
+    """
+    Connects to the coordinator at address (a (host, port) tuple or 'host:port') with its authkey,
+    and runs the calls it hands out until it stops the worker. Returns the number of calls run.
+    """
+    conn = Client(parse_address(address), authkey=check_authkey(authkey))
+    count = 0
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            except Exception as e:  # e.g. the function of the call cannot be imported here
+                conn.send((_ERROR, e))
+                continue
+            if message[0] == _STOP:
+                break
+            _, fn, args, kwargs = message
+            try:
+                reply = (_RESULT, fn(*args, **kwargs))
+            except Exception as e:
+                reply = (_ERROR, e)
+            try:
+                conn.send(reply)
+            except (EOFError, IOError, OSError):
+                break
+            except Exception as e:  # the result or the exception cannot be pickled
+                conn.send((_ERROR, RuntimeError('Failed to send back the result: %r' % e)))
+            count += 1
+    finally:
+        conn.close()
+    log.info('Worker ran %d call(s).' % count)
+    return count
+
+
+def _run_local_worker(address, authkey):
+    # A forked worker closes its copies of the listeners, so that the workers still connecting when a coordinator
+    # closes its listener are refused. A local worker refused by a coordinator already shut down just exits.
+    for listener in list(_listeners):
+        listener.close()
+    try:
+        run_worker(address, authkey)
+    except (EOFError, IOError, OSError):
+        log.debug('Local worker lost the coordinator.', exc_info=True)
+
+
+if __name__ == '__main__':
+    # Starts a worker: python -m unishark.distributed host:port authkey
+    if len(sys.argv) != 3:
+        sys.stderr.write('Usage: python -m unishark.distributed host:port authkey\n')
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO)
+    run_worker(sys.argv[1], sys.argv[2])
@@ -0,0 +1,77 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+# The estimated duration (in seconds) of a test when no test duration is known at all.
+DEFAULT_TEST_DURATION = 1.0
+
+
+class DurationStore(object):
+    """
+    Durations (in seconds) of the tests and the fixtures in previous runs, kept in a json file.
+    Tests are keyed by their full method names like 'package.module.class.method',
+    and fixtures by their names like 'package.module.setUpModule' or 'package.module.class.setUpClass',
+    so that the same module and class names in different packages do not share their durations.
+    The latest recorded duration of a name replaces the previous one.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.tests = dict()
+        self.fixtures = dict()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                self.tests.update(data.get('tests', {}))
+                self.fixtures.update(data.get('fixtures', {}))
+            except (IOError, OSError, ValueError) as e:
+                log.warning('Failed to read durations from %r: %r' % (path, e))
+
+    def get_test_duration(self, name):
+        """Returns the duration of the test, or the mean duration of the known tests if the test is unknown."""
+        if name in self.tests:
+            return self.tests[name]
+        return self.get_default_test_duration()
+
+    def get_default_test_duration(self):
+        """Returns the estimated duration of an unknown test: the mean duration of the known tests."""
+        if self.tests:
+            return sum(self.tests.values()) / len(self.tests)
+        return DEFAULT_TEST_DURATION
+
+    def get_fixture_duration(self, name):
+        """Returns the duration of the fixture, or 0.0 if the fixture is unknown."""
+        return self.fixtures.get(name, 0.0)
+
+    def update(self, result):
+        """Records the durations of the tests and the fixtures in a BufferedTestResult."""
+        self.tests.update(getattr(result, 'test_durations', {}))
+        self.fixtures.update(getattr(result, 'fixture_durations', {}))
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'tests': self.tests, 'fixtures': self.fixtures}, f, indent=2, sort_keys=True)
+            getattr(os, 'replace', os.rename)(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            log.warning('Failed to save durations to %r: %r' % (self.path, e))
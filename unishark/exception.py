@@ -24,4 +24,18 @@ class MultipleErrors(Exception):
         return 'Total %d error(s) as follows: \n\n%s' % (len(self.msgs), '\n\n'.join(self.msgs))
 
     def __repr__(self):
-        return repr(self.msgs)
\ No newline at end of file
+        return repr(self.msgs)
+
+
+class TimeoutExpired(Exception):
+    def __init__(self, name, timeout, stack=''):
+        super(TimeoutExpired, self).__init__(name, timeout, stack)
+        self.name = name
+        self.timeout = timeout
+        self.stack = stack
+
+    def __str__(self):
+        msg = '%s is not finished in %r seconds.' % (self.name, self.timeout)
+        if self.stack:
+            msg += ' It was running:\n%s' % self.stack
+        return msg
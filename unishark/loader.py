@@ -13,40 +13,141 @@
 # limitations under the License.
 
 
+import os
 import unittest
-import pyclbr
 import logging
 import types
-import re
+import sys
+from unishark.discovery import (DiscoveryCache, make_discovery_engine, inspect_modules, walk_package,
+                                DEFAULT_WALKER_WORKERS)
+from unishark.selection import NameSelector
+from unishark.suite import LazyTestCase
+from unishark.util import get_interpreter
+from unishark.autoscale import AUTO
 
 log = logging.getLogger(__name__)
 
 
+class DiscoveryFailure(unittest.TestCase):
+    """
+    A test which fails with the error raised when importing or inspecting a module in a discovery worker,
+    so that a module which cannot be discovered fails the run, like unittest's failed import tests.
+    """
+    def __init__(self, full_mod_name, error):
+        super(DiscoveryFailure, self).__init__('test_discovery')
+        self.full_mod_name = full_mod_name
+        self.error = error
+
+    def test_discovery(self):
+        raise ImportError('Failed to discover tests in module %r:\n%s' % (self.full_mod_name, self.error))
+
+    def __str__(self):
+        return 'test_discovery (%s)' % self.full_mod_name
+
+
+class NameTree(object):
+    """
+    An immutable name tree. The value of a name is either a NameTree or a frozenset of the leaf names.
+    A tree is never modified or copied after it is built, so it can be shared by any number of groups.
+    """
+    __slots__ = ('_nodes',)
+
+    def __init__(self, nodes=None):
+        # the tree takes the ownership of the given dict
+        self._nodes = nodes if nodes is not None else dict()
+
+    @classmethod
+    def from_dict(cls, tree):
+        return cls(dict((name, cls.from_dict(sub) if isinstance(sub, dict) else frozenset(sub))
+                        for name, sub in tree.items()))
+
+    def to_dict(self):
+        return dict((name, sub.to_dict() if isinstance(sub, NameTree) else set(sub))
+                    for name, sub in self._nodes.items())
+
+    def __getitem__(self, name):
+        return self._nodes[name]
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def keys(self):
+        return self._nodes.keys()
+
+    def items(self):
+        return self._nodes.items()
+
+
 class DefaultTestLoader:
-    def __init__(self, name_pattern=None):
+    def __init__(self, name_pattern=None, cache_dir=None, discovery_engine=None, lazy=False, discovery_workers=1):
         self._name_tree = None
         self._case_class = unittest.TestCase
         self._suite_class = unittest.TestSuite
+        # key: (package name, recursive, excluded module names), value: name tree of the package
         self._name_trees_by_pkg = dict()
+        # key: (package name, recursive, excluded module names), value: module names in the package
+        self._mod_names_by_pkg = dict()
+        # key: full module name, value: module tree, shared by all the suites and groups
+        self._mod_trees = dict()
+        # key: full module name, value: name tree of the module
+        self._mod_name_trees = dict()
         self.name_pattern = name_pattern or r'^test\w*'
         self.one_dot_name_pattern = r'\w+\.test\w*'
         self.two_dots_name_pattern = r'(\w+\.){2}test\w*'
+        self._discovery_cache = DiscoveryCache(cache_dir) if cache_dir else None
+        self._discovery_engine = make_discovery_engine(discovery_engine)
+        self.lazy = lazy
+        self.discovery_workers = int(discovery_workers)
+        if self.discovery_workers > 1 and get_interpreter().startswith('jython'):
+            raise ValueError('Jython does not support multiprocessing.')
+        # key: full module name, value: traceback string of the error raised when importing or inspecting the module
+        self.discovery_errors = dict()
+        # The modules of the name trees built for the next suite, which failed in discovery workers.
+        self._failed_mod_names = []
+        self._selectors = dict()
+        # key: dotted name of a module or a class, value: the resolved object
+        self._resolved_objs = dict()
 
     def load_tests_from_dict(self, dict_conf):
+        self._discover_modules_in_dict(dict_conf)
         suites_dict = dict()
-        for suite_name, content in self._parse_tests_from_dict(dict_conf).items():
+        for suite_name, suite_content in self.iter_tests_from_dict(dict_conf):
+            suites_dict[suite_name] = suite_content
+        return suites_dict
+
+    def iter_tests_from_dict(self, dict_conf):
+        """
+        Yields (suite name, suite content) in the order of the suite names in dict_conf['test']['suites'].
+        The content is the same as the value of the dict returned by load_tests_from_dict.
+        A suite is parsed and loaded only when it is requested,
+        so the caller can run the suites already yielded while the next one is loading.
+        The modules of a suite are discovered in one pass when it is requested, and shared by the next suites.
+        """
+        test = dict_conf['test']
+        suites = dict_conf['suites']
+        for suite_name in test['suites']:
+            self._discover_modules_in_dict(dict_conf, [suite_name])
+            content = self._parse_suite_from_dict(suites[suite_name])
+            log.debug('Parsed test suite %r: %r' % (suite_name, content))
             package = content['package']
             test_case_names = content['test_case_names']
-            suite = self.load_tests_from_full_names(test_case_names)
+            # the names are already selected by the name pattern in each group
+            suite = self._make_suite_from_full_names(test_case_names)
             if suite.countTestCases() <= 0:
                 log.error('Test suite %r is empty.' % suite_name)
-            suites_dict[suite_name] = {
+            log.info('Created test suite %r successfully from package %r.' % (suite_name, package))
+            yield suite_name, {
                 'package': package,
                 'suite': suite,
-                'concurrency': content['concurrency']
+                'concurrency': content['concurrency'],
+                'max_failures': content['max_failures']
             }
-            log.info('Created test suite %r successfully from package %r.' % (suite_name, package))
-        return suites_dict
 
     def load_tests_from_full_names(self, full_names):
         """
@@ -54,21 +155,31 @@ class DefaultTestLoader:
         whose full name is given and short method name filtered by name_pattern.
         A full name is a dotted name like (package.)module.class.method
         """
-        full_names = self._filter_tests_by_name_pattern(full_names)
+        full_names = self._get_selector().select(full_names)
         return self._make_suite_from_full_names(full_names)
 
-    def load_tests_from_package(self, pkg_name, regex=None):
+    def load_tests_from_file(self, path):
+        """
+        Returns a unittest.TestSuite instance containing the tests
+        whose full name is listed in the file and short method name filtered by name_pattern.
+        The file has one full name like (package.)module.class.method per line,
+        blank lines and lines starting with '#' are ignored.
+        """
+        full_names = self._get_selector().select(self._read_test_names(path))
+        return self._make_suite_from_full_names(full_names)
+
+    def load_tests_from_package(self, pkg_name, regex=None, recursive=False):
         """
         Returns a unittest.TestSuite instance containing the tests
         whose dotted long name module.class.method matches the given regular expression
         and short method name matches name_pattern.
         A dotted package name must be provided. regex is default to '(\w+\.){2}test\w*'
+        If recursive is True, the tests in the sub-packages are also loaded.
         """
-        self._build_pkg_name_tree(pkg_name)
+        self._build_pkg_name_tree(pkg_name, recursive=recursive)
         full_names = self._get_full_method_names_from_tree(pkg_name)
-        full_names = self._filter_tests_by_two_dots_name_pattern(full_names, regex=regex)
-        full_names = self._filter_tests_by_name_pattern(full_names)
-        return self._make_suite_from_full_names(full_names)
+        selector = self._get_selector(long_name_pattern=regex or self.two_dots_name_pattern, long_name_depth=3)
+        return self._make_suite_from_full_names(selector.select(full_names))
 
     def load_tests_from_modules(self, mod_names, regex=None):
         """
@@ -79,49 +190,46 @@ class DefaultTestLoader:
         """
         self._build_name_tree(None, set(mod_names))
         full_names = self._get_full_method_names_from_tree(None)
-        full_names = self._filter_tests_by_one_dot_name_pattern(full_names, regex=regex)
-        full_names = self._filter_tests_by_name_pattern(full_names)
-        return self._make_suite_from_full_names(full_names)
-
-    def _filter_tests_by_name_pattern(self, full_names):
-        return list(filter(lambda n: re.match(self.name_pattern, n.split('.')[-1]), full_names))
-
-    def _filter_tests_by_one_dot_name_pattern(self, full_names, regex=None):
-        regex = regex or self.one_dot_name_pattern
-        return list(filter(lambda n: re.match(regex, '.'.join(n.split('.')[-2:])), full_names))
-
-    def _filter_tests_by_two_dots_name_pattern(self, full_names, regex=None):
-        regex = regex or self.two_dots_name_pattern
-        return list(filter(lambda n: re.match(regex, '.'.join(n.split('.')[-3:])), full_names))
+        selector = self._get_selector(long_name_pattern=regex or self.one_dot_name_pattern, long_name_depth=2)
+        return self._make_suite_from_full_names(selector.select(full_names))
+
+    def _get_selector(self, long_name_pattern=None, long_name_depth=3, prefix=None, except_names=()):
+        # Selectors are compiled once and shared by all the suites and groups with the same selection rules.
+        key = (self.name_pattern, long_name_pattern, long_name_depth, prefix, frozenset(except_names))
+        if key not in self._selectors:
+            self._selectors[key] = NameSelector(self.name_pattern,
+                                                long_name_pattern=long_name_pattern,
+                                                long_name_depth=long_name_depth,
+                                                prefix=prefix,
+                                                except_names=except_names)
+        return self._selectors[key]
 
     def _make_suite_from_full_names(self, full_names):
         cases = list(filter(lambda c: c is not None, [self._make_case_from_full_name(name) for name in full_names]))
+        # Each module which failed in a discovery worker fails the suite, instead of being silently left out.
+        cases.extend(DiscoveryFailure(name, self.discovery_errors[name]) for name in self._failed_mod_names)
+        self._failed_mod_names = []
         suite = self._suite_class(cases)
         log.info('Loaded %d test(s).' % suite.countTestCases())
         log.debug('Loaded test(s): %r' % suite)
         return suite
 
     def _make_case_from_full_name(self, full_name):
-        name_parts = full_name.split('.')
-        mod = None
-        importable_parts = name_parts[:]
-        while importable_parts:
-            try:
-                mod = __import__('.'.join(importable_parts))
-                break
-            except ImportError:
-                del importable_parts[-1]
-                if not importable_parts:
-                    raise
-        obj = mod
-        parent = None
-        for part in name_parts[1:]:
-            parent, obj = obj, getattr(obj, part)
+        parent_name, _, name = full_name.rpartition('.')
+        if parent_name:
+            parent = self._resolve_name(parent_name)
+            obj = self.__class__._get_attr(parent, parent_name, name)
+        else:
+            parent, obj = None, self._resolve_name(name)
         if not isinstance(obj, types.FunctionType) and not isinstance(obj, types.MethodType):
             raise TypeError('%r is neither %r nor %r' % (obj, types.FunctionType, types.MethodType))
         # filter out class if it is not unittest.TestCase subclass
         elif isinstance(parent, type) and issubclass(parent, self._case_class):
-            name = name_parts[-1]
+            if self.lazy:
+                # filter out static methods without instantiating the test case
+                if not self.__class__._is_static_method(parent, name):
+                    return LazyTestCase(full_name, parent)
+                return None
             test_obj = parent(name)
             # filter out static methods
             if not isinstance(getattr(test_obj, name), types.FunctionType):
@@ -129,56 +237,135 @@ class DefaultTestLoader:
         else:
             return None
 
-    def _parse_tests_from_dict(self, dict_conf):
-        res_suites = dict()
-        test = dict_conf['test']
+    def _resolve_name(self, dotted_name):
+        # Returns the module or the class of a dotted name like (package.)module(.class).
+        # The resolved objects are indexed by their dotted names, so the tests sharing a prefix resolve it only once.
+        if dotted_name in self._resolved_objs:
+            return self._resolved_objs[dotted_name]
+        parent_name, _, name = dotted_name.rpartition('.')
+        if parent_name:
+            obj = self.__class__._get_attr(self._resolve_name(parent_name), parent_name, name)
+        else:
+            obj = __import__(name)
+        self._resolved_objs[dotted_name] = obj
+        return obj
+
+    @staticmethod
+    def _get_attr(parent, parent_name, name):
+        if not hasattr(parent, name) and isinstance(parent, types.ModuleType):
+            # the attribute can be a sub-module that has not been imported yet
+            try:
+                __import__('.'.join((parent_name, name)))
+            except ImportError:
+                pass
+        return getattr(parent, name)
+
+    @staticmethod
+    def _is_static_method(cls, name):
+        for klass in cls.__mro__:
+            if name in klass.__dict__:
+                return isinstance(klass.__dict__[name], staticmethod)
+        return False
+
+    def _discover_modules_in_dict(self, dict_conf, suite_names=None):
+        # Discovers the union of the modules included by all the suites (or the given ones) and groups in one pass,
+        # so that building the name tree of each group only reads the shared module trees.
+        full_mod_names = set()
         suites = dict_conf['suites']
-        for suite_name in test['suites']:
+        for suite_name in suite_names or dict_conf['test']['suites']:
             suite = suites[suite_name]
-            pkg_name = None
-            if 'package' in suite and suite['package']:
-                pkg_name = suite['package']
-            groups_dict = suite['groups']
-            test_cases_names = []
-            for group_key, group in groups_dict.items():
-                group = groups_dict[group_key]
-                if 'disable' in group and group['disable']:
+            pkg_name = suite.get('package', None) or None
+            for group in suite['groups'].values():
+                if group.get('disable', False):
                     continue
-                gran = group['granularity']
-                if gran == 'package':
-                    full_mth_names = self._get_full_method_names_from_package(pkg_name, group)
-                    test_cases_names.extend(full_mth_names)
+                gran = group.get('granularity', None)
+                if gran == 'package' and pkg_name:
+                    mod_names = self._get_package_module_names(pkg_name,
+                                                               recursive=group.get('recursive', False),
+                                                               except_mod_names=group.get('except_modules', None))
                 elif gran == 'module':
-                    full_mth_names = self._get_full_method_names_from_modules(pkg_name, group)
-                    test_cases_names.extend(full_mth_names)
+                    mod_names = group['modules']
                 elif gran == 'class':
-                    full_mth_names = self._get_full_method_names_from_classes(pkg_name, group)
-                    test_cases_names.extend(full_mth_names)
-                elif gran == 'method':
-                    full_mth_names = self._get_full_method_names_from_methods(pkg_name, group)
-                    test_cases_names.extend(full_mth_names)
-                else:
-                    raise ValueError('Granularity must be one of %r.' % ['package', 'module', 'class', 'method'])
-            if 'max_workers' in suite or 'concurrency_level' in suite:  # Deprecation message
-                raise KeyError('Please set "max_workers" and "level" in the "concurrency" sub-dict instead.')
-            concurrency = self.__class__._parse_concurrency_conf(suite)
-            res_suites[suite_name] = {
-                'package': pkg_name or 'None',
-                'test_case_names': set(test_cases_names),
-                'concurrency': concurrency
-            }
-        log.debug('Parsed test config: %r' % res_suites)
-        log.info('Parsed test config successfully.')
-        return res_suites
+                    mod_names = [self.__class__._get_cls_name_parts(n)[0] for n in group['classes']]
+                else:  # the tests are given by their full names, or the config error is raised later
+                    continue
+                for mod_name in mod_names:
+                    full_mod_names.add('.'.join((pkg_name, mod_name)) if pkg_name else mod_name)
+        self._get_module_trees(None, sorted(full_mod_names))
+
+    def _parse_suite_from_dict(self, suite):
+        pkg_name = None
+        if 'package' in suite and suite['package']:
+            pkg_name = suite['package']
+        groups_dict = suite['groups']
+        test_cases_names = []
+        for group_key, group in groups_dict.items():
+            group = groups_dict[group_key]
+            if 'disable' in group and group['disable']:
+                continue
+            gran = group['granularity']
+            if gran == 'package':
+                full_mth_names = self._get_full_method_names_from_package(pkg_name, group)
+                test_cases_names.extend(full_mth_names)
+            elif gran == 'module':
+                full_mth_names = self._get_full_method_names_from_modules(pkg_name, group)
+                test_cases_names.extend(full_mth_names)
+            elif gran == 'class':
+                full_mth_names = self._get_full_method_names_from_classes(pkg_name, group)
+                test_cases_names.extend(full_mth_names)
+            elif gran == 'method':
+                full_mth_names = self._get_full_method_names_from_methods(pkg_name, group)
+                test_cases_names.extend(full_mth_names)
+            elif gran == 'file':
+                full_mth_names = self._get_full_method_names_from_file(pkg_name, group)
+                test_cases_names.extend(full_mth_names)
+            else:
+                raise ValueError('Granularity must be one of %r.' % ['package', 'module', 'class', 'method', 'file'])
+        if 'max_workers' in suite or 'concurrency_level' in suite:  # Deprecation message
+            raise KeyError('Please set "max_workers" and "level" in the "concurrency" sub-dict instead.')
+        concurrency = self.__class__._parse_concurrency_conf(suite)
+        return {
+            'package': pkg_name or 'None',
+            'test_case_names': set(test_cases_names),
+            'concurrency': concurrency,
+            'max_failures': self.__class__.parse_max_failures(suite)
+        }
+
+    @staticmethod
+    def parse_max_failures(conf):
+        """
+        Returns the number of failed tests after which the remaining tests are not run, or None if not limited.
+        'failfast: true' in conf is short for 'max_failures: 1'.
+        """
+        max_failures = conf.get('max_failures')
+        if max_failures is not None:
+            if int(max_failures) <= 0:
+                raise ValueError('max_failures (%r) must be greater than 0.' % max_failures)
+            return int(max_failures)
+        return 1 if conf.get('failfast') else None
+
+    @staticmethod
+    def parse_worker_bounds(concurrency):
+        """Returns (min, max) of concurrency['worker_bounds'] used with max_workers 'auto', or None if not set."""
+        bounds = concurrency.get('worker_bounds')
+        if bounds is None:
+            return None
+        min_workers, max_workers = [int(n) for n in bounds]
+        if min_workers < 1 or min_workers > max_workers:
+            raise ValueError('Concurrency worker_bounds (%r) must satisfy 1 <= min <= max.' % (bounds,))
+        return min_workers, max_workers
 
     @staticmethod
     def _parse_concurrency_conf(suite_conf):
         concurrency = suite_conf['concurrency'] if 'concurrency' in suite_conf else {
             'max_workers': 1,
             'level': 'class',
-            'timeout': None
+            'timeout': None,
+            'type': 'threads'
         }
-        int(concurrency['max_workers'])  # if concurrency key exists, max_workers is required and must be int
+        if concurrency['max_workers'] != AUTO:
+            int(concurrency['max_workers'])  # if concurrency key exists, max_workers is required and must be int
+        concurrency['worker_bounds'] = DefaultTestLoader.parse_worker_bounds(concurrency)
         if 'level' not in concurrency:
             concurrency['level'] = 'class'
         concur_levels = ['module', 'class', 'method']
@@ -186,50 +373,91 @@ class DefaultTestLoader:
             raise ValueError('Concurrency level (%r) is not one of %r.' % (concurrency['level'], concur_levels))
         if 'timeout' not in concurrency:
             concurrency['timeout'] = None
+        for key in ('test_timeout', 'fixture_timeout'):
+            if concurrency.get(key) is not None and concurrency[key] <= 0:
+                raise ValueError('Concurrency %s (%r) must be greater than 0.' % (key, concurrency[key]))
+            concurrency[key] = concurrency.get(key)
+        if 'type' not in concurrency:
+            concurrency['type'] = 'threads'
+        concur_types = ['threads', 'processes', 'asyncio', 'distributed', 'fork']
+        if concurrency['type'] not in concur_types:
+            raise ValueError('Concurrency type (%r) is not one of %r.' % (concurrency['type'], concur_types))
+        if concurrency['type'] in ('processes', 'distributed'):
+            if concurrency['level'] not in ['module', 'class']:
+                raise ValueError('Concurrency level must be one of %r with %s.'
+                                 % (['module', 'class'], concurrency['type']))
+            if get_interpreter().startswith('jython'):
+                raise ValueError('Jython does not support multiprocessing.')
+        for key in ('resources', 'resource_tags'):
+            concurrency[key] = concurrency.get(key) or None
+        if concurrency['resources'] is not None:
+            if concurrency['type'] != 'threads':
+                raise ValueError('Concurrency resources are only limited with type threads.')
+            for resource, capacity in concurrency['resources'].items():
+                if int(capacity) <= 0:
+                    raise ValueError('Capacity of resource %r (%r) must be greater than 0.' % (resource, capacity))
+        for resource in concurrency['resource_tags'] or ():
+            if resource not in (concurrency['resources'] or ()):
+                raise ValueError('Tagged resource %r has no capacity in concurrency resources.' % resource)
+        if concurrency['type'] == 'fork' and not hasattr(os, 'fork'):
+            raise ValueError('Concurrency type fork requires os.fork, which is not available on this platform.')
+        if concurrency['type'] == 'asyncio' and sys.version_info < (3, 7):
+            raise ValueError('Concurrency type asyncio requires Python 3.7 or above.')
         return concurrency
 
-    def _build_pkg_name_tree(self, pkg_name):
-        import pkgutil
-        import copy
+    def _build_pkg_name_tree(self, pkg_name, recursive=False, except_mod_names=None):
         if not pkg_name:
             raise ValueError('A dotted package name must be provided.')
-        if pkg_name in self._name_trees_by_pkg:
-            self._name_tree = copy.deepcopy(self._name_trees_by_pkg[pkg_name])
+        key = (pkg_name, recursive, frozenset(except_mod_names or []))
+        if key in self._name_trees_by_pkg:
+            # name trees are immutable, so the cached tree is shared instead of copied
+            self._name_tree = self._name_trees_by_pkg[key]
+            self._add_failed_modules(pkg_name, self._mod_names_by_pkg[key])
         else:
-            pkg = __import__(pkg_name)
-            name_parts = pkg_name.split('.')
-            if len(name_parts) > 1:
-                for part in name_parts[1:]:
-                    pkg = getattr(pkg, part)
-            members = pkgutil.iter_modules(pkg.__path__)
+            self._build_name_tree(pkg_name, self._get_package_module_names(pkg_name, recursive=recursive,
+                                                                           except_mod_names=except_mod_names))
+            self._name_trees_by_pkg[key] = self._name_tree
+
+    def _get_package_module_names(self, pkg_name, recursive=False, except_mod_names=None):
+        # The excluded modules are left out before anything in the package is imported.
+        import pkgutil
+        except_mod_names = frozenset(except_mod_names or [])
+        key = (pkg_name, recursive, except_mod_names)
+        if key in self._mod_names_by_pkg:
+            return self._mod_names_by_pkg[key]
+        if recursive:
+            # Excluded modules and sub-packages are left out while walking the package, so they are never imported.
+            mod_names, matched = walk_package(self._discovery_engine.get_package_path(pkg_name),
+                                              except_mod_names=except_mod_names,
+                                              max_workers=DEFAULT_WALKER_WORKERS)
+            for mod_name in except_mod_names - matched:
+                raise ValueError('Cannot exclude %r because it is not included.' % mod_name)
+        else:
+            members = pkgutil.iter_modules(self._discovery_engine.get_package_path(pkg_name))
             mod_names = []
             for _, mod_name, is_pkg in members:
                 if not is_pkg:
                     mod_names.append(mod_name)
-            self._build_name_tree(pkg_name, mod_names)
-            self._name_trees_by_pkg[pkg_name] = copy.deepcopy(self._name_tree)
+            for mod_name in except_mod_names - set(mod_names):
+                raise ValueError('Cannot exclude %r because it is not included.' % mod_name)
+            mod_names = [mod_name for mod_name in mod_names if mod_name not in except_mod_names]
+        self._mod_names_by_pkg[key] = mod_names
+        return mod_names
 
     def _get_full_method_names_from_package(self, pkg_name, group):
-        self._build_pkg_name_tree(pkg_name)
-        if 'except_modules' in group:
-            self._del_except_modules_in_name_tree(group['except_modules'])
-        if 'except_classes' in group:
-            self._del_except_classes_in_name_tree(group['except_classes'])
-        if 'except_methods' in group:
-            self._del_except_methods_in_name_tree(group['except_methods'])
-        full_names = self._get_full_method_names_from_tree(pkg_name)
-        pattern = group.get('pattern', None)
-        return self._filter_tests_by_two_dots_name_pattern(full_names, regex=pattern)
+        recursive = group.get('recursive', False)
+        self._build_pkg_name_tree(pkg_name, recursive=recursive, except_mod_names=group.get('except_modules'))
+        except_names = self._get_except_names(group, nested=recursive)
+        selector = self._get_selector(long_name_pattern=group.get('pattern', None) or self.two_dots_name_pattern,
+                                      long_name_depth=3, prefix=pkg_name, except_names=except_names)
+        return selector.select(self._get_full_method_names_from_tree(pkg_name), strict=True)
 
     def _get_full_method_names_from_modules(self, pkg_name, group):
         mod_names = group['modules']
         mod_names = set(mod_names)
         self._build_name_tree(pkg_name, mod_names)
-        if 'except_classes' in group:
-            self._del_except_classes_in_name_tree(group['except_classes'])
-        if 'except_methods' in group:
-            self._del_except_methods_in_name_tree(group['except_methods'])
-        return self._get_full_method_names_from_tree(pkg_name)
+        selector = self._get_selector(prefix=pkg_name, except_names=self._get_except_names(group))
+        return selector.select(self._get_full_method_names_from_tree(pkg_name), strict=True)
 
     def _get_full_method_names_from_classes(self, pkg_name, group):
         long_cls_names = group['classes']
@@ -239,9 +467,8 @@ class DefaultTestLoader:
             mod_name, _ = self.__class__._get_cls_name_parts(long_cls_name)
             mod_names.add(mod_name)
         self._build_name_tree(pkg_name, mod_names, filter_cls_names=long_cls_names)
-        if 'except_methods' in group:
-            self._del_except_methods_in_name_tree(group['except_methods'])
-        return self._get_full_method_names_from_tree(pkg_name)
+        selector = self._get_selector(prefix=pkg_name, except_names=self._get_except_names(group, classes=False))
+        return selector.select(self._get_full_method_names_from_tree(pkg_name), strict=True)
 
     def _get_full_method_names_from_methods(self, pkg_name, group):
         long_mth_names = group['methods']
@@ -250,54 +477,53 @@ class DefaultTestLoader:
             self.__class__._get_mth_name_parts(long_mth_name)
         full_mth_names = list(map(lambda n: '.'.join((pkg_name, n)), long_mth_names)) \
             if pkg_name else long_mth_names
-        return full_mth_names
+        return self._get_selector().select(full_mth_names)
+
+    def _get_full_method_names_from_file(self, pkg_name, group):
+        return self._get_selector().select(self._read_test_names(group['file'], pkg_name=pkg_name))
+
+    @classmethod
+    def _read_test_names(cls, path, pkg_name=None):
+        # Reads the file line by line and returns the distinct full test names,
+        # sorted so that the tests in the same module (and class) are resolved one after another.
+        full_names = set()
+        with open(path) as f:
+            for line in f:
+                long_name = line.strip()
+                if not long_name or long_name.startswith('#'):
+                    continue
+                cls._get_mth_name_parts(long_name, nested=True)
+                full_names.add('.'.join((pkg_name, long_name)) if pkg_name else long_name)
+        return sorted(full_names)
+
+    @classmethod
+    def _get_except_names(cls, group, nested=False, classes=True):
+        # Validates the formats of the excluded classes and methods of a group and returns them.
+        except_names = []
+        if classes:
+            for except_cls_name in group.get('except_classes', []):
+                cls._get_cls_name_parts(except_cls_name, nested=nested)
+                except_names.append(except_cls_name)
+        for except_mth_name in group.get('except_methods', []):
+            cls._get_mth_name_parts(except_mth_name, nested=nested)
+            except_names.append(except_mth_name)
+        return except_names
 
     @staticmethod
-    def _get_cls_name_parts(long_name):
-        parts = long_name.split('.')
-        if len(parts) != 2:
+    def _get_cls_name_parts(long_name, nested=False):
+        # If nested, the module name can be a dotted name relative to the package like "subpackage.module"
+        parts = long_name.rsplit('.', 1) if nested else long_name.split('.')
+        if len(parts) != 2 or not all(parts):
             raise ValueError('%r does not comply with: "module.class".' % long_name)
         return parts[0], parts[1]
 
     @staticmethod
-    def _get_mth_name_parts(long_name):
-        parts = long_name.split('.')
-        if len(parts) != 3:
+    def _get_mth_name_parts(long_name, nested=False):
+        parts = long_name.rsplit('.', 2) if nested else long_name.split('.')
+        if len(parts) != 3 or not all(parts):
             raise ValueError('%r does not comply with: "module.class.method".' % long_name)
         return parts[0], parts[1], parts[2]
 
-    def _del_except_modules_in_name_tree(self, except_mod_names):
-        for mod_name in set(except_mod_names):
-            self._del_mod_in_name_tree(mod_name)
-
-    def _del_except_classes_in_name_tree(self, except_cls_names):
-        for except_cls_name in set(except_cls_names):
-            mod_name, cls_name = self.__class__._get_cls_name_parts(except_cls_name)
-            self._del_cls_in_name_tree(mod_name, cls_name)
-
-    def _del_except_methods_in_name_tree(self, except_mth_names):
-        for except_mth_name in set(except_mth_names):
-            mod_name, cls_name, mth_name = self.__class__._get_mth_name_parts(except_mth_name)
-            self._del_mth_in_name_tree(mod_name, cls_name, mth_name)
-
-    @staticmethod
-    def _inspect_module(pkg_name, mod_name):
-        full_mod_name = mod_name if not pkg_name else '.'.join((pkg_name, mod_name))
-        return pyclbr.readmodule_ex(full_mod_name)  # return module_content
-
-    @staticmethod
-    def _get_classes_of_module(module_content):
-        classes = dict()  # a dict of 'class_name': pyclbr.Class obj
-        for name, obj in module_content.items():
-            if isinstance(obj, pyclbr.Class):
-                classes[name] = obj
-        return classes
-
-    @staticmethod
-    def _get_method_names_by_class(cls):
-        # cls.methods is a dict of 'method_name': method_line_no
-        return sorted(cls.methods.keys(), key=lambda k: cls.methods[k])
-
     # A name tree is like:
     # tree = {
     #     'mod1': {
@@ -314,54 +540,105 @@ class DefaultTestLoader:
     #     },
     #     ...
     # }
+    # The tree is a NameTree, and the subtree of a module is shared by all the trees including the whole module.
     def _build_name_tree(self, pkg_name, mod_names, filter_cls_names=None):
-        tree = self._name_tree = dict()
+        nodes = dict()
+        mod_trees = self._get_module_trees(pkg_name, mod_names)
+        self._add_failed_modules(pkg_name, mod_names)
         for mod_name in mod_names:
+            if mod_name not in mod_trees:  # failed to import in a discovery worker
+                continue
             full_mod_name = '.'.join((pkg_name, mod_name)) if pkg_name else mod_name
-            __import__(full_mod_name)
-        for mod_name in mod_names:
-            mod_content = self.__class__._inspect_module(pkg_name, mod_name)
-            classes = self.__class__._get_classes_of_module(mod_content)
-            if not classes:
+            if filter_cls_names:
+                mod_name_tree = self.__class__._make_module_name_tree(mod_name, mod_trees[mod_name],
+                                                                      filter_cls_names=filter_cls_names)
+            elif full_mod_name in self._mod_name_trees:
+                mod_name_tree = self._mod_name_trees[full_mod_name]
+            else:
+                mod_name_tree = self.__class__._make_module_name_tree(mod_name, mod_trees[mod_name])
+                self._mod_name_trees[full_mod_name] = mod_name_tree
+            if mod_name_tree:
+                nodes[mod_name] = mod_name_tree
+        self._name_tree = NameTree(nodes)
+
+    def _add_failed_modules(self, pkg_name, mod_names):
+        for mod_name in sorted(mod_names):
+            full_mod_name = '.'.join((pkg_name, mod_name)) if pkg_name else mod_name
+            if full_mod_name in self.discovery_errors and full_mod_name not in self._failed_mod_names:
+                self._failed_mod_names.append(full_mod_name)
+
+    @staticmethod
+    def _make_module_name_tree(mod_name, mod_tree, filter_cls_names=None):
+        nodes = dict()
+        for cls_name, mth_names in mod_tree.items():
+            if filter_cls_names and '.'.join((mod_name, cls_name)) not in filter_cls_names:
                 continue
-            for cls_name, cls in classes.items():
-                long_cls_name = '.'.join((mod_name, cls_name))
-                if filter_cls_names and long_cls_name not in filter_cls_names:
-                    continue
-                mth_names = self.__class__._get_method_names_by_class(cls)
-                if not mth_names:
+            if mth_names:
+                nodes[cls_name] = frozenset(mth_names)
+        return NameTree(nodes)
+
+    def _get_module_trees(self, pkg_name, mod_names):
+        # Returns a dict of 'mod_name': module tree
+        # Each module is discovered only once by the loader, no matter how many suites and groups include it.
+        mod_trees = dict()
+        names = dict()  # key: full module name, value: module name relative to the package
+        for mod_name in mod_names:
+            full_mod_name = '.'.join((pkg_name, mod_name)) if pkg_name else mod_name
+            if full_mod_name in self._mod_trees:
+                mod_trees[mod_name] = self._mod_trees[full_mod_name]
+            elif full_mod_name not in self.discovery_errors:
+                names[full_mod_name] = mod_name
+        for full_mod_name, mod_tree in self._discover_modules(list(names.keys())).items():
+            self._mod_trees[full_mod_name] = mod_tree
+            mod_trees[names[full_mod_name]] = mod_tree
+        return mod_trees
+
+    def _discover_modules(self, full_mod_names):
+        # Returns a dict of 'full_mod_name': module tree, leaving out the modules failed in discovery workers
+        # The discovery workers import the modules in their own processes, and nothing is imported here:
+        # only the modules with selected tests are imported (again) in this process, to build their test cases.
+        if self.discovery_workers <= 1:
+            return dict((full_mod_name, self._get_module_tree(full_mod_name)) for full_mod_name in full_mod_names)
+        mod_trees = dict()
+        names = []
+        src_paths = dict()
+        for full_mod_name in full_mod_names:
+            if self._discovery_cache:
+                src_paths[full_mod_name] = self._discovery_engine.get_source_path(full_mod_name)
+                mod_tree = self._discovery_cache.get(full_mod_name, src_paths[full_mod_name],
+                                                     self._discovery_engine.name)
+                if mod_tree is not None:
+                    mod_trees[full_mod_name] = mod_tree
                     continue
-                if mod_name not in tree:
-                    tree[mod_name] = dict()
-                if cls_name not in tree[mod_name]:
-                    tree[mod_name][cls_name] = set()
-                for mth_name in mth_names:
-                    tree[mod_name][cls_name].add(mth_name)
-
-    def _del_mod_in_name_tree(self, mod_name):
-        if mod_name not in self._name_tree:
-            raise ValueError('Cannot exclude %r because it is not included.' % mod_name)
-        del self._name_tree[mod_name]
-
-    def _del_cls_in_name_tree(self, mod_name, cls_name):
-        long_cls_name = '.'.join((mod_name, cls_name))
-        if mod_name not in self._name_tree or cls_name not in self._name_tree[mod_name]:
-            raise ValueError('Cannot exclude %r because it is not included.' % long_cls_name)
-        del self._name_tree[mod_name][cls_name]
-        if not self._name_tree[mod_name]:
-            del self._name_tree[mod_name]
-
-    def _del_mth_in_name_tree(self, mod_name, cls_name, mth_name):
-        long_mth_name = '.'.join((mod_name, cls_name, mth_name))
-        if mod_name not in self._name_tree \
-                or cls_name not in self._name_tree[mod_name] \
-                or mth_name not in self._name_tree[mod_name][cls_name]:
-            raise ValueError('Cannot exclude %r because it is not included.' % long_mth_name)
-        self._name_tree[mod_name][cls_name].remove(mth_name)
-        if not self._name_tree[mod_name][cls_name]:
-            del self._name_tree[mod_name][cls_name]
-        if not self._name_tree[mod_name]:
-            del self._name_tree[mod_name]
+            names.append(full_mod_name)
+        dependencies = dict()
+        inspected, errors = inspect_modules(self._discovery_engine, names, self.discovery_workers, dependencies)
+        for full_mod_name, mod_tree in inspected.items():
+            mod_trees[full_mod_name] = mod_tree
+            if self._discovery_cache:
+                self._discovery_cache.put(full_mod_name, src_paths[full_mod_name],
+                                          self._discovery_engine.name, mod_tree, dependencies[full_mod_name])
+        for full_mod_name, error in errors.items():
+            log.error('Failed to discover tests in module %r:\n%s' % (full_mod_name, error))
+        self.discovery_errors.update(errors)
+        return mod_trees
+
+    def _get_module_tree(self, full_mod_name):
+        # A module tree is like {'cls1': ['mth1', 'mth2', ...], 'cls2': [...], ...}
+        src_path = None
+        if self._discovery_cache:
+            src_path = self._discovery_engine.get_source_path(full_mod_name)
+            mod_tree = self._discovery_cache.get(full_mod_name, src_path, self._discovery_engine.name)
+            if mod_tree is not None:
+                return mod_tree
+        # A module served from the cache is only imported if its tests are loaded.
+        if self._discovery_engine.imports_modules:
+            __import__(full_mod_name)
+        mod_tree = self._discovery_engine.inspect_module(full_mod_name)
+        if self._discovery_cache:
+            self._discovery_cache.put(full_mod_name, src_path, self._discovery_engine.name, mod_tree,
+                                      self._discovery_engine.get_dependency_paths(full_mod_name))
+        return mod_tree
 
     def _get_full_method_names_from_tree(self, pkg_name):
         full_method_names = []
@@ -371,7 +648,7 @@ class DefaultTestLoader:
     def _get_dotted_names_dfs(self, tree, prefix, dotted_names):
         for name in tree:
             dotted_name = '.'.join((prefix, name)) if prefix else name
-            if type(tree) is set:  # leaf
+            if isinstance(tree, frozenset):  # leaf
                 dotted_names.append(dotted_name)
-            else:  # tree is dict
+            else:  # tree is NameTree
                 self._get_dotted_names_dfs(tree[name], dotted_name, dotted_names)
\ No newline at end of file
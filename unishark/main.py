@@ -15,6 +15,12 @@
 import abc
 from unishark.util import get_interpreter
 import unishark
+from unishark.durations import DurationStore
+from unishark.scheduler import FailureLimit
+from unishark.suite import RunOptions
+from unishark.autoscale import Autoscaler, AUTO
+from unishark.result import count_failures
+from unishark.distributed import Coordinator, parse_address, is_loopback
 import sys
 import logging
 import concurrent.futures
@@ -22,6 +28,11 @@ import time
 
 log = logging.getLogger(__name__)
 
+_END = object()
+
+_loader_option_keys = ['cache_dir', 'discovery_engine', 'lazy', 'discovery_workers']
+_distributed_option_keys = ['address', 'authkey', 'local_workers']
+
 
 class TestProgram(object):
     __metaclass__ = abc.ABCMeta
@@ -41,13 +52,37 @@ class DefaultTestProgram(TestProgram):
         self.descriptions = descriptions
         self.reporters = self._parse_reporters()
         self.concurrency = self._parse_suites_concurrency()
+        self.loader_options = self._parse_loader_options()
+        self.pipeline = bool(self.test_dict_conf['test'].get('pipeline', False))
+        durations_path = self.test_dict_conf['test'].get('durations')
+        self.durations = DurationStore(durations_path) if durations_path else None
+        max_failures = unishark.DefaultTestLoader.parse_max_failures(self.test_dict_conf['test'])
+        # Shared by the suites, so that no more suites or tests are run once max_failures tests failed in total.
+        self.failure_limit = FailureLimit(max_failures) if max_failures is not None else None
+        self.distributed = self._parse_distributed_options()
+        # The names of the suites with concurrency type fork, which must be the only concurrency in the process.
+        self.fork_suites = self._parse_fork_suites()
+        # The coordinator of the workers running the suites with concurrency type 'distributed', while running.
+        self.coordinator = None
+        # Callables called with the result of each suite as soon as the suite is done.
+        self.result_listeners = []
+        # Module fixtures kept set up after the run (see unishark.daemon.WarmFixtures). None means not kept.
+        self.warm_fixtures = None
 
     def run(self):
-        if self.concurrency['max_workers'] <= 1:
-            return self._run_suites_sequentially()
-        else:
-            return self._run_suites_concurrently(self.concurrency['type'], self.concurrency['max_workers'],
-                                                 self.concurrency['timeout'])
+        if self.distributed is not None:
+            self.coordinator = Coordinator(self.distributed['address'], self.distributed['authkey'])
+            self.coordinator.start_local_workers(self.distributed['local_workers'])
+        try:
+            if self.concurrency['max_workers'] <= 1:
+                return self._run_suites_sequentially()
+            else:
+                return self._run_suites_concurrently(self.concurrency['type'], self.concurrency['max_workers'],
+                                                     self.concurrency['timeout'])
+        finally:
+            if self.coordinator is not None:
+                self.coordinator.shutdown()
+                self.coordinator = None
 
     def _parse_suites_concurrency(self):
         test = self.test_dict_conf['test']
@@ -58,6 +93,10 @@ class DefaultTestProgram(TestProgram):
             'max_workers': 1,
             'timeout': None
         }
+        if concurrency['max_workers'] == AUTO:
+            # The pool of the suites is not resized while running, so its size is decided once.
+            bounds = unishark.DefaultTestLoader.parse_worker_bounds(concurrency)
+            concurrency['max_workers'] = Autoscaler(bounds).initial_workers(concurrency.get('type', 'threads'))
         int(concurrency['max_workers'])  # if concurrency key exists, max_workers is required and must be int
         if 'timeout' not in concurrency:
             concurrency['timeout'] = None
@@ -70,6 +109,61 @@ class DefaultTestProgram(TestProgram):
             raise ValueError('Jython does not support multiprocessing.')
         return concurrency
 
+    def _parse_loader_options(self):
+        test = self.test_dict_conf['test']
+        loader_options = dict(test['loader']) if 'loader' in test and test['loader'] else dict()
+        for key in loader_options:
+            if key not in _loader_option_keys:
+                raise KeyError('Loader option %r is not one of %r.' % (key, _loader_option_keys))
+        return loader_options
+
+    def _parse_distributed_options(self):
+        test = self.test_dict_conf['test']
+        if not test.get('distributed'):
+            return None
+        options = dict(test['distributed'])
+        for key in options:
+            if key not in _distributed_option_keys:
+                raise KeyError('Distributed option %r is not one of %r.' % (key, _distributed_option_keys))
+        options['address'] = parse_address(options.get('address', 'localhost:0'))
+        options['authkey'] = options.get('authkey')
+        if options['authkey'] is None and not is_loopback(options['address'][0]):
+            raise ValueError('Distributed option authkey is required when address %s is not a loopback address.'
+                             % options['address'][0])
+        options['local_workers'] = int(options.get('local_workers', 0))
+        if self.concurrency['max_workers'] > 1 and self.concurrency['type'] == 'processes':
+            raise ValueError('Suites cannot share the coordinator of the workers when run in processes.')
+        return options
+
+    def _parse_fork_suites(self):
+        # The combinations always running other threads while the suites run are refused before running anything.
+        suites = self.test_dict_conf['suites']
+        names = [name for name in self.test_dict_conf['test']['suites']
+                 if (suites[name].get('concurrency') or dict()).get('type') == 'fork']
+        if not names:
+            return names
+        if self.pipeline:
+            reason = 'the next suite is loaded in a thread in pipeline mode'
+        elif self.distributed is not None:
+            reason = 'the coordinator of the distributed workers accepts them in a thread'
+        elif self.concurrency['max_workers'] > 1 and self.concurrency['type'] == 'threads':
+            reason = 'the suites run in threads'
+        else:
+            return names
+        raise ValueError('Suite(s) %r with concurrency type fork must be the only concurrency in the process, '
+                         'but %s.' % (names, reason))
+
+    def _make_loader(self):
+        return unishark.DefaultTestLoader(name_pattern=self.name_pattern, **self.loader_options)
+
+    def _load_suites(self):
+        # Returns an iterable of (suite name, suite content).
+        # In pipeline mode, a suite is loaded only when it is iterated, i.e. after the suites before it are submitted.
+        loader = self._make_loader()
+        if self.pipeline:
+            return loader.iter_tests_from_dict(self.test_dict_conf)
+        return loader.load_tests_from_dict(self.test_dict_conf).items()
+
     @staticmethod
     def _get_class_from_name(long_cls_name):
         parts = long_cls_name.split('.')
@@ -96,53 +190,117 @@ class DefaultTestProgram(TestProgram):
                     created_reporters.append(reporter_class())
         return created_reporters
 
+    def _get_run_options(self, suite_content, in_process=True):
+        # Returns the keyword arguments of BufferedTestRunner.run for a suite.
+        # The failure limit and the warm fixtures of the program cannot be shared by the suites in other processes.
+        concurrency = suite_content['concurrency']
+        options = RunOptions(concurrency_type=concurrency['type'],
+                             durations=self.durations,
+                             test_timeout=concurrency['test_timeout'],
+                             fixture_timeout=concurrency['fixture_timeout'],
+                             max_failures=suite_content.get('max_failures'),
+                             failure_limit=self.failure_limit if in_process else None,
+                             executor=self.coordinator,
+                             warm_fixtures=self.warm_fixtures if in_process else None,
+                             resources=concurrency.get('resources'),
+                             resource_tags=concurrency.get('resource_tags'),
+                             worker_bounds=concurrency.get('worker_bounds'))
+        return {
+            'max_workers': concurrency['max_workers'],
+            'concurrency_level': concurrency['level'],
+            'timeout': concurrency['timeout'],
+            'options': options
+        }
+
+    def _is_stopped(self):
+        return self.failure_limit is not None and self.failure_limit.reached
+
+    def _log_stopped(self):
+        log.warning('Stopped running the suites after %d failed test(s) and fixture(s).' % self.failure_limit.count)
+
+    def _notify_result(self, result):
+        for listener in self.result_listeners:
+            listener(result)
+
+    def _record_durations(self, result):
+        if self.durations is not None:
+            self.durations.update(result)
+
+    def _save_durations(self):
+        if self.durations is not None:
+            self.durations.save()
+
     def _run_suites_sequentially(self):
         exit_code = 0
-        suites = unishark.DefaultTestLoader(name_pattern=self.name_pattern).load_tests_from_dict(self.test_dict_conf)
+        suites = self._load_suites()
+        if self.pipeline:
+            # The next suite is loaded in a thread while a suite runs.
+            suites = _prefetch(suites)
         runner = unishark.BufferedTestRunner(reporters=self.reporters,
                                              verbosity=self.verbosity,
                                              descriptions=self.descriptions)
-        for suite_name, suite_content in suites.items():
+        for suite_name, suite_content in suites:
+            if self._is_stopped():
+                # In pipeline mode, the remaining suites (but the one loaded in advance) are not even loaded.
+                self._log_stopped()
+                break
             package_name = suite_content['package']
             suite = suite_content['suite']
-            concurrency = suite_content['concurrency']
             result = runner.run(suite, name=suite_name, description='Package: ' + package_name,
-                                max_workers=concurrency['max_workers'], concurrency_level=concurrency['level'],
-                                timeout=concurrency['timeout'])
+                                **self._get_run_options(suite_content))
             exit_code += 0 if result.wasSuccessful() else 1
+            self._record_durations(result)
+            self._notify_result(result)
+        self._save_durations()
         for reporter in self.reporters:
             reporter.collect()
         return exit_code
 
     def _run_suites_concurrently(self, concurrency_type, max_workers_on_suites, timeout):
         exit_code = 0
-        suites = unishark.DefaultTestLoader(name_pattern=self.name_pattern).load_tests_from_dict(self.test_dict_conf)
+        suites = self._load_suites()
         if concurrency_type == 'processes':
             pool = concurrent.futures.ProcessPoolExecutor
         else:
             pool = concurrent.futures.ThreadPoolExecutor
         start_time = time.time()
+        in_processes = concurrency_type == 'processes'
         with pool(max_workers_on_suites) as executor:
-            futures = []
-            for suite_name, suite_content in suites.items():
+            futures = dict()
+            for suite_name, suite_content in suites:
                 package_name = suite_content['package']
                 suite = suite_content['suite']
-                concurrency = suite_content['concurrency']
                 runner = unishark.BufferedTestRunner(reporters=self.reporters,
                                                      verbosity=self.verbosity,
                                                      descriptions=self.descriptions)
                 future = executor.submit(runner.run, suite,
                                          name=suite_name,
                                          description='Package: ' + package_name,
-                                         max_workers=concurrency['max_workers'],
-                                         concurrency_level=concurrency['level'],
-                                         timeout=concurrency['timeout'])
-                futures.append(future)
-            results = [future.result() for future in concurrent.futures.as_completed(futures, timeout=timeout)]
+                                         **self._get_run_options(suite_content, in_process=not in_processes))
+                futures[future] = suite_name
+            results = []
+            for future in concurrent.futures.as_completed(futures, timeout=timeout):
+                if future.cancelled():
+                    continue
+                result = future.result()
+                results.append(result)
+                self._notify_result(result)
+                if in_processes and self.failure_limit is not None:
+                    self.failure_limit.add(count_failures(result))
+                if self._is_stopped():
+                    # The running suites are drained and reported, the queued ones are cancelled.
+                    for f in futures:
+                        f.cancel()
+            cancelled = [name for f, name in futures.items() if f.cancelled()]
+        if cancelled:
+            self._log_stopped()
+            log.info('Cancelled suite(s): %r' % cancelled)
         actual_duration = time.time() - start_time
         log.info('Actual total time taken: %.3fs' % actual_duration)
         for result in results:
             exit_code += 0 if result.wasSuccessful() else 1
+            self._record_durations(result)
+        self._save_durations()
         if len(self.reporters):
             log.info('Summarizing reports of suites.')
             start_time = time.time()
@@ -154,6 +312,19 @@ class DefaultTestProgram(TestProgram):
         return exit_code
 
 
+def _prefetch(items):
+    # Yields the items of an iterable, getting the next item in a thread while the caller uses the current one.
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        items = iter(items)
+        future = executor.submit(next, items, _END)
+        while True:
+            item = future.result()
+            if item is _END:
+                break
+            future = executor.submit(next, items, _END)
+            yield item
+
+
 def main(test_program):
     if not isinstance(test_program, TestProgram):
         raise TypeError
@@ -0,0 +1,91 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# The operations of the steps in an execution plan.
+SETUP = 0
+TEARDOWN = 1
+RUN = 2
+
+
+class ModuleEntry(object):
+    """A test module in an execution plan, with the names of its fixtures computed once."""
+    setup_attr = 'setUpModule'
+    teardown_attr = 'tearDownModule'
+
+    def __init__(self, name):
+        self.name = name
+        self.setup_key = name + '.setUpModule'
+        self.teardown_key = name + '.tearDownModule'
+
+    def get_key(self, attr):
+        return self.setup_key if attr == self.setup_attr else self.teardown_key
+
+    def get_error_name(self, attr):
+        return '%s:%s' % (self.name, attr)
+
+
+class ClassEntry(object):
+    """A test class in an execution plan, with its module entry and the names of its fixtures computed once."""
+    setup_attr = 'setUpClass'
+    teardown_attr = 'tearDownClass'
+
+    def __init__(self, test_class, module):
+        self.test_class = test_class
+        self.module = module
+        self.name = '.'.join((module.name, test_class.__name__))
+        self.setup_key = self.name + '.setUpClass'
+        self.teardown_key = self.name + '.tearDownClass'
+
+    def get_key(self, attr):
+        return self.setup_key if attr == self.setup_attr else self.teardown_key
+
+    def get_error_name(self, attr):
+        return '%s:%s:%s' % (self.module.name, self.test_class.__name__, attr)
+
+
+class ExecutionPlan(object):
+    """
+    The steps running a well-formed suite in order, flattened from the suite tree once.
+    A step is a tuple (operation, entry, argument):
+      (SETUP, module or class entry, index of the matching TEARDOWN step),
+      (TEARDOWN, module or class entry, None),
+      (RUN, class entry, test case).
+    A sub-suite of the tree runs the steps from its SETUP to its TEARDOWN, so it can be run on its own.
+    """
+    def __init__(self):
+        self.steps = []
+        self.modules = []
+        self.classes = []
+
+    def __len__(self):
+        return len(self.steps)
+
+    def open(self, entry):
+        """Appends the SETUP step of entry and returns its index, to close it after the steps of its tests."""
+        if isinstance(entry, ClassEntry):
+            self.classes.append(entry)
+        else:
+            self.modules.append(entry)
+        self.steps.append((SETUP, entry, None))
+        return len(self.steps) - 1
+
+    def close(self, index):
+        """Appends the TEARDOWN step matching the SETUP step at index."""
+        entry = self.steps[index][1]
+        self.steps[index] = (SETUP, entry, len(self.steps))
+        self.steps.append((TEARDOWN, entry, None))
+
+    def add_test(self, entry, test):
+        self.steps.append((RUN, entry, test))
@@ -16,7 +16,7 @@ from unittest import TextTestResult
 import time
 from sys import stdout, stderr, version_info
 import traceback
-from unishark.util import (get_long_class_name, get_long_method_name, get_module_name)
+from unishark.util import (get_long_class_name, get_long_method_name, get_module_name, get_full_method_name)
 import threading
 from collections import deque
 from inspect import ismodule
@@ -43,6 +43,13 @@ else:  # Python3.x
 if _io is None or not ismodule(_io):
     raise ImportError
 
+try:
+    from contextvars import ContextVar
+    # Set in each asyncio task running tests, so that the tests interleaved in one thread have separate buffers.
+    buffer_context = ContextVar('unishark_buffer_context', default=None)
+except ImportError:  # Python < 3.7
+    buffer_context = None
+
 
 def _make_buffer():
     return _io.StringIO()
@@ -63,36 +70,42 @@ class _PooledIOBuffer(object):
             else:
                 return self.buff_queue.popleft()
 
-    def write(self, *args, **kwargs):
+    @staticmethod
+    def _get_key():
         i = threading.current_thread().ident
+        context = buffer_context.get() if buffer_context is not None else None
+        return i if context is None else (i, context)
+
+    def write(self, *args, **kwargs):
+        i = self._get_key()
         if i not in self.buff_dict:
             buff = self._get_buff()
             self.buff_dict[i] = buff
         self.buff_dict[i].write(*args, **kwargs)
 
     def getvalue(self, *args, **kwargs):
-        i = threading.current_thread().ident
+        i = self._get_key()
         return self.buff_dict[i].getvalue(*args, **kwargs) if i in self.buff_dict else None
 
     def flush(self, *args, **kwargs):
-        i = threading.current_thread().ident
+        i = self._get_key()
         if i in self.buff_dict:
             self.buff_dict[i].flush(*args, **kwargs)
 
     def seek(self, *args, **kwargs):
-        i = threading.current_thread().ident
+        i = self._get_key()
         if i in self.buff_dict:
             self.buff_dict[i].seek(*args, **kwargs)
 
     def truncate(self, *args, **kwargs):
-        i = threading.current_thread().ident
+        i = self._get_key()
         if i in self.buff_dict:
             self.buff_dict[i].truncate(*args, **kwargs)
 
     def free(self):
-        i = threading.current_thread().ident
+        i = self._get_key()
         if i in self.buff_dict:
-            buff = self.buff_dict.pop(threading.current_thread().ident)
+            buff = self.buff_dict.pop(i)
             buff.seek(0)
             buff.truncate()
             self.buff_queue.append(buff)
@@ -122,6 +135,10 @@ class BufferedTestResult(TextTestResult):
         self.name = 'test'
         self.description = ''
         self.children = []
+        # key: fixture name like package.module.setUpModule, value: duration of the fixture
+        self.fixture_durations = dict()
+        # key: full method name like package.module.class.method, value: duration of the test
+        self.test_durations = dict()
 
     def __len__(self):
         return len(self.children)
@@ -158,6 +175,7 @@ class BufferedTestResult(TextTestResult):
         output = output or 'No Log\n'
         trace_back = trace_back or 'No Exception\n'
         self.results[mod_name][cls_name].append((test_name, test_doc, duration, status, output, trace_back))
+        self.test_durations[get_full_method_name(test)] = duration
 
     @staticmethod
     def _get_test_info(test):
@@ -252,10 +270,17 @@ def combine_results(result, results):
         result.expectedFailures.extend(r.expectedFailures)
         result.unexpectedSuccesses.extend(r.unexpectedSuccesses)
         result.successes += r.successes
+        result.fixture_durations.update(r.fixture_durations)
+        result.test_durations.update(r.test_durations)
         for mod_name, mod in r.results.items():
             if mod_name not in result.results:
                 result.results[mod_name] = dict()
             for cls_name, tups in mod.items():
                 if cls_name not in result.results[mod_name]:
                     result.results[mod_name][cls_name] = []
-                result.results[mod_name][cls_name].extend(tups)
\ No newline at end of file
+                result.results[mod_name][cls_name].extend(tups)
+
+
+def count_failures(result):
+    """Returns the number of failed tests (failures, errors and unexpected successes) in result."""
+    return len(result.failures) + len(result.errors) + len(result.unexpectedSuccesses)
@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from unittest import TextTestRunner
-from unishark.suite import TestSuite, convert
+from unishark.suite import TestSuite, RunOptions, convert
 from unishark.result import BufferedTestResult, out, WritelnDecorator
 from unishark.reporter import Reporter
 from unittest.signals import registerResult
@@ -33,10 +33,11 @@ _concurrency_level_to_int = {
 
 
 class BufferedTestRunner(TextTestRunner):
-    def __init__(self, reporters=None, verbosity=1, descriptions=False):
+    def __init__(self, reporters=None, verbosity=1, descriptions=False, failfast=False):
         super(BufferedTestRunner, self).__init__(buffer=False,
                                                  verbosity=verbosity,
                                                  descriptions=descriptions,
+                                                 failfast=failfast,
                                                  resultclass=BufferedTestResult)
         if reporters:
             self.reporters = reporters
@@ -133,8 +134,13 @@ class BufferedTestRunner(TextTestRunner):
             return False
         return True
 
-    def run(self, test, name='test', description='', max_workers=1, concurrency_level='class', timeout=None):
+    def run(self, test, name='test', description='', max_workers=1, concurrency_level='class', timeout=None,
+            options=None):
         result = self._before_run()
+        if options is None:
+            options = RunOptions()
+        if self.failfast and options.max_failures is None:
+            options = options.replace(max_failures=1)
         result.name = name
         result.description = description
         start_time = time.time()
@@ -145,10 +151,11 @@ class BufferedTestRunner(TextTestRunner):
             if not self.__class__._is_suite(test):
                 test(result)
             else:
-                test = convert(test)
+                # The work is ordered longest first only if it runs concurrently.
+                test = convert(test, options.durations if max_workers != 1 else None)
                 self.make_results_tree(test, result)
                 test.run(result, concurrency_level=_concurrency_level_to_int[concurrency_level],
-                         max_workers=max_workers, timeout=timeout)
+                         max_workers=max_workers, timeout=timeout, options=options)
         finally:
             stop_test_run = getattr(result, 'stopTestRun', None)
             if stop_test_run is not None:
@@ -0,0 +1,350 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import sys
+import time
+import threading
+import collections
+import concurrent.futures
+import logging
+
+log = logging.getLogger(__name__)
+
+# The names of the resources a test method, a test class or a test module holds while it runs.
+RESOURCES_ATTR = '__unishark_resources__'
+
+# Returned for a task source whose next task waits for its resources.
+_BLOCKED = object()
+
+# The seconds the workers are given to finish their current tasks after a timeout.
+_STOP_GRACE = 1.0
+
+
+class Countdown(object):
+    """Calls on_zero once, in the thread which counts the counter down to 0."""
+    def __init__(self, count, on_zero):
+        self._count = count
+        self._on_zero = on_zero
+        self._lock = threading.Lock()
+
+    def count_down(self):
+        with self._lock:
+            self._count -= 1
+            reached = self._count == 0
+        if reached:
+            self._on_zero()
+
+
+class FailureLimit(object):
+    """
+    Counts the failed tests (failures, errors and unexpected successes) from any thread.
+    It is reached once max_failures are counted, or once its parent limit (e.g. of the whole test program) is reached.
+    A limit without max_failures only passes the count on to its parent.
+    """
+    def __init__(self, max_failures=None, parent=None):
+        if max_failures is not None and max_failures <= 0:
+            raise ValueError('max_failures must be greater than 0.')
+        self.max_failures = max_failures
+        self.parent = parent
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        return self._count
+
+    def add(self, count=1):
+        if count <= 0:
+            return
+        with self._lock:
+            self._count += count
+        if self.parent is not None:
+            self.parent.add(count)
+
+    @property
+    def reached(self):
+        if self.max_failures is not None and self._count >= self.max_failures:
+            return True
+        return self.parent is not None and self.parent.reached
+
+
+class ResourcePool(object):
+    """
+    The free units of named resources, e.g. {'db': 2}. A resource without a capacity is not limited.
+    Not thread-safe: it is used with the lock of its scheduler acquired.
+    """
+    def __init__(self, capacities):
+        for name, capacity in capacities.items():
+            if capacity <= 0:
+                raise ValueError('Capacity of resource %r must be greater than 0.' % name)
+        self.capacities = dict(capacities)
+        self._free = dict(capacities)
+
+    def available(self, names):
+        return all(self._free.get(name, 1) > 0 for name in names)
+
+    def acquire(self, names):
+        for name in names:
+            if name in self._free:
+                self._free[name] -= 1
+
+    def release(self, names):
+        for name in names:
+            if name in self._free:
+                self._free[name] += 1
+
+
+class ResourceTask(object):
+    """A task holding one unit of each of its resources while it runs."""
+    __slots__ = ('fn', 'resources')
+
+    def __init__(self, fn, resources):
+        self.fn = fn
+        self.resources = resources
+
+    def __call__(self):
+        return self.fn()
+
+    def __repr__(self):
+        return 'ResourceTask(%r, %r)' % (self.fn, sorted(self.resources))
+
+
+class _TaskSource(object):
+    # An iterator of tasks whose next task can be peeked at, so a task waiting for its resources stays queued.
+    __slots__ = ('_tasks', 'head')
+
+    def __init__(self, tasks):
+        self._tasks = iter(tasks)
+        self.head = None
+
+    def peek(self):
+        if self.head is None:
+            self.head = next(self._tasks, None)
+        return self.head
+
+
+class WorkStealingScheduler(object):
+    """
+    Runs tasks (callables without arguments) on a number of worker threads.
+    Tasks are queued as task sources, i.e. iterators of tasks, which are only advanced when a worker takes a task,
+    so queuing the methods of a class with thousands of tests costs one queue entry.
+    Each worker has a deque of task sources. A worker takes tasks from the newest source in its own deque,
+    and an idle worker steals tasks from the oldest source in the deque of another worker.
+    Urgent task sources (e.g. fixtures gating other tasks) are shared by all the workers and taken first in FIFO order.
+    With a ResourcePool, a ResourceTask is only taken once its resources are free, and the workers take the tasks
+    of the other sources meanwhile.
+    With an Autoscaler, the workers are resized at each of its intervals, starting with max_workers.
+    With fifo, the sources are queued in one deque, from which all the workers take the oldest source first,
+    so the work starts in the order it is queued, e.g. longest first.
+    """
+    def __init__(self, max_workers, resources=None, autoscaler=None, fifo=False):
+        if max_workers <= 0:
+            raise ValueError('max_workers must be greater than 0.')
+        self.max_workers = max_workers
+        self.peak_workers = max_workers
+        self._cond = threading.Condition()
+        self._urgent = collections.deque()
+        self._deques = [collections.deque() for _ in range(max_workers)]
+        self._resources = resources
+        self._autoscaler = autoscaler
+        self._fifo = fifo
+        self._threads = []
+        self._alive = set()  # indexes of the running workers
+        self._busy = 0  # counted with an autoscaler only
+        self._done_tasks = 0  # counted with an autoscaler only
+        self._local = threading.local()
+        self._stopped = False
+        self._done = threading.Event()
+        self._exc_info = None
+
+    def spawn(self, tasks, urgent=False):
+        """
+        Queues an iterable of tasks on the deque of the current worker
+        (or on the first deque out of the workers or with fifo).
+        """
+        source = iter(tasks) if self._resources is None else _TaskSource(tasks)
+        with self._cond:
+            if urgent:
+                self._urgent.append(source)
+            else:
+                self._deques[0 if self._fifo else getattr(self._local, 'index', 0)].append(source)
+            self._cond.notify_all()
+
+    def submit(self, task, urgent=False):
+        self.spawn((task,), urgent=urgent)
+
+    def stop(self):
+        """Stops the workers after their current tasks. Called when the work is done."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._done.set()
+
+    def run(self, task, timeout=None):
+        """
+        Runs task and all the tasks spawned from it, until stop() is called.
+        Raises concurrent.futures.TimeoutError if stop() is not called within timeout seconds,
+        or re-raises the first exception raised by a task.
+        After a timeout, the workers still running their tasks are left behind (they are daemon threads).
+        """
+        self.submit(task)
+        with self._cond:
+            self._alive.update(range(self.max_workers))
+        for i in range(self.max_workers):
+            self._start_worker(i)
+        monitor = None
+        if self._autoscaler is not None:
+            monitor = threading.Thread(target=self._autoscale, name='unishark-autoscaler')
+            monitor.daemon = True
+            monitor.start()
+        finished = self._done.wait(timeout)
+        if not finished:
+            self.stop()
+        if monitor is not None:
+            monitor.join()
+        deadline = None if finished else time.time() + _STOP_GRACE
+        for worker in list(self._threads):
+            worker.join(None if deadline is None else max(0, deadline - time.time()))
+        if deadline is not None:
+            stuck = [worker.name for worker in self._threads if worker.is_alive()]
+            if stuck:
+                log.warning('Left behind the workers still running their tasks: %r.' % stuck)
+        if self._exc_info is not None:
+            raise self._exc_info[1]
+        if not finished:
+            raise concurrent.futures.TimeoutError('Tests are not finished in %r seconds.' % timeout)
+
+    def resize(self, count):
+        """
+        Sets the number of workers. The workers beyond count exit after their current tasks,
+        and the tasks queued on them are stolen by the others.
+        """
+        if count <= 0:
+            raise ValueError('count must be greater than 0.')
+        with self._cond:
+            if self._stopped:
+                return
+            log.debug('Resizing the workers from %d to %d.' % (self.max_workers, count))
+            self.max_workers = count
+            self.peak_workers = max(self.peak_workers, count)
+            while len(self._deques) < count:
+                self._deques.append(collections.deque())
+            # A worker beyond the previous count which has not exited yet goes on.
+            indexes = [i for i in range(count) if i not in self._alive]
+            self._alive.update(indexes)
+            self._cond.notify_all()
+        for i in indexes:
+            self._start_worker(i)
+
+    def _start_worker(self, index):
+        worker = threading.Thread(target=self._work, args=(index,), name='unishark-worker-%d' % index)
+        worker.daemon = True
+        self._threads.append(worker)
+        worker.start()
+
+    def _autoscale(self):
+        while not self._done.wait(self._autoscaler.interval):
+            with self._cond:
+                workers, busy, done = self.max_workers, self._busy, self._done_tasks
+                queued = bool(self._urgent) or any(self._deques)
+            count = self._autoscaler.update(workers, busy, queued, done)
+            if count != workers:
+                self.resize(count)
+
+    def _take(self, index):
+        # Must be called with self._cond acquired. Returns a task, or None if there is nothing to take.
+        task = self._take_from(self._urgent)
+        if task is None:
+            task = self._take_from(self._deques[index], newest_first=not self._fifo)
+        count = len(self._deques)
+        for i in range(1, count):
+            if task is not None:
+                break
+            task = self._take_from(self._deques[(index + i) % count])
+        return task
+
+    def _take_from(self, sources, newest_first=False):
+        # Returns the next task of the first source (or the newest one) with a task to run,
+        # dropping the exhausted sources and skipping the ones whose next task waits for its resources.
+        blocked = 0
+        while len(sources) > blocked:
+            position = -1 - blocked if newest_first else blocked
+            task = self._next_task(sources[position])
+            if task is None:
+                del sources[position]
+            elif task is _BLOCKED:
+                blocked += 1
+            else:
+                return task
+        return None
+
+    def _next_task(self, source):
+        if self._resources is None:
+            return next(source, None)
+        task = source.peek()
+        if isinstance(task, ResourceTask):
+            if not self._resources.available(task.resources):
+                return _BLOCKED
+            self._resources.acquire(task.resources)
+        source.head = None
+        return task
+
+    def _work(self, index):
+        self._local.index = index
+        while True:
+            with self._cond:
+                task = None
+                while not self._stopped and index < self.max_workers:
+                    task = self._take(index)
+                    if task is not None:
+                        break
+                    self._cond.wait()
+                if task is None:
+                    self._alive.discard(index)
+                    return
+                if self._autoscaler is not None:
+                    self._busy += 1
+            try:
+                task()
+            except BaseException:
+                log.error('Task %r raised an exception.' % task, exc_info=True)
+                with self._cond:
+                    if self._exc_info is None:
+                        self._exc_info = sys.exc_info()
+                self.stop()
+            finally:
+                self._finish(task)
+
+    def _finish(self, task):
+        # Releases the resources of a task and counts it as done for the autoscaler.
+        holds_resources = isinstance(task, ResourceTask) and self._resources is not None
+        if not holds_resources and self._autoscaler is None:
+            return
+        with self._cond:
+            if self._autoscaler is not None:
+                self._busy -= 1
+                self._done_tasks += 1
+            if holds_resources:
+                self._resources.release(task.resources)
+                self._cond.notify_all()
@@ -0,0 +1,100 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import re
+
+# The trie node key marking the end of an excluded name. The value is the excluded name as it was given.
+_END = None
+
+
+class NameSelector(object):
+    """
+    Decides whether a test is selected by its full name like (package.)module.class.method in one pass.
+    The name pattern (matched against the short method name), the long name pattern (matched against
+    the last long_name_depth parts of the name) and the excluded names are compiled once,
+    so a selector can be reused for any number of names.
+    The excluded names are dotted names relative to prefix like 'module', 'module.class' or 'module.class.method',
+    and are kept in a prefix trie. A name is excluded if any of its leading parts is an excluded name.
+    """
+    def __init__(self, name_pattern, long_name_pattern=None, long_name_depth=3, prefix=None, except_names=()):
+        self._name_regex = re.compile(name_pattern)
+        self._long_name_regex = re.compile(long_name_pattern) if long_name_pattern else None
+        self._long_name_depth = long_name_depth
+        self._prefix_len = len(prefix) + 1 if prefix else 0
+        self._except_trie = dict()
+        for except_name in except_names:
+            node = self._except_trie
+            for part in except_name.split('.'):
+                node = node.setdefault(part, dict())
+            node[_END] = except_name
+
+    def get_exclusion(self, full_name):
+        """Returns the excluded name which excludes the test, or None if the test is not excluded."""
+        node = self._except_trie
+        if not node:
+            return None
+        for part in full_name[self._prefix_len:].split('.'):
+            node = node.get(part)
+            if node is None:
+                return None
+            if _END in node:
+                return node[_END]
+        return None
+
+    def match(self, full_name):
+        """Returns True if the test name matches the patterns, regardless of the excluded names."""
+        if self._long_name_regex is not None:
+            start = len(full_name)
+            for _ in range(self._long_name_depth):
+                start = full_name.rfind('.', 0, start)
+                if start < 0:
+                    break
+            if not self._long_name_regex.match(full_name[start + 1:]):
+                return False
+        return self._name_regex.match(full_name[full_name.rfind('.') + 1:]) is not None
+
+    def is_selected(self, full_name):
+        return self.get_exclusion(full_name) is None and self.match(full_name)
+
+    def select(self, full_names, strict=False):
+        """
+        Returns the list of the selected test names.
+        If strict is True, raises ValueError if an excluded name does not exclude any of the given tests.
+        """
+        selected = []
+        used_exclusions = set()
+        for full_name in full_names:
+            exclusion = self.get_exclusion(full_name)
+            if exclusion is not None:
+                used_exclusions.add(exclusion)
+            elif self.match(full_name):
+                selected.append(full_name)
+        if strict:
+            for except_name in self._get_except_names():
+                if except_name not in used_exclusions:
+                    raise ValueError('Cannot exclude %r because it is not included.' % except_name)
+        return selected
+
+    def _get_except_names(self):
+        except_names = []
+        nodes = [self._except_trie]
+        while nodes:
+            node = nodes.pop()
+            for part, child in node.items():
+                if part is _END:
+                    except_names.append(child)
+                else:
+                    nodes.append(child)
+        return sorted(except_names)
@@ -15,9 +15,28 @@
 
 from unittest.suite import TestSuite as UnitTestSuite
 from unittest.case import SkipTest
+from functools import partial
+import os
 import sys
-from unishark.util import get_module_name
-from unishark.result import combine_results
+import copy
+import time
+import pickle
+import select
+import signal
+import traceback
+import threading
+import collections
+import multiprocessing
+import multiprocessing.connection
+from unishark.util import (get_module_name, get_long_class_name, get_long_method_name, get_method_name,
+                           get_full_method_name)
+from unishark.result import combine_results, count_failures
+from unishark.scheduler import (WorkStealingScheduler, Countdown, FailureLimit, ResourcePool, ResourceTask,
+                                RESOURCES_ATTR)
+from unishark.watchdog import call_with_timeout, GuardedResult, TIMEOUT_ATTR
+from unishark.exception import TimeoutExpired
+from unishark.autoscale import Autoscaler, AUTO
+from unishark.plan import ExecutionPlan, ModuleEntry, ClassEntry, SETUP, RUN
 import concurrent.futures
 import logging
 
@@ -25,6 +44,18 @@ _ErrorHolder = getattr(getattr(__import__('unittest'), 'suite'), '_ErrorHolder')
 
 log = logging.getLogger(__name__)
 
+# The status of the results sent back by a forked worker or a worker process of its own.
+_RESULT = 'result'
+_ERROR = 'error'
+
+
+class _TimedOut(BaseException):
+    # Raised after a timed out test or fixture is recorded in a worker process of its own,
+    # to stop its batch so that the process can be terminated with the thread left running.
+    def __init__(self, in_test):
+        super(_TimedOut, self).__init__(in_test)
+        self.in_test = in_test
+
 
 def _is_suite(test):
     try:
@@ -35,6 +66,9 @@ def _is_suite(test):
 
 
 def _get_level(test):
+    level = getattr(test, '_level', None)
+    if level is not None:  # compiled into an execution plan
+        return level
     if not _is_suite(test):
         return TestSuite.METHOD_LEVEL
     else:
@@ -82,7 +116,16 @@ def _group_test_cases(test, dic):
             _group_test_cases(t, dic)
 
 
-def convert(test):
+def _collect_classes(test, classes):
+    if not _is_suite(test):
+        classes.add(test.__class__)
+    else:
+        for t in test:
+            _collect_classes(t, classes)
+
+
+def convert(test, durations=None):
+    # With durations (a DurationStore), the modules, classes and methods are ordered longest first.
     suite = TestSuite()
     dic = dict()
     _group_test_cases(test, dic)
@@ -93,10 +136,118 @@ def convert(test):
             cls_suite.addTests(cases)
             mod_suite.addTest(cls_suite)
         suite.addTest(mod_suite)
+    if len(suite) > 0:
+        if durations is not None:
+            _order_longest_first(suite, durations)
+        suite.compile()
     log.debug('Converted tests: %r' % suite)
     return suite
 
 
+def _order_longest_first(suite, durations):
+    # Orders the sub-suites and the test cases of a converted suite by their estimated durations, longest first,
+    # so that the longest work starts first at any concurrency level and no worker is left alone with it at the end.
+    # A suite costs the durations of its tests and fixtures in previous runs, and an unknown test costs the mean.
+    # The cost of each module and class level suite is kept in its _cost.
+    get_duration = durations.tests.get
+    default = durations.get_default_test_duration()
+
+    def get_fixtures_cost(entry):
+        return durations.get_fixture_duration(entry.setup_key) + durations.get_fixture_duration(entry.teardown_key)
+
+    for mod_suite in suite:
+        mod_entry = TestSuite._get_entry(mod_suite, TestSuite.MODULE_LEVEL)
+        for cls_suite in mod_suite:
+            cls_entry = TestSuite._get_entry(cls_suite, TestSuite.CLASS_LEVEL, mod_entry)
+            costs = [(get_duration(get_full_method_name(case), default), case) for case in cls_suite]
+            costs.sort(key=lambda c: -c[0])
+            cls_suite._tests = [case for cost, case in costs]
+            cls_suite._cost = sum(cost for cost, case in costs) + get_fixtures_cost(cls_entry)
+        mod_suite._tests.sort(key=lambda t: -t._cost)
+        mod_suite._cost = sum(t._cost for t in mod_suite) + get_fixtures_cost(mod_entry)
+    suite._tests.sort(key=lambda t: -t._cost)
+    suite._cost = sum(t._cost for t in suite)
+
+
+class LazyTestCase(object):
+    """
+    A handle of a test case, which is a full name plus a factory of the test case.
+    The concrete test case is created just before it runs, and dropped right after its result is recorded.
+    The handle looks like an instance of the test class (via __class__), so it can be grouped and run
+    in the same way as a concrete test case.
+    """
+    def __init__(self, full_name, test_class, factory=None):
+        self.full_name = full_name
+        self.test_class = test_class
+        self.factory = factory or partial(test_class, full_name.split('.')[-1])
+
+    @property
+    def __class__(self):
+        return self.test_class
+
+    def __reduce__(self):
+        return LazyTestCase, (self.full_name, self.test_class, self.factory)
+
+    def __repr__(self):
+        return '<LazyTestCase %s>' % self.full_name
+
+    def __str__(self):
+        return self.full_name
+
+    def id(self):
+        return self.full_name
+
+    def countTestCases(self):
+        return 1
+
+    def run(self, result=None):
+        return self.factory().run(result)
+
+    def __call__(self, *args, **kwargs):
+        return self.factory()(*args, **kwargs)
+
+    def debug(self):
+        self.factory().debug()
+
+
+class RunOptions(object):
+    """
+    The options of a run, passed through BufferedTestRunner.run to TestSuite.run:
+    concurrency_type: 'threads', 'processes', 'asyncio', 'distributed' or 'fork'.
+    durations: a DurationStore ordering the work longest first.
+    test_timeout, fixture_timeout: the default timeouts in seconds of a test method and of a fixture.
+    max_failures: stops running the tests after max_failures failed tests and fixtures.
+    failure_limit: a FailureLimit shared with other runs.
+    executor: the executor running the batches with concurrency_type 'distributed', e.g. a unishark.Coordinator.
+    warm_fixtures: a WarmFixtures keeping the module fixtures set up across runs.
+    resources, resource_tags: the units of the named resources, and the tests holding them besides the decorated ones.
+    worker_bounds: [min, max] of the number of workers with max_workers 'auto'.
+    """
+    def __init__(self, concurrency_type='threads', durations=None, test_timeout=None, fixture_timeout=None,
+                 max_failures=None, failure_limit=None, executor=None, warm_fixtures=None, resources=None,
+                 resource_tags=None, worker_bounds=None):
+        self.concurrency_type = concurrency_type
+        self.durations = durations
+        self.test_timeout = test_timeout
+        self.fixture_timeout = fixture_timeout
+        self.max_failures = max_failures
+        self.failure_limit = failure_limit
+        self.executor = executor
+        self.warm_fixtures = warm_fixtures
+        self.resources = resources
+        self.resource_tags = resource_tags
+        self.worker_bounds = worker_bounds
+
+    def replace(self, **kwargs):
+        """Returns a copy of the options with the given ones replaced."""
+        options = copy.copy(self)
+        for name, value in kwargs.items():
+            if not hasattr(options, name):
+                raise TypeError('Unknown run option %r.' % name)
+            setattr(options, name, value)
+        return options
+
+
 class TestSuite(UnitTestSuite):
     ROOT_LEVEL = 0
     MODULE_LEVEL = 1
@@ -107,12 +258,99 @@ class TestSuite(UnitTestSuite):
         super(TestSuite, self).__init__(tests)
         self._successful_fixtures = set()
         self._failed_fixtures = set()
+        # The default timeouts in seconds of a test method and of a fixture, None means no timeout.
+        self.test_timeout = None
+        self.fixture_timeout = None
+        # Whether a timeout stops the run (in a worker process of its own, see _run_batch_in_own_process).
+        self.stop_on_timeout = False
+        # Stops running the tests once reached. None means no limit.
+        self.failure_limit = None
+        # Keeps the module fixtures set up across runs in this process. None means the fixtures are not kept.
+        self.warm_fixtures = None
+        # The free units of the resources held by the tests while they run. None means the resources are not limited.
+        self.resource_pool = None
+        self._resource_tags = dict()  # key: long name of a module, class or method, value: names of its resources
+        self._class_resources = dict()  # key: test class, value: names of the resources of the class and its module
+        # Set when the suite is compiled into an execution plan:
+        # the level of the suite in the tree, its module or class entry, and (plan, first step, end step).
+        self._level = None
+        self._entry = None
+        self._span = None
+        # The estimated duration of the suite, set when converted with durations (see _order_longest_first).
+        self._cost = None
+        # The durations of the tests in previous runs (a DurationStore), or None if unknown.
+        self.durations = None
 
     def __len__(self):
         return len(self._tests)
 
+    def __getstate__(self):
+        # A sub-suite sent to another process does not carry the plan of the whole tree.
+        state = self.__dict__.copy()
+        state['_span'] = None
+        return state
+
+    def compile(self):
+        """
+        Flattens the well-formed suite into an execution plan, and returns the plan.
+        Each sub-suite gets its level, entry and span in the plan, so it is never inspected again when run.
+        """
+        plan = ExecutionPlan()
+        self._compile(self, _get_level(self), plan)
+        return plan
+
+    def _compile(self, test, level, plan, parent=None):
+        assert isinstance(test, TestSuite)
+        assert len(test) > 0
+        start = len(plan)
+        if level == TestSuite.ROOT_LEVEL:
+            for t in test:
+                self._compile(t, TestSuite.MODULE_LEVEL, plan)
+        elif level == TestSuite.MODULE_LEVEL:
+            entry = self._get_entry(test, level)
+            index = plan.open(entry)
+            for t in test:
+                self._compile(t, TestSuite.CLASS_LEVEL, plan, entry)
+            plan.close(index)
+        elif level == TestSuite.CLASS_LEVEL:
+            entry = self._get_entry(test, level, parent)
+            index = plan.open(entry)
+            for case in test:
+                assert not _is_suite(case)
+                plan.add_test(entry, case)
+            plan.close(index)
+        else:
+            raise NotImplementedError
+        test._level = level
+        test._span = plan, start, len(plan)
+
+    @staticmethod
+    def _get_entry(test, level=None, parent=None):
+        # Returns the module or class entry of a module or class level suite.
+        entry = getattr(test, '_entry', None)
+        if entry is None:
+            if level is None:
+                level = _get_level(test)
+            if level == TestSuite.MODULE_LEVEL:
+                entry = ModuleEntry(_get_current_module(test))
+            else:
+                current_class = _get_current_class(test)
+                entry = ClassEntry(current_class, parent or ModuleEntry(current_class.__module__))
+            test._entry = entry
+        return entry
+
+    def _get_span(self, test):
+        # Returns (plan, first step, end step) of a well-formed suite at any level, compiling it if needed.
+        span = getattr(test, '_span', None)
+        if span is None:
+            self._compile(test, _get_level(test), ExecutionPlan())
+            span = test._span
+        return span
+
     def validate(self):
         assert len(self) > 0
+        if self._span is not None:  # well-formed, as checked when compiled
+            return
         for mod_suite in self:
             assert _is_suite(mod_suite)
             assert isinstance(mod_suite, TestSuite)
@@ -135,19 +373,157 @@ class TestSuite(UnitTestSuite):
                 for case_result in cls_result:
                     assert type(case_result) is type(result)
 
-    def run(self, result, debug=False, concurrency_level=ROOT_LEVEL, max_workers=1, timeout=None):
+    def run(self, result, debug=False, concurrency_level=ROOT_LEVEL, max_workers=1, timeout=None, options=None):
+        if options is None:
+            options = RunOptions()
+        concurrency_type = options.concurrency_type
         if concurrency_level < TestSuite.ROOT_LEVEL or concurrency_level > TestSuite.METHOD_LEVEL:
             raise ValueError('concurrency_level must be between %d and %d.'
                              % (TestSuite.ROOT_LEVEL, TestSuite.METHOD_LEVEL))
-        if debug or self.countTestCases() <= 0 or max_workers <= 1:
+        if concurrency_type not in ('threads', 'processes', 'asyncio', 'distributed', 'fork'):
+            raise ValueError('concurrency_type must be one of %r.'
+                             % ['threads', 'processes', 'asyncio', 'distributed', 'fork'])
+        if concurrency_type in ('processes', 'distributed') \
+                and concurrency_level not in (TestSuite.MODULE_LEVEL, TestSuite.CLASS_LEVEL):
+            raise ValueError('concurrency_level must be %d or %d with %s.'
+                             % (TestSuite.MODULE_LEVEL, TestSuite.CLASS_LEVEL, concurrency_type))
+        if concurrency_type == 'distributed' and options.executor is None:
+            raise ValueError('concurrency_type distributed requires an executor, e.g. a unishark.Coordinator.')
+        if concurrency_type == 'fork':
+            if not hasattr(os, 'fork'):
+                raise ValueError('concurrency_type fork requires os.fork, which is not available on this platform.')
+            if concurrency_level == TestSuite.ROOT_LEVEL:
+                raise ValueError('concurrency_level must be greater than %d with fork.' % TestSuite.ROOT_LEVEL)
+        if options.resources and concurrency_type != 'threads':
+            raise ValueError('resources are only limited with concurrency_type threads.')
+        autoscaler = None
+        if max_workers == AUTO:
+            # Only the threads of the scheduler are resized while running.
+            autoscaler = Autoscaler(options.worker_bounds)
+            max_workers = autoscaler.initial_workers(concurrency_type)
+            if concurrency_type != 'threads':
+                autoscaler = None
+        if debug or self.countTestCases() <= 0:
             return super(TestSuite, self).run(result, debug=debug)
-        self.validate()
-        self.validate_result(result)
-        with concurrent.futures.ThreadPoolExecutor(max_workers) as main_executor:
-            self._run(self, result, TestSuite.ROOT_LEVEL, concurrency_level, main_executor, timeout)
+        self.test_timeout = options.test_timeout
+        self.fixture_timeout = options.fixture_timeout
+        self.failure_limit = None
+        if options.max_failures is not None or options.failure_limit is not None:
+            self.failure_limit = FailureLimit(options.max_failures, parent=options.failure_limit)
+        self.warm_fixtures = options.warm_fixtures
+        self.durations = options.durations
+        self.resource_pool = ResourcePool(options.resources) if options.resources else None
+        self._resource_tags = dict()
+        for resource, names in (options.resource_tags or dict()).items():
+            for name in names:
+                self._resource_tags.setdefault(name, set()).add(resource)
+        self._class_resources = dict()
+        if max_workers <= 1 and autoscaler is None and concurrency_type not in ('asyncio', 'distributed'):
+            if self.failure_limit is None and self.warm_fixtures is None and not self._has_timeouts():
+                return super(TestSuite, self).run(result, debug=debug)
+            # Timeouts and failure limits are only watched by unishark's own sequential run.
+            self.validate()
+            self.validate_result(result)
+            self._seq_run(self, result)
+        else:
+            self.validate()
+            self.validate_result(result)
+            if concurrency_type == 'asyncio':
+                # Imported here because unishark.aio has Python 3.7+ syntax.
+                from unishark.aio import AsyncioEngine
+                AsyncioEngine(self, concurrency_level, max_workers).run(result, timeout=timeout)
+            elif concurrency_type == 'processes':
+                self._run_in_processes(result, concurrency_level, max_workers, timeout, self.durations)
+            elif concurrency_type == 'distributed':
+                # The same batches as with processes, run by the workers of the executor (e.g. on other hosts).
+                self._run_in_processes(result, concurrency_level, max_workers, timeout, self.durations,
+                                       options.executor)
+            elif concurrency_type == 'fork':
+                deadline = None if timeout is None else time.time() + timeout
+                self._run_forked(self, result, TestSuite.ROOT_LEVEL, concurrency_level, max_workers, deadline)
+            else:
+                # One scheduler with max_workers threads runs the whole suite.
+                # A suite ordered longest first keeps its order: each worker takes its oldest queued work first.
+                scheduler = WorkStealingScheduler(max_workers, resources=self.resource_pool, autoscaler=autoscaler,
+                                                  fifo=self._cost is not None)
+                scheduler.run(partial(self._run, self, result, TestSuite.ROOT_LEVEL, concurrency_level,
+                                      scheduler, scheduler.stop), timeout=timeout)
+                if autoscaler is not None:
+                    log.info('Autoscaled to %d worker(s), at most %d.'
+                             % (scheduler.max_workers, scheduler.peak_workers))
+        if self.stopped:
+            log.warning('Stopped running the tests after %d failed test(s) and fixture(s).'
+                        % self.failure_limit.count)
         return result
 
-    def _run(self, test, result, current_level, concurrency_level, main_executor, timeout):
+    @property
+    def stopped(self):
+        """True if the failure limit is reached, after which no more tests are started."""
+        return self.failure_limit is not None and self.failure_limit.reached
+
+    def _add_failures(self, result, count_before):
+        # Counts the failed tests recorded in result since it had count_before failed tests.
+        if self.failure_limit is not None:
+            self.failure_limit.add(count_failures(result) - count_before)
+
+    def _has_timeouts(self):
+        return self.test_timeout is not None or self.fixture_timeout is not None or self._has_timeout_attrs()
+
+    def _has_timeout_attrs(self):
+        # Returns True if a test class, a test method or a fixture in the suite has a timeout set by unishark.timeout.
+        # The methods are looked up like in _get_test_timeout, so inherited ones and any names are covered.
+        classes = set()
+        if self._span is not None:
+            classes.update(entry.test_class for entry in self._span[0].classes)
+        else:
+            _collect_classes(self, classes)
+        for cls in classes:
+            module = sys.modules.get(cls.__module__)
+            fixtures = [getattr(module, 'setUpModule', None), getattr(module, 'tearDownModule', None),
+                        cls]
+            fixtures.extend(getattr(cls, name, None) for name in dir(cls))
+            if any(hasattr(f, TIMEOUT_ATTR) for f in fixtures if f is not None):
+                return True
+        return False
+
+    def _get_test_timeout(self, test):
+        method = getattr(test.__class__, get_method_name(test), None)
+        timeout = getattr(method, TIMEOUT_ATTR, None)
+        if timeout is None:
+            timeout = getattr(test.__class__, TIMEOUT_ATTR, self.test_timeout)
+        return timeout
+
+    def _get_fixture_timeout(self, fn):
+        return getattr(fn, TIMEOUT_ATTR, self.fixture_timeout)
+
+    def _run_test(self, test, result):
+        count_before = count_failures(result)
+        try:
+            self._run_test_with_timeout(test, result)
+        finally:
+            self._add_failures(result, count_before)
+
+    def _run_test_with_timeout(self, test, result):
+        timeout = self._get_test_timeout(test)
+        if timeout is None:
+            test(result)
+            return
+        if isinstance(test, LazyTestCase):
+            test = test.factory()
+        # The test runs as a copy, so that the test recorded in the result does not refer to the running one.
+        guarded_result = GuardedResult(result)
+        try:
+            call_with_timeout(partial(copy.copy(test), guarded_result), timeout, test.id())
+        except TimeoutExpired:
+            # The test is recorded as an error, and its thread is left behind, so that the worker can go on.
+            if not guarded_result.close():
+                result.startTest(test)
+            result.addError(test, sys.exc_info())
+            result.stopTest(test)
+            if self.stop_on_timeout:
+                raise _TimedOut(True)
+
+    def _run(self, test, result, current_level, concurrency_level, scheduler, callback):
         # test is a test suite instance which must be well-formed.
         # A well-formed test suite has a 4-level self-embedded structure:
         #                                    suite obj(root)
@@ -157,75 +533,369 @@ class TestSuite(UnitTestSuite):
         #               suite obj(mod1.cls1)  suite obj(mod1.cls2)  ...
         #                 /            \                       \
         # case obj(mod1.cls1.mth1)  case obj(mod1.cls1.mth2)  ...
+        # Runs in a worker of the scheduler and calls callback when the test and all its sub-tests are done.
         if current_level == concurrency_level:
             self._seq_run(test, result)
-        elif current_level < concurrency_level:
-            results = result.children  # Divide: for each sub-suite(or test case) in the suite, there is a child result
+            callback()
+            return
+        results = result.children  # Divide: for each sub-suite(or test case) in the suite, there is a child result
+        # Conquer: collect child results into parent result when all the children are done
+        countdown = Countdown(len(test), partial(self._conquer, result, results, callback))
+        if current_level == TestSuite.ROOT_LEVEL:
+            setup_fn, teardown_fn = self._setup_module, self._teardown_module
+        elif current_level == TestSuite.MODULE_LEVEL:
+            setup_fn, teardown_fn = self._setup_class, self._teardown_class
+        else:
+            # The methods are queued lazily as one task source, which idle workers can steal from.
+            entry = self._get_entry(test, current_level)
+            scheduler.spawn(self._hold_resources(partial(self._run_method, entry, t, r, countdown.count_down),
+                                                 t, TestSuite.METHOD_LEVEL)
+                            for t, r in zip(test, results))
+            return
+        # Fixtures are urgent, so that the setups of all the sub-suites are done before running their tests,
+        # like the setups submitted at once by the thread pools before.
+        scheduler.spawn((partial(self._handle_fixtures, setup_fn, teardown_fn, t, r,
+                                 current_level+1, concurrency_level, scheduler, countdown.count_down)
+                         for t, r in zip(test, results)), urgent=True)
+
+    @staticmethod
+    def _conquer(result, results, callback):
+        combine_results(result, results)
+        callback()
+
+    def _handle_fixtures(self, setup_fn, teardown_fn,
+                         test, result, current_level, concurrency_level, scheduler, callback):
+        # setup_fn -> test -> teardown_fn -> callback
+        if self.stopped:
+            callback()
+            return
+        setup_fn(test, result)
+        teardown = partial(scheduler.submit, partial(self._teardown, teardown_fn, test, result, callback), urgent=True)
+        task = partial(self._run, test, result, current_level, concurrency_level, scheduler, teardown)
+        if current_level == concurrency_level:
+            task = self._hold_resources(task, test, current_level)
+        scheduler.submit(task)
+
+    def _hold_resources(self, task, test, level):
+        # Returns the task holding the resources of test while it runs, if the resources are limited.
+        if self.resource_pool is None:
+            return task
+        return ResourceTask(task, self._get_resources(test, level))
+
+    def _get_resources(self, test, level):
+        # Returns the names of the resources of a test case, or of all the test cases in a class or module level suite.
+        if level == TestSuite.METHOD_LEVEL:
+            cases = (test,)
+        else:
+            plan, start, end = self._get_span(test)
+            cases = [arg for op, entry, arg in plan.steps[start:end] if op == RUN]
+        names = set()
+        for case in cases:
+            current_class = case.__class__
+            if current_class not in self._class_resources:
+                module = sys.modules.get(current_class.__module__)
+                class_names = set(getattr(module, RESOURCES_ATTR, ()))
+                class_names.update(getattr(current_class, RESOURCES_ATTR, ()))
+                class_names.update(self._resource_tags.get(get_module_name(case), ()))
+                class_names.update(self._resource_tags.get(get_long_class_name(case), ()))
+                self._class_resources[current_class] = frozenset(class_names)
+            names.update(self._class_resources[current_class])
+            method = getattr(current_class, get_method_name(case), None)
+            names.update(getattr(method, RESOURCES_ATTR, ()))
+            names.update(self._resource_tags.get(get_long_method_name(case), ()))
+        return frozenset(names)
+
+    @staticmethod
+    def _teardown(teardown_fn, test, result, callback):
+        teardown_fn(test, result)
+        callback()
+
+    def _run_in_processes(self, result, concurrency_level, max_workers, timeout, durations=None, executor=None):
+        # Each module (or class) runs with its fixtures in a worker process, and sends back its filled result.
+        # At class level, a class is sent wrapped in a module level suite,
+        # so the module fixtures run in the process as well (once for each class),
+        # unless the durations of previous runs are known to plan batches of classes.
+        # A given executor is shared with other suites, so it is not shut down here.
+        # With timeouts and no executor given, each batch runs in a process of its own (see _run_in_own_processes).
+        timeouts = self.test_timeout, self.fixture_timeout
+        own_executor = executor is None
+        if own_executor and self._has_timeouts():
+            if concurrency_level == TestSuite.MODULE_LEVEL:
+                batches = [[(mod_suite, mod_result.children)] for mod_suite, mod_result in zip(self, result.children)]
+            else:
+                batches = self._get_class_batches(result, max_workers, durations)
+            self._run_in_own_processes(batches, max_workers, timeout)
+            for mod_result in result.children:
+                combine_results(mod_result, mod_result.children)
+            combine_results(result, result.children)
+            return
+        if own_executor:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+        futures = dict()
+        try:
+            if concurrency_level == TestSuite.MODULE_LEVEL:
+                futures = dict((executor.submit(_seq_run_in_process, mod_suite, mod_result, timeouts), [mod_result])
+                               for mod_suite, mod_result in zip(self, result.children))
+            else:
+                batches = self._get_class_batches(result, max_workers, durations)
+                futures = dict((executor.submit(_seq_run_batch_in_process, batch, timeouts),
+                                [r for mod_suite, results in batch for r in results]) for batch in batches)
+            for done in concurrent.futures.as_completed(futures, timeout=timeout):
+                if done.cancelled():
+                    continue
+                for r, returned in zip(futures[done], done.result()):
+                    combine_results(r, [returned])
+                    if self.failure_limit is not None:
+                        self.failure_limit.add(count_failures(returned))
+                if self.stopped:
+                    # The batches running in the worker processes are drained, the queued ones are cancelled.
+                    for future in futures:
+                        future.cancel()
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+            else:
+                # e.g. on timeout, the batches not taken by the workers yet are not left in the shared executor.
+                for future in futures:
+                    future.cancel()
+        if concurrency_level == TestSuite.CLASS_LEVEL:
+            for mod_result in result.children:
+                combine_results(mod_result, mod_result.children)
+        combine_results(result, result.children)
+
+    def _get_class_batches(self, result, max_workers, durations):
+        # Returns the batches of classes like [(module level suite, [class results]), ...] to run in processes.
+        if durations is None:
+            return [[(TestSuite([cls_suite]), [cls_result])]
+                    for mod_suite, mod_result in zip(self, result.children)
+                    for cls_suite, cls_result in zip(mod_suite, mod_result.children)]
+        return self._plan_class_batches(result, max_workers, durations)
+
+    def _run_in_own_processes(self, batches, max_workers, timeout):
+        # Runs each batch in a worker process of its own, at most max_workers at a time.
+        # A test or a fixture timing out stops its batch, and the process is terminated, which also stops the thread
+        # still running the test or the fixture. The rest of the batch is queued first to run in a new process.
+        # A batch is sent with fresh copies of its empty results, so the filled copies can be combined more than once.
+        timeouts = self.test_timeout, self.fixture_timeout
+        deadline = None if timeout is None else time.time() + timeout
+        empty_results = dict((id(r), pickle.dumps(r, pickle.HIGHEST_PROTOCOL))
+                             for batch in batches for mod_suite, results in batch for r in results)
+        queued = collections.deque(batches)
+        running = dict()  # key: connection from a worker process, value: (process, batch)
+        try:
+            while queued or running:
+                while queued and len(running) < max_workers and not self.stopped:
+                    batch = queued.popleft()
+                    copies = [(mod_suite, [pickle.loads(empty_results[id(r)]) for r in results])
+                              for mod_suite, results in batch]
+                    conn, child_conn = multiprocessing.Pipe(False)
+                    process = multiprocessing.Process(target=_run_batch_in_own_process,
+                                                      args=(child_conn, copies, timeouts))
+                    process.daemon = True
+                    process.start()
+                    child_conn.close()
+                    running[conn] = process, batch
+                if not running:
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise concurrent.futures.TimeoutError('Tests are not finished before the timeout.')
+                for conn in _wait_for_connections(list(running), remaining):
+                    process, batch = running.pop(conn)
+                    try:
+                        status, returned = conn.recv()
+                    except EOFError:
+                        status, returned = _ERROR, 'Exited without sending back its results.'
+                    finally:
+                        conn.close()
+                    if status != _RESULT:
+                        process.join()
+                        raise RuntimeError('Worker process %d failed:\n%s' % (process.pid, returned))
+                    filled, position = returned
+                    if position is not None:
+                        process.terminate()
+                    process.join()
+                    for r, r2 in zip([r for mod_suite, results in batch for r in results], filled):
+                        combine_results(r, [r2])
+                        if self.failure_limit is not None:
+                            self.failure_limit.add(count_failures(r2))
+                    if position is not None:
+                        rest = _get_rest_of_batch(batch, position)
+                        if rest:
+                            queued.appendleft(rest)
+        finally:
+            for conn, (process, batch) in running.items():
+                conn.close()
+                process.terminate()
+                process.join()
+
+    def _run_forked(self, test, result, current_level, concurrency_level, max_workers, deadline):
+        # Runs the fixtures above concurrency_level in this process, e.g. setUpModule and setUpClass at method level.
+        # The sub-suites (or test cases) at concurrency_level run in forked worker processes,
+        # which inherit the state set up by the fixtures copy-on-write, and send back their filled results.
+        # The teardowns run in this process once the workers are done.
+        if current_level == concurrency_level - 1:
+            self._fork_workers(test, result, current_level, max_workers, deadline)
+        else:
             if current_level == TestSuite.ROOT_LEVEL:
-                if concurrency_level == TestSuite.MODULE_LEVEL:
-                    self._handle_fixtures(main_executor, self._setup_module, self._teardown_module,
-                                          test, results, current_level, concurrency_level, main_executor, timeout)
-                else:
-                    with concurrent.futures.ThreadPoolExecutor(len(test)) as executor:
-                        self._handle_fixtures(executor, self._setup_module, self._teardown_module,
-                                              test, results, current_level, concurrency_level, main_executor, timeout)
-            elif current_level == TestSuite.MODULE_LEVEL:
-                if concurrency_level == TestSuite.CLASS_LEVEL:
-                    self._handle_fixtures(main_executor, self._setup_class, self._teardown_class,
-                                          test, results, current_level, concurrency_level, main_executor, timeout)
-                else:
-                    with concurrent.futures.ThreadPoolExecutor(len(test)) as executor:
-                        self._handle_fixtures(executor, self._setup_class, self._teardown_class,
-                                              test, results, current_level, concurrency_level, main_executor, timeout)
-            elif current_level == TestSuite.CLASS_LEVEL:
-                futures = [
-                    main_executor.submit(self._run, t, r, current_level+1, concurrency_level, main_executor, timeout)
-                    for t, r in zip(test, results)
-                ]
-                concurrent.futures.wait(futures, timeout=timeout)
-            combine_results(result, results)  # Conquer: collect child results into parent result
-        return test, result
+                setup_fn, teardown_fn = self._setup_module, self._teardown_module
+            else:
+                setup_fn, teardown_fn = self._setup_class, self._teardown_class
+            for t, r in zip(test, result.children):
+                if self.stopped:
+                    break
+                setup_fn(t, r)
+                if self._get_entry(t, current_level + 1).setup_key not in self._failed_fixtures:
+                    self._run_forked(t, r, current_level + 1, concurrency_level, max_workers, deadline)
+                teardown_fn(t, r)
+        combine_results(result, result.children)
 
-    def _seq_run(self, test, result):
-        level = _get_level(test)
-        if level == TestSuite.ROOT_LEVEL:
-            for t in test:
-                self._seq_run(t, result)
-        elif level == TestSuite.MODULE_LEVEL:
-            self._setup_module(test, result)
-            for t in test:
-                self._seq_run(t, result)
-            self._teardown_module(test, result)
-        elif level == TestSuite.CLASS_LEVEL:
-            self._setup_class(test, result)
-            for t in test:
-                self._seq_run(t, result)
-            self._teardown_class(test, result)
-        elif level == TestSuite.METHOD_LEVEL:
-            current_class = test.__class__
-            current_module = current_class.__module__
-            if current_module + '.setUpModule' in self._failed_fixtures:
-                return
-            if '.'.join((current_module, current_class.__name__, 'setUpClass')) in self._failed_fixtures:
-                return
-            test(result)
+    def _fork_workers(self, test, result, current_level, max_workers, deadline):
+        # Forks up to max_workers processes, each running its share of the sub-suites (or test cases) of test.
+        items = list(zip(test, result.children))
+        if current_level == TestSuite.CLASS_LEVEL:
+            run = partial(self._run_method, self._get_entry(test, current_level))
         else:
-            raise NotImplementedError
+            run = self._seq_run
+        if threading.active_count() > 1:
+            # A forked process only has the thread calling fork: a lock held by another thread stays locked in it.
+            # Such a thread (e.g. left by a timed out test or fixture) is only known while running,
+            # so the sub-suites are run in this process rather than failing the run.
+            log.warning('Running %d test(s) or suite(s) without forking, since %d threads are running.'
+                        % (len(items), threading.active_count()))
+            for t, r in items:
+                if self.stopped:
+                    break
+                run(t, r)
+            return
+        count = min(max_workers, len(items))
+        if self.durations is None:
+            shares = [items[k::count] for k in range(count)]
+        else:
+            shares = self._plan_shares(items, count)
+        workers = dict()  # key: read end of the pipe from a worker, value: (pid, share, received chunks)
+        pending = set()
+        try:
+            for share in shares:
+                if self.stopped:
+                    break
+                read_fd, write_fd = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(read_fd)
+                    _run_in_forked_worker(write_fd, run, share)
+                os.close(write_fd)
+                workers[read_fd] = pid, share, []
+                pending.add(read_fd)
+            while pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise concurrent.futures.TimeoutError('Tests are not finished before the timeout.')
+                readable = select.select(list(pending), [], [], remaining)[0]
+                for fd in readable:
+                    chunk = os.read(fd, 65536)
+                    if chunk:
+                        workers[fd][2].append(chunk)
+                    else:
+                        pending.remove(fd)
+        finally:
+            for fd, (pid, share, chunks) in workers.items():
+                os.close(fd)
+                if fd in pending:
+                    os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+        for pid, share, chunks in workers.values():
+            if not chunks:
+                raise RuntimeError('Forked worker %d exited without sending back its results.' % pid)
+            status, returned = pickle.loads(b''.join(chunks))
+            if status != _RESULT:
+                raise RuntimeError('Forked worker %d failed:\n%s' % (pid, returned))
+            for (t, r), r2 in zip(share, returned):
+                combine_results(r, [r2])
+                if self.failure_limit is not None:
+                    self.failure_limit.add(count_failures(r2))
+
+    def _plan_shares(self, items, count):
+        # Splits (test, result) items into count shares of about the same estimated duration:
+        # each item, longest first, goes to the share with the least work so far.
+        costs = [(t._cost if _is_suite(t) and t._cost is not None else self._estimate(t), i)
+                 for i, (t, r) in enumerate(items)]
+        costs.sort(key=lambda c: (-c[0], c[1]))
+        loads = [0.0] * count
+        shares = [[] for _ in range(count)]
+        for cost, i in costs:
+            k = loads.index(min(loads))
+            loads[k] += cost
+            shares[k].append(items[i])
+        return shares
+
+    def _estimate(self, test):
+        # Returns the estimated duration of a test case, or of all the test cases in a suite.
+        if _is_suite(test):
+            return sum(self._estimate(t) for t in test)
+        return self.durations.get_test_duration(get_full_method_name(test))
+
+    def _plan_class_batches(self, result, max_workers, durations):
+        # Packs the classes into at most max_workers batches, one for each process, longest class first.
+        # A batch runs the module fixtures once for all its classes of the module.
+        # A class goes to the batch finishing it earliest, where the module fixtures a batch has to run again count
+        # twice: in the finish time of the batch, and as the fixture time added to the whole run.
+        # Returns a list of batches like [(module level suite, [class results]), ...].
+        units = []
+        for i, (mod_suite, mod_result) in enumerate(zip(self, result.children)):
+            mod_entry = self._get_entry(mod_suite, TestSuite.MODULE_LEVEL)
+            fixtures = [self._get_module_fixture(mod_entry, attr) for attr in ('setUpModule', 'tearDownModule')]
+            mod_cost = sum(durations.get_fixture_duration(f[0]) for f in fixtures if f is not None)
+            for j, (cls_suite, cls_result) in enumerate(zip(mod_suite, mod_result.children)):
+                cls_entry = self._get_entry(cls_suite, TestSuite.CLASS_LEVEL, mod_entry)
+                fixtures = [self._get_class_fixture(cls_entry, attr) for attr in ('setUpClass', 'tearDownClass')]
+                cost = sum(durations.get_fixture_duration(f[0]) for f in fixtures if f is not None)
+                cost += sum(durations.get_test_duration(get_full_method_name(case)) for case in cls_suite)
+                units.append((cost, mod_cost, (i, j), cls_suite, cls_result))
+        units.sort(key=lambda unit: (-unit[0], unit[2]))
+        loads = [0.0] * min(max_workers, len(units))
+        plans = [dict() for _ in loads]  # key: module index, value: a list of (class index, class suite, result)
+        for cost, mod_cost, (i, j), cls_suite, cls_result in units:
+            def finish(k):
+                return loads[k] + cost + (0.0 if i in plans[k] else mod_cost)
+
+            k = min(range(len(loads)), key=lambda b: (finish(b) + (0.0 if i in plans[b] else mod_cost), b))
+            loads[k] = finish(k)
+            plans[k].setdefault(i, []).append((j, cls_suite, cls_result))
+        batches = []
+        for plan in plans:
+            batch = []
+            for i in sorted(plan):
+                classes = sorted(plan[i], key=lambda c: c[0])
+                batch.append((TestSuite([c[1] for c in classes]), [c[2] for c in classes]))
+            if batch:
+                batches.append(batch)
+        return batches
 
-    def _handle_fixtures(self, executor, setup_fn, teardown_fn,
-                         test, results, current_level, concurrency_level, main_executor, timeout):
-        futures_of_setup = [executor.submit(setup_fn, t, r) for t, r in zip(test, results)]
-        futures = []
-        for done in concurrent.futures.as_completed(futures_of_setup, timeout=timeout):
-            t, r = done.result()
-            futures.append(
-                executor.submit(self._run, t, r, current_level+1, concurrency_level, main_executor, timeout)
-            )
-        futures_of_teardown = []
-        for done in concurrent.futures.as_completed(futures, timeout=timeout):
-            t, r = done.result()
-            futures_of_teardown.append(executor.submit(teardown_fn, t, r))
-        concurrent.futures.wait(futures_of_teardown, timeout=timeout)
+    def _seq_run(self, test, result):
+        # Runs the steps of a well-formed suite (at any level) in its execution plan.
+        plan, index, end = self._get_span(test)
+        steps = plan.steps
+        while index < end:
+            op, entry, arg = steps[index]
+            if op == RUN:
+                self._run_method(entry, arg, result)
+            elif op == SETUP:
+                if self.stopped:
+                    # Neither the tests nor the teardown run without the setup.
+                    index = arg + 1
+                    continue
+                self._call_fixture(result, self._get_fixture(entry, entry.setup_attr))
+            else:
+                self._call_fixture(result, self._get_fixture(entry, entry.teardown_attr))
+            index += 1
+
+    def _run_method(self, entry, test, result, callback=None):
+        # entry is the class entry of the test case.
+        if not self.stopped and not self._is_blocked(entry):
+            self._run_test(test, result)
+        if callback is not None:
+            callback()
 
     def _addClassOrModuleLevelException(self, result, exception, error_name):
         error = FixtureErrors(error_name)
@@ -237,110 +907,231 @@ class TestSuite(UnitTestSuite):
 
     def _setup_module(self, test, result):
         # test must be a module level suite
-        current_module = _get_current_module(test)
-        fixture_name = current_module + '.setUpModule'
-        if fixture_name in self._successful_fixtures or fixture_name in self._failed_fixtures:
-            return test, result
-
-        try:
-            module = sys.modules[current_module]
-        except KeyError:
-            return test, result
-        setUpModule = getattr(module, 'setUpModule', None)
-        if setUpModule is not None:
-            _call_if_exists(result, '_setupStdout')
-            try:
-                setUpModule()
-                self._successful_fixtures.add(fixture_name)
-            except Exception as e:
-                self._failed_fixtures.add(fixture_name)
-                error_name = '%s:setUpModule' % current_module
-                self._addClassOrModuleLevelException(result, e, error_name)
-            finally:
-                _call_if_exists(result, '_restoreStdout')
+        self._call_fixture(result, self._get_module_fixture(self._get_entry(test, TestSuite.MODULE_LEVEL),
+                                                            'setUpModule'))
         return test, result
 
     def _teardown_module(self, test, result):
         # test must be a module level suite
-        current_module = _get_current_module(test)
-        fixture_name = current_module + '.tearDownModule'
-        if fixture_name in self._successful_fixtures or fixture_name in self._failed_fixtures:
-            return
-        if current_module + '.setUpModule' in self._failed_fixtures:
-            return
-
-        try:
-            module = sys.modules[current_module]
-        except KeyError:
-            return
-        tearDownModule = getattr(module, 'tearDownModule', None)
-        if tearDownModule is not None:
-            _call_if_exists(result, '_setupStdout')
-            try:
-                tearDownModule()
-                self._successful_fixtures.add(fixture_name)
-            except Exception as e:
-                self._failed_fixtures.add(fixture_name)
-                error_name = '%s:tearDownModule' % current_module
-                self._addClassOrModuleLevelException(result, e, error_name)
-            finally:
-                _call_if_exists(result, '_restoreStdout')
+        self._call_fixture(result, self._get_module_fixture(self._get_entry(test, TestSuite.MODULE_LEVEL),
+                                                            'tearDownModule'))
 
     def _setup_class(self, test, result):
         # test must be a class level suite
-        current_class = _get_current_class(test)
-        current_module = current_class.__module__
-        class_name = '.'.join((current_module, current_class.__name__))
-        fixture_name = class_name + '.setUpClass'
-        if fixture_name in self._successful_fixtures or fixture_name in self._failed_fixtures:
-            return test, result
-        if current_module + '.setUpModule' in self._failed_fixtures:
-            return test, result
-        if getattr(current_class, '__unittest_skip__', False):
-            return test, result
-
-        setUpClass = getattr(current_class, 'setUpClass', None)
-        if setUpClass is not None:
-            _call_if_exists(result, '_setupStdout')
-            try:
-                setUpClass()
-                self._successful_fixtures.add(fixture_name)
-            except Exception as e:
-                self._failed_fixtures.add(fixture_name)
-                current_class._classSetupFailed = True
-                error_name = '%s:%s:setUpClass' % (current_module, current_class.__name__)
-                self._addClassOrModuleLevelException(result, e, error_name)
-            finally:
-                _call_if_exists(result, '_restoreStdout')
+        self._call_fixture(result, self._get_class_fixture(self._get_entry(test, TestSuite.CLASS_LEVEL),
+                                                           'setUpClass'))
         return test, result
 
     def _teardown_class(self, test, result):
         # test must be a class level suite
-        current_class = _get_current_class(test)
-        current_module = current_class.__module__
-        class_name = '.'.join((current_module, current_class.__name__))
-        fixture_name = class_name + '.tearDownClass'
+        self._call_fixture(result, self._get_class_fixture(self._get_entry(test, TestSuite.CLASS_LEVEL),
+                                                           'tearDownClass'))
+
+    def _get_fixture(self, entry, attr):
+        if isinstance(entry, ClassEntry):
+            return self._get_class_fixture(entry, attr)
+        return self._get_module_fixture(entry, attr)
+
+    def _get_module_fixture(self, entry, attr):
+        # Returns (fixture name, fixture function, error name, class) of a module fixture which should run,
+        # or None. entry is the module entry.
+        fixture_name = entry.get_key(attr)
         if fixture_name in self._successful_fixtures or fixture_name in self._failed_fixtures:
+            return None
+        if attr == 'tearDownModule' and entry.setup_key in self._failed_fixtures:
+            return None
+
+        try:
+            module = sys.modules[entry.name]
+        except KeyError:
+            return None
+        fixture = getattr(module, attr, None)
+        if fixture is None:
+            return None
+        return fixture_name, fixture, entry.get_error_name(attr), None
+
+    def _get_class_fixture(self, entry, attr):
+        # Returns (fixture name, fixture function, error name, class) of a class fixture which should run,
+        # or None. entry is the class entry.
+        fixture_name = entry.get_key(attr)
+        if fixture_name in self._successful_fixtures or fixture_name in self._failed_fixtures:
+            return None
+        if attr == 'tearDownClass' and entry.setup_key in self._failed_fixtures:
+            return None
+        if entry.module.setup_key in self._failed_fixtures:
+            return None
+        current_class = entry.test_class
+        if getattr(current_class, '__unittest_skip__', False):
+            return None
+
+        fixture = getattr(current_class, attr, None)
+        if fixture is None:
+            return None
+        return fixture_name, fixture, entry.get_error_name(attr), current_class
+
+    def _hold_module_fixture(self, fixture):
+        # Returns True if the module fixture is not called now, because the module is kept set up.
+        fixture_name, fn, error_name, current_class = fixture
+        if self.warm_fixtures is None or current_class is not None:
+            return False
+        module_name, attr = fixture_name.rsplit('.', 1)
+        if attr == 'setUpModule':
+            if not self.warm_fixtures.is_set_up(module_name):
+                return False
+            self._successful_fixtures.add(fixture_name)
+        else:
+            self.warm_fixtures.keep(module_name, fn)
+        return True
+
+    def _call_fixture(self, result, fixture):
+        if fixture is None or self._hold_module_fixture(fixture):
             return
-        if class_name + '.setUpClass' in self._failed_fixtures:
-            return
-        if current_module + '.setUpModule' in self._failed_fixtures:
-            return
-        if getattr(current_class, "__unittest_skip__", False):
-            return
+        fixture_name, fn, error_name, current_class = fixture
+        _call_if_exists(result, '_setupStdout')
+        start_time = time.time()
+        timeout = self._get_fixture_timeout(fn)
+        timed_out = False
+        try:
+            if timeout is None:
+                fn()
+            else:
+                call_with_timeout(fn, timeout, fixture_name)
+            self._add_successful_fixture(fixture)
+        except Exception as e:
+            timed_out = isinstance(e, TimeoutExpired)
+            self._fail_fixture(result, e, fixture)
+        finally:
+            result.fixture_durations[fixture_name] = time.time() - start_time
+            _call_if_exists(result, '_restoreStdout')
+        if timed_out and self.stop_on_timeout:
+            raise _TimedOut(False)
+
+    def _add_successful_fixture(self, fixture):
+        fixture_name, fn, error_name, current_class = fixture
+        self._successful_fixtures.add(fixture_name)
+        if self.warm_fixtures is not None and current_class is None and fixture_name.endswith('.setUpModule'):
+            self.warm_fixtures.keep(fixture_name.rsplit('.', 1)[0])
+
+    def _fail_fixture(self, result, exception, fixture):
+        # Must be called in the except block handling the exception raised by the fixture.
+        fixture_name, fn, error_name, current_class = fixture
+        self._failed_fixtures.add(fixture_name)
+        if current_class is not None and fixture_name.endswith('.setUpClass'):
+            current_class._classSetupFailed = True
+        self._addClassOrModuleLevelException(result, exception, error_name)
+        if self.failure_limit is not None and not isinstance(exception, SkipTest):
+            self.failure_limit.add(1)
+
+    def _is_blocked(self, entry):
+        # entry is the class entry of a test case. Returns True if the setUpModule or setUpClass it depends on failed.
+        return entry.module.setup_key in self._failed_fixtures or entry.setup_key in self._failed_fixtures
+
+
+def _make_process_suite(timeouts):
+    suite = TestSuite()
+    suite.test_timeout, suite.fixture_timeout = timeouts
+    return suite
+
+
+def _seq_run_in_process(test, result, timeouts):
+    # test is a module level suite and result is its (empty) result, both unpickled in a worker process.
+    _make_process_suite(timeouts)._seq_run(test, result)
+    return [result]
+
+
+def _seq_run_batch_in_process(batch, timeouts):
+    # batch is like [(module level suite, [results of its classes]), ...], unpickled in a worker process.
+    # The module fixtures run once for the classes, recorded in the results of the first and the last class.
+    suite = _make_process_suite(timeouts)
+    returned = []
+    for mod_suite, results in batch:
+        suite._setup_module(mod_suite, results[0])
+        for cls_suite, cls_result in zip(mod_suite, results):
+            suite._seq_run(cls_suite, cls_result)
+        suite._teardown_module(mod_suite, results[-1])
+        returned.extend(results)
+    return returned
+
+
+def _run_batch_in_own_process(conn, batch, timeouts):
+    # Runs a batch like _seq_run_batch_in_process in a worker process of its own, and sends back
+    # (_RESULT, (results, position)). After a test or a fixture times out, the batch stops, and position is
+    # (module index, class index, test index) where the rest of the batch starts. Otherwise position is None.
+    suite = _make_process_suite(timeouts)
+    suite.stop_on_timeout = True
+    try:
+        position = None
+        i, j = 0, None
+        try:
+            for i, (mod_suite, results) in enumerate(batch):
+                j = None
+                suite._setup_module(mod_suite, results[0])
+                for j, (cls_suite, cls_result) in enumerate(zip(mod_suite, results)):
+                    suite._seq_run(cls_suite, cls_result)
+                j = None
+                suite._teardown_module(mod_suite, results[-1])
+        except _TimedOut as e:
+            if j is None:
+                position = i + 1, 0, 0
+            elif e.in_test:
+                # The tests run in order, and the one timed out is started.
+                position = i, j, batch[i][1][j].testsRun
+            else:
+                position = i, j + 1, 0
+        message = _RESULT, ([r for mod_suite, results in batch for r in results], position)
+    except BaseException:
+        message = _ERROR, traceback.format_exc()
+    conn.send(message)
+    conn.close()
+
+
+def _get_rest_of_batch(batch, position):
+    # Returns the part of a batch from position on (see _run_batch_in_own_process), leaving out empty classes.
+    i, j, k = position
+    if i >= len(batch):
+        return []
+    mod_suite, results = batch[i]
+    classes = []
+    class_results = []
+    for n, (cls_suite, cls_result) in enumerate(list(zip(mod_suite, results))[j:]):
+        if n == 0 and k > 0:
+            cls_suite = TestSuite(list(cls_suite)[k:])
+        if len(cls_suite) > 0:
+            classes.append(cls_suite)
+            class_results.append(cls_result)
+    rest = [(TestSuite(classes), class_results)] if classes else []
+    return rest + batch[i + 1:]
+
+
+def _wait_for_connections(conns, timeout):
+    # Returns the connections ready to be read. multiprocessing.connection.wait is not in Python 2.
+    wait = getattr(multiprocessing.connection, 'wait', None)
+    if wait is not None:
+        return wait(conns, timeout)
+    return select.select(conns, [], [], timeout)[0]
 
-        tearDownClass = getattr(current_class, 'tearDownClass', None)
-        if tearDownClass is not None:
-            _call_if_exists(result, '_setupStdout')
-            try:
-                tearDownClass()
-                self._successful_fixtures.add(fixture_name)
-            except Exception as e:
-                self._failed_fixtures.add(fixture_name)
-                error_name = '%s:%s:tearDownClass' % (current_module, current_class.__name__)
-                self._addClassOrModuleLevelException(result, e, error_name)
-            finally:
-                _call_if_exists(result, '_restoreStdout')
+
+def _run_in_forked_worker(write_fd, run, share):
+    # Runs in a forked worker process: calls run(test, result) for each (test, result) in share,
+    # sends back the filled results through the pipe, and exits without running the exit handlers of the parent.
+    status = 0
+    try:
+        try:
+            for t, r in share:
+                run(t, r)
+            data = pickle.dumps((_RESULT, [r for t, r in share]), pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            status = 1
+            data = pickle.dumps((_ERROR, traceback.format_exc()), pickle.HIGHEST_PROTOCOL)
+        with os.fdopen(write_fd, 'wb') as f:
+            f.write(data)
+    finally:
+        # os._exit does not flush the buffered output of the tests.
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
 
 
 class FixtureErrors(_ErrorHolder):
@@ -41,9 +41,10 @@ def get_interpreter():
 
 
 def get_module_name(obj):
-    name = type(obj).__module__.split('.')[-1]
+    # obj.__class__ rather than type(obj), so that lazy test case handles are named after their test classes
+    name = obj.__class__.__module__.split('.')[-1]
     if name == '__main__':
-        name = inspect.getsourcefile(type(obj)).split(sep)[-1].rstrip('.py')
+        name = inspect.getsourcefile(obj.__class__).split(sep)[-1].rstrip('.py')
     return name
 
 
@@ -55,12 +56,17 @@ def get_long_method_name(obj):
     return '.'.join((get_long_class_name(obj), get_method_name(obj)))
 
 
+def get_full_method_name(obj):
+    # Unlike the long method name, it includes the package, e.g. package.module.class.method
+    return '.'.join((obj.__class__.__module__, get_class_name(obj), get_method_name(obj)))
+
+
 def get_method_name(obj):
     return obj.id().split('.')[-1]
 
 
 def get_class_name(obj):
-    return type(obj).__name__
+    return obj.__class__.__name__
 
 
 def _is_relevant_tb_level(tb):
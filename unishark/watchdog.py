@@ -0,0 +1,91 @@
+# Copyright 2015 Twitter, Inc and other contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import sys
+import threading
+import traceback
+import logging
+from unishark.exception import TimeoutExpired
+
+log = logging.getLogger(__name__)
+
+# The attribute set by unishark.timeout on test methods, test classes and fixtures.
+TIMEOUT_ATTR = '__unishark_timeout__'
+
+# The methods a test case calls to record its result, which are dropped after the test times out.
+_RECORDING_METHODS = frozenset(['startTest', 'stopTest', 'addSuccess', 'addError', 'addFailure', 'addSkip',
+                                'addExpectedFailure', 'addUnexpectedSuccess', 'addSubTest'])
+
+
+def get_stack(thread):
+    frame = sys._current_frames().get(thread.ident)
+    return ''.join(traceback.format_stack(frame)) if frame is not None else ''
+
+
+def call_with_timeout(fn, timeout, name):
+    """
+    Calls fn in a new daemon thread and waits for it at most timeout seconds. Re-raises the exception raised by fn.
+    If fn is not finished in time, raises TimeoutExpired with the current stack of the thread,
+    and the thread is left running, since a thread cannot be killed.
+    """
+    exc_info = []
+
+    def target():
+        try:
+            fn()
+        except BaseException:
+            exc_info.extend(sys.exc_info())
+
+    thread = threading.Thread(target=target, name='unishark-timeout-%s' % name)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        log.warning('%s is not finished in %r seconds, leaving its thread %r.' % (name, timeout, thread.name))
+        raise TimeoutExpired(name, timeout, get_stack(thread))
+    if exc_info:
+        raise exc_info[1]
+
+
+class GuardedResult(object):
+    """
+    A proxy of a test result which stops recording the result of a test once closed,
+    so that a test finishing after it timed out cannot record a second result.
+    """
+    def __init__(self, result):
+        self._result = result
+        self._lock = threading.Lock()
+        self._closed = False
+        self.started = False
+
+    def close(self):
+        """Returns True if the test has started, i.e. called startTest."""
+        with self._lock:
+            self._closed = True
+            return self.started
+
+    def __getattr__(self, name):
+        attr = getattr(self._result, name)
+        if name not in _RECORDING_METHODS:
+            return attr
+
+        def record(*args, **kwargs):
+            with self._lock:
+                if self._closed:
+                    return None
+                if name == 'startTest':
+                    self.started = True
+                return attr(*args, **kwargs)
+        return record